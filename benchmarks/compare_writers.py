@@ -0,0 +1,75 @@
+"""So sánh thời gian/dung lượng file giữa 2 engine của write_preserving_formulas_and_styles.
+
+Chạy: python benchmarks/compare_writers.py --rows 20000 --columns 100
+Script tự sinh template (11 dòng pre-header + header + công thức) trong thư mục tạm, không cần dữ liệu thật.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+SHEET = "Masterdata_PSteam"
+SKIP = 11
+
+
+def build_template(path, num_columns):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = SHEET
+    thin = Side(style="thin")
+    headers = ["EID", "SSO"] + [f"COL {i}" for i in range(num_columns - 3)] + ["SUBTOTAL"]
+    for row in range(1, SKIP + 1):
+        for col in range(1, num_columns + 1):
+            cell = ws.cell(row=row, column=col, value=f"note {row}" if col == 1 else None)
+            cell.font = Font(bold=row == 1, italic=row % 2 == 0)
+            cell.fill = PatternFill("solid", fgColor="DDEBF7" if row % 2 else "FFFFFF")
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=SKIP + 1, column=col, value=header)
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill("solid", fgColor="FFFF00")
+        cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        cell.alignment = Alignment(horizontal="center", wrap_text=True)
+    ws.cell(row=SKIP + 2, column=len(headers), value=f"=SUM(C{SKIP + 2}:E{SKIP + 2})")
+    wb.save(path)
+    return headers, ["SUBTOTAL"]
+
+
+def build_frame(headers, num_rows):
+    data = {"EID": range(1, num_rows + 1), "SSO": [f"hr_{i % 50}" for i in range(num_rows)]}
+    for i, header in enumerate(headers[2:-1]):
+        data[header] = [i * r for r in range(num_rows)] if i % 2 else [f"text {r}" for r in range(num_rows)]
+    return pd.DataFrame(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--columns", type=int, default=100)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="writer_bench_")
+    template = os.path.join(workdir, "workday_data.xlsx")
+    headers, formula_columns = build_template(template, args.columns)
+    df = build_frame(headers, args.rows)
+
+    # logic nạp template theo thư mục hiện tại
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from logic import write_preserving_formulas_and_styles
+
+    print(f"rows={args.rows} columns={args.columns}")
+    for engine in ("openpyxl", "xml"):
+        out = os.path.join(workdir, f"out_{engine}.xlsx")
+        start = time.perf_counter()
+        write_preserving_formulas_and_styles(template, out, df, SHEET, SKIP, formula_columns, engine=engine)
+        elapsed = time.perf_counter() - start
+        print(f"{engine:>9}: {elapsed:8.2f}s  {os.path.getsize(out) / 1024:10.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
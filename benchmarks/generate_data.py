@@ -0,0 +1,215 @@
+"""Sinh dữ liệu HR giả lập để benchmark (chạy offline, không cần dữ liệu thật).
+
+Tạo trong thư mục đích:
+- workday_data.xlsx: template 11 dòng pre-header, header tiếng Việt lấy từ config.yaml,
+  các cột keep_format_columns có công thức ở dòng dữ liệu đầu tiên.
+- master_data.xlsx: master theo đúng layout template.
+- hr_files/HR_<sso>.xlsx: file của từng HR owner, một phần EID trùng master (cập nhật), phần còn lại là EID mới.
+
+Chạy: python benchmarks/generate_data.py --out /tmp/hr_bench --scale small
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+
+import pandas as pd
+import yaml
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_FILE = os.path.join(REPO_ROOT, "config.yaml")
+
+SHEET_MASTER = "Masterdata_PSteam"
+SKIP_MASTER = 11
+keep_format_columns = [
+    "SENIORITY", "PROBATION CONTRACT NO", "FROM", "TO", "DEFINITE CONTRACT 1 NO", "FROM", "TO",
+    "DEFINITE CONTRACT 2 NO", "FROM", "TO", "IN-DEFINITE CONTRACT  NO", "FROM",
+    "END EMPLOYMENT DATE", "BASE SALARY", "COMPLEXCITY ALLOWANCE", "POSITION ALLOWANCE", "Language allowance",
+    "Total amount contribute SHUI", "MEAL ALLOWANCE", "SUBTOTAL", "SHUI FROM", "SHUI TO"
+]
+
+# (số file HR, số dòng mỗi file, số dòng master)
+SCALES = {
+    "tiny": (5, 20, 200),
+    "small": (20, 50, 2000),
+    "medium": (100, 100, 20000),
+    "large": (300, 150, 60000),
+}
+
+LAST_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng"]
+MIDDLE_NAMES = ["Văn", "Thị", "Minh", "Thanh", "Ngọc", "Hữu", "Đức", "Thu"]
+FIRST_NAMES = ["An", "Bình", "Châu", "Dũng", "Hà", "Hải", "Lan", "Linh", "Nam", "Phương", "Quân", "Trang"]
+CATEGORIES = {
+    "GENDER": ["Nam", "Nữ"],
+    "MARITAL STATUS": ["Single", "Married", "Divorced"],
+    "BANK NAME": ["Vietcombank", "Techcombank", "ACB", "BIDV", "VPBank"],
+    "PROJECT": ["Telco", "Banking", "Retail", "Travel", "Insurance"],
+    "EDUCATION": ["High school", "College", "Bachelor", "Master"],
+    "ETHNIC": ["Kinh", "Tày", "Hoa", "Khmer"],
+    "NATIONALITY": ["Vietnam"],
+    "CAREER LEVEL": ["1", "2", "3", "4"],
+    "MSA Client": ["Client A", "Client B", "Client C"],
+}
+MONEY_COLUMNS = {"BASE SALARY", "COMPLEXCITY ALLOWANCE", "POSITION ALLOWANCE", "MEAL ALLOWANCE", "Language allowance"}
+DATE_COLUMNS = {"DOJ", "DOB", "ISSUED DATE", "DOB chủ hộ"}
+
+
+def load_config(path=CONFIG_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def template_headers(config):
+    """EID, SSO, các cột đích trong column_mapping (trừ cột công thức), rồi khối hợp đồng/lương theo keep_format_columns."""
+    headers = ["EID", "SSO"]
+    for dst in config["column_mapping"].values():
+        dst = str(dst).strip()
+        if dst not in headers and dst not in keep_format_columns:
+            headers.append(dst)
+    return headers + keep_format_columns
+
+
+def _formula(header, letters, row):
+    if header == "SENIORITY":
+        return f'=IF({letters["DOJ"]}{row}="","",DATEDIF({letters["DOJ"]}{row},TODAY(),"m"))'
+    if header == "SUBTOTAL":
+        return f'=SUM({letters["BASE SALARY"]}{row}:{letters["MEAL ALLOWANCE"]}{row})'
+    if header == "Total amount contribute SHUI":
+        return f'={letters["BASE SALARY"]}{row}+{letters["POSITION ALLOWANCE"]}{row}'
+    if header in MONEY_COLUMNS:
+        return f'=ROUND({letters["BASE SALARY"]}{row}*0,0)' if header != "BASE SALARY" else None
+    if header in ("FROM", "TO", "SHUI FROM", "SHUI TO", "END EMPLOYMENT DATE"):
+        return f'=IF({letters["DOJ"]}{row}="","",{letters["DOJ"]}{row})'
+    if header.endswith("NO"):
+        return f'="C-"&{letters["EID"]}{row}'
+    return None
+
+
+def build_template(path, headers):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = SHEET_MASTER
+    thin = Side(style="thin")
+    for row in range(1, SKIP_MASTER + 1):
+        for col in range(1, len(headers) + 1):
+            cell = ws.cell(row=row, column=col, value=f"Ghi chú {row}" if col == 1 else None)
+            cell.font = Font(bold=row == 1, italic=row % 2 == 0)
+            cell.fill = PatternFill("solid", fgColor="DDEBF7" if row % 2 else "FFF2CC")
+    letters = {}
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=SKIP_MASTER + 1, column=col, value=header)
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill("solid", fgColor="FFFF00")
+        cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        cell.alignment = Alignment(horizontal="center", wrap_text=True)
+        letters.setdefault(header, cell.column_letter)
+    data_row = SKIP_MASTER + 2
+    for col, header in enumerate(headers, 1):
+        formula = _formula(header, letters, data_row)
+        if formula:
+            ws.cell(row=data_row, column=col, value=formula)
+    wb.save(path)
+
+
+def _value(rng, header, eid):
+    if header == "EID":
+        return eid
+    if header in CATEGORIES:
+        return rng.choice(CATEGORIES[header])
+    if header in DATE_COLUMNS:
+        return datetime.datetime(1975, 1, 1) + datetime.timedelta(days=rng.randrange(0, 365 * 45))
+    if header == "BASE SALARY":
+        return rng.randrange(5_000_000, 40_000_000, 50_000)
+    if header in ("ID CARD", "OLD ID CARD NO.", "SOCIAL INSURANCE NUMBER", "PERSONAL TAX CODE", "BANK ACCOUNT"):
+        return f"{rng.randrange(10 ** 11):012d}"
+    if "NAME" in header or header in ("SUPERVISOR", "Họ tên chủ hộ"):
+        return f"{rng.choice(LAST_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(FIRST_NAMES)}"
+    if "EMAIL" in header:
+        return f"user{eid}@example.com"
+    if "PHONE" in header or header == "EMERGENCY CONTACT":
+        return f"09{rng.randrange(10 ** 8):08d}"
+    if "ADDRESS" in header or header in ("BIRTH PLACE", "ISSUED PLACE"):
+        return f"{rng.randrange(1, 500)} Đường số {rng.randrange(1, 50)}, Quận {rng.randrange(1, 12)}, TP.HCM"
+    return f"{header[:6]} {rng.randrange(1000)}"
+
+
+def build_frame(rng, headers, eids, sso):
+    """DataFrame theo layout đọc lại bằng pd.read_excel(skiprows=11) (header trùng tên được đánh số .1, .2)."""
+    columns = []
+    seen = {}
+    for header in headers:
+        n = seen.get(header, 0)
+        seen[header] = n + 1
+        columns.append(header if n == 0 else f"{header}.{n}")
+    data = {}
+    for header, column in zip(headers, columns):
+        if header in keep_format_columns and header != "BASE SALARY":
+            continue
+        data[column] = [_value(rng, header, eid) for eid in eids]
+    data["SSO"] = [sso] * len(eids)
+    if sso is not None and len(eids) > 3:
+        # Vài dòng thiếu SSO để bước chuẩn hóa có việc làm
+        for i in range(0, len(eids), max(1, len(eids) // 3)):
+            data["SSO"][i] = None
+    return pd.DataFrame(data)
+
+
+def generate(out_dir, scale="small", seed=42):
+    """Sinh bộ dữ liệu; trả về dict đường dẫn + tham số."""
+    n_files, rows_per_file, master_rows = SCALES[scale]
+    rng = random.Random(seed)
+    config = load_config()
+    headers = template_headers(config)
+
+    sys.path.insert(0, REPO_ROOT)
+    from logic import write_preserving_formulas_and_styles
+
+    os.makedirs(os.path.join(out_dir, "hr_files"), exist_ok=True)
+    template_file = os.path.join(out_dir, "workday_data.xlsx")
+    master_file = os.path.join(out_dir, "master_data.xlsx")
+    build_template(template_file, headers)
+
+    def write(path, df):
+        write_preserving_formulas_and_styles(template_file, path, df, SHEET_MASTER, SKIP_MASTER,
+                                             keep_format_columns, engine="xml")
+
+    master_eids = list(range(1_000_000, 1_000_000 + master_rows))
+    write(master_file, build_frame(rng, headers, master_eids, "master"))
+
+    next_eid = master_eids[-1] + 1
+    hr_files = []
+    for i in range(n_files):
+        # ~70% dòng cập nhật EID đã có trong master, ~30% là nhân viên mới
+        n_update = int(rows_per_file * 0.7)
+        eids = rng.sample(master_eids, n_update) + list(range(next_eid, next_eid + rows_per_file - n_update))
+        next_eid += rows_per_file - n_update
+        sso = f"owner_{i:03d}"
+        path = os.path.join(out_dir, "hr_files", f"HR_{sso}.xlsx")
+        write(path, build_frame(rng, headers, eids, sso))
+        hr_files.append(path)
+
+    return {
+        "template_file": template_file,
+        "master_file": master_file,
+        "hr_files": hr_files,
+        "headers": headers,
+        "scale": scale,
+        "seed": seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu HR giả lập cho benchmark")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    info = generate(args.out, args.scale, args.seed)
+    print(f"Generated {len(info['hr_files'])} HR files, template and master in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Benchmark từng bước của quy trình merge trên dữ liệu giả lập, so với baseline đã lưu.
+
+Các bước đo riêng: template_parse, read_hr, read_master, normalize, dedupe, write_openpyxl, write_xml.
+Mỗi bước đo thời gian (không bật tracemalloc) và peak bộ nhớ Python (tracemalloc, lượt chạy riêng).
+
+Chạy:
+    python benchmarks/run_benchmarks.py --scale small                  # so với benchmarks/baseline_small.json nếu có
+    python benchmarks/run_benchmarks.py --scale small --save-baseline  # lưu kết quả làm baseline mới
+Exit code 1 nếu có bước chậm hơn baseline quá --tolerance lần.
+
+benchmarks/baseline_small.json trong repo được đo trên 1 máy cụ thể (xem trường python/pandas/machine);
+số đo phụ thuộc máy, nên trước khi dùng làm gate trên máy khác hãy chạy lại với --save-baseline.
+Scale chưa có baseline thì chỉ in kết quả và trả về 0.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from generate_data import SCALES, SHEET_MASTER, SKIP_MASTER, generate, keep_format_columns  # noqa: E402
+
+
+def _stages(data):
+    """Danh sách (tên bước, hàm chuẩn bị input, hàm được đo). Input chuẩn bị ngoài phần đo."""
+    from logic import _load_template, write_preserving_formulas_and_styles
+    from logic.excel_reader import read_excel
+    from logic.master_stream import merge_master_frame
+    import merge_hr_scheduled as scheduled
+
+    template_file = data["template_file"]
+    master_file = data["master_file"]
+    hr_files = data["hr_files"]
+    state = {}
+
+    # Đọc giống merge_hr_scheduled: engine nhanh nhất có sẵn, chỉ các cột template cần, dtype gọn
+    columns = scheduled.template_columns(master_file)
+
+    def read_hr():
+        state["hr_frames"] = [read_excel(f, columns=columns, skiprows=SKIP_MASTER) for f in hr_files]
+        return sum(len(f) for f in state["hr_frames"])
+
+    def read_master():
+        state["origin"] = read_excel(master_file, columns=columns, skiprows=SKIP_MASTER)
+        return len(state["origin"])
+
+    def normalize(frames):
+        for path, frame in zip(hr_files, frames):
+            if scheduled.validate_excel_schema(frame):
+                scheduled.fill_missing_sso(frame, scheduled.extract_hr_code(os.path.basename(path)))
+        return sum(len(f) for f in frames)
+
+    def dedupe(args):
+        frames, origin = args
+        merged = pd.concat(frames, ignore_index=True).drop_duplicates(subset=["EID"], keep="last")
+        # Cùng hàm merge với merge_hr_scheduled._save_to_xlsx (nhánh DataFrame)
+        state["final"], _ = merge_master_frame(origin, merged, set())
+        return len(state["final"])
+
+    def write(engine):
+        out = os.path.join(data["workdir"], f"bench_out_{engine}.xlsx")
+
+        def run(df):
+            write_preserving_formulas_and_styles(template_file, out, df, SHEET_MASTER, SKIP_MASTER,
+                                                 keep_format_columns, engine=engine)
+            return len(df)
+        return run
+
+    return [
+        ("template_parse", lambda: None,
+         lambda _: len(_load_template(template_file, SHEET_MASTER, SKIP_MASTER, tuple(keep_format_columns))["ordered_headers"])),
+        ("read_hr", lambda: None, lambda _: read_hr()),
+        ("read_master", lambda: None, lambda _: read_master()),
+        ("normalize", lambda: [f.copy() for f in state["hr_frames"]], normalize),
+        ("dedupe", lambda: ([f.copy() for f in state["hr_frames"]], state["origin"]), dedupe),
+        # engine openpyxl không nhận np.datetime64 -> chuyển sang object (Timestamp) ngoài phần đo
+        ("write_openpyxl", lambda: state["final"].astype(object), write("openpyxl")),
+        ("write_xml", lambda: state["final"], write("xml")),
+    ]
+
+
+def run_stages(data, repeat=1, measure_memory=True):
+    results = {}
+    for name, prepare, func in _stages(data):
+        best = None
+        rows = 0
+        for _ in range(repeat):
+            arg = prepare()
+            start = time.perf_counter()
+            rows = func(arg)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        peak_mb = None
+        if measure_memory:
+            arg = prepare()
+            tracemalloc.start()
+            func(arg)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak_mb = peak / (1024 * 1024)
+        results[name] = {"seconds": round(best, 4), "peak_mb": None if peak_mb is None else round(peak_mb, 2),
+                         "rows": rows}
+        mem = "" if peak_mb is None else f"  peak {peak_mb:8.1f} MiB"
+        print(f"{name:>15}: {best:8.3f}s{mem}  rows={rows}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """In so sánh với baseline; trả về danh sách bước bị chậm/tốn RAM hơn ngưỡng."""
+    regressions = []
+    print(f"\n{'stage':>15} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for name, now in results.items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        ratio = now["seconds"] / base["seconds"] if base["seconds"] else 1.0
+        flag = ""
+        if ratio > tolerance:
+            flag = "  REGRESSION (time)"
+            regressions.append(name)
+        if now.get("peak_mb") and base.get("peak_mb") and now["peak_mb"] > base["peak_mb"] * tolerance:
+            flag += "  REGRESSION (memory)"
+            if name not in regressions:
+                regressions.append(name)
+        print(f"{name:>15} {base['seconds']:>9.3f}s {now['seconds']:>9.3f}s {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các bước merge HR trên dữ liệu giả lập")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="số lần đo mỗi bước (lấy lần nhanh nhất)")
+    parser.add_argument("--workdir", help="thư mục dữ liệu (mặc định: thư mục tạm, xóa sau khi chạy)")
+    parser.add_argument("--baseline", help="file baseline (mặc định benchmarks/baseline_<scale>.json)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.3)
+    parser.add_argument("--no-memory", action="store_true", help="bỏ lượt đo peak memory")
+    args = parser.parse_args()
+
+    baseline_path = args.baseline or os.path.join(BENCH_DIR, f"baseline_{args.scale}.json")
+    workdir = args.workdir or tempfile.mkdtemp(prefix="hr_bench_")
+    cwd = os.getcwd()
+    try:
+        print(f"Generating '{args.scale}' dataset in {workdir} ...")
+        data = generate(workdir, args.scale, args.seed)
+        data["workdir"] = workdir
+        # Các hàm của merge_hr_scheduled dùng đường dẫn tương đối -> chạy trong thư mục dữ liệu
+        os.chdir(workdir)
+        results = run_stages(data, repeat=args.repeat, measure_memory=not args.no_memory)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "scale": args.scale,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.node(),
+        "stages": results,
+    }
+
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to create one")
+        return 0
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nRegressions (> {args.tolerance}x baseline): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+from watchdog.observers import Observer
+
+import merge_hr_files as watcher
+import merge_hr_scheduled as scheduled
+from logic import instrumentation, parse_template
+from logic.cron import load_schedules, next_due
+from logic.job_queue import FULL, MergeJobQueue
+from logic.log_setup import setup_logging
+from logic.pipeline import DEFAULT_CONFIG_FILE, load_config
+from logic.resident_master import ResidentMaster
+
+# Cùng đường dẫn với merge_hr_scheduled.merge_hr_files (chạy từ thư mục dữ liệu)
+HR_FILES_DIR = "hr_files"
+MASTER_ORIGIN_FILE = "master_data.xlsx"
+MASTER_UPDATED_FILE = os.path.join("update", "master_data_updated.xlsx")
+# Không có job -> cứ N giây kiểm tra master thường trú đã tới ngưỡng flush chưa
+POLL_INTERVAL = 1.0
+
+log = logging.getLogger("hr_daemon")
+
+
+class _LoopQueue:
+    """Hàng đợi cho HRFileWatcher: chuyển event từ thread watchdog sang MergeJobQueue trên event loop."""
+
+    def __init__(self, loop, jobs):
+        self.loop = loop
+        self.jobs = jobs
+
+    def put(self, item):
+        path, event_time = item
+        self.loop.call_soon_threadsafe(self.jobs.add_event, path, event_time)
+
+
+class HRDaemon:
+    """1 process chạy cả watcher (event file HR) lẫn merge đầy đủ theo lịch cron trong config.yaml.
+
+    Hai loại trigger dùng chung 1 template đã parse (cache trong process), 1 master thường trú
+    (master_data_updated) và 1 process pool đọc file HR. Job chạy lần lượt trên 1 thread riêng nên không
+    tranh nhau file master; merge đầy đủ hấp thụ các event merge đang chờ (MergeJobQueue).
+    """
+
+    def __init__(self, config, max_workers=scheduled.MERGE_WORKERS):
+        daemon_config = config.get('daemon') or {}
+        self.schedules = load_schedules(config)
+        self.jobs = MergeJobQueue(settle_seconds=float(daemon_config.get('settle_seconds', 2.0)),
+                                  max_batch_delay=float(daemon_config.get('max_batch_delay', 30.0)))
+        self.max_workers = max_workers
+        self.pool = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+        # Mọi thao tác trên master thường trú/file master chạy trên thread này, lần lượt từng job
+        self.runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hr-daemon-job")
+        self.metrics = watcher.WatcherMetrics()
+        self.master = None
+
+    def open_master(self):
+        """Master thường trú đọc/ghi master_data_updated theo template, cùng định dạng với merge đầy đủ."""
+        os.makedirs(os.path.dirname(MASTER_UPDATED_FILE), exist_ok=True)
+        master = ResidentMaster(
+            MASTER_UPDATED_FILE,
+            key='EID',
+            reader=functools.partial(scheduled.read_file_with_retry, use_cache=False),
+            writer=lambda df, path: scheduled.write_master_xlsx(MASTER_ORIGIN_FILE, path, df),
+            flush_interval=watcher.MASTER_FLUSH_INTERVAL,
+            flush_rows=watcher.MASTER_FLUSH_ROWS,
+        )
+        log.info(f"Loaded resident master {MASTER_UPDATED_FILE} with {len(master)} rows")
+        return master
+
+    def warm_template(self):
+        # Parse template 1 lần lúc khởi động; các job sau dùng bản cache (tự parse lại khi file đổi)
+        parse_template(MASTER_ORIGIN_FILE, scheduled.SHEET_MASTER, scheduled.SKIP_MASTER,
+                       tuple(scheduled.keep_format_columns))
+        scheduled.template_columns(MASTER_ORIGIN_FILE)
+
+    def run_event_merge(self, paths, first_events):
+        """Upsert các file HR vừa đổi vào master thường trú (ghi file theo ngưỡng flush)."""
+        log.info(f"Merging batch of {len(paths)} files: {paths}")
+        with instrumentation.run("daemon_event_merge") as run_metrics:
+            try:
+                with instrumentation.stage("check_external_change"):
+                    if self.master.check_external_change():
+                        log.info(f"Master file {self.master.path} changed externally, reloaded with "
+                                 f"{len(self.master)} rows")
+                columns = scheduled.template_columns(MASTER_ORIGIN_FILE)
+                # MergeJobQueue chỉ trả về file đã yên (size/mtime) -> khỏi is_file_stable sleep trong pool
+                loaded = scheduled.load_hr_files_parallel(paths, max_workers=self.max_workers, columns=columns,
+                                                          executor=self.pool, check_stable=False)
+                for file_path, hr_data in loaded:
+                    if hr_data is None:
+                        continue
+                    with instrumentation.stage("upsert") as st:
+                        updated, inserted = self.master.upsert(hr_data)
+                        st.add("updated", updated)
+                        st.add("inserted", inserted)
+                    watcher.merge_log.info(f"Merged {len(hr_data)} rows from {file_path} into {self.master.path} "
+                                           f"({updated} updated, {inserted} inserted, {len(self.master)} total rows)")
+            except Exception as e:
+                watcher.error_log.error(f"Error merging batch {paths}: {e}")
+                if run_metrics is not None:
+                    run_metrics.status = 'error'
+            self.metrics.record_batch(first_events)
+            if run_metrics is not None:
+                run_metrics.gauges.update(self.metrics.gauges())
+                run_metrics.gauges['batch_files'] = len(paths)
+        log.info(f"Watcher metrics: {self.metrics.summary()}")
+        if self.master.should_flush():
+            self.flush_master()
+
+    def run_full_merge(self, reasons, absorbed):
+        """Merge đầy đủ (merge_hr_scheduled) rồi nạp lại master thường trú từ file vừa dựng lại."""
+        log.info(f"Running full merge ({', '.join(reasons)}), absorbed {len(absorbed)} pending file events")
+        try:
+            saved = scheduled.merge_hr_files(max_workers=self.max_workers, executor=self.pool)
+        except Exception as e:
+            watcher.error_log.error(f"Error in full merge: {e}")
+            return
+        if saved:
+            # master_data_updated vừa dựng lại từ toàn bộ file HR -> thay đổi chưa flush đã nằm trong đó
+            self.master.reset()
+            log.info(f"Reloaded resident master with {len(self.master)} rows")
+
+    def flush_master(self, force=False):
+        with instrumentation.run("daemon_flush"):
+            watcher.flush_master(self.master, force=force)
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.runner, func, *args)
+
+    async def _schedule(self):
+        """Đưa job merge đầy đủ vào hàng đợi theo các lịch cron."""
+        for name, cron in self.schedules.items():
+            log.info(f"Scheduled full merge '{name}' at '{cron.expr}'")
+        while True:
+            due = next_due(self.schedules)
+            if due is None:
+                return
+            name, when = due
+            # Ngủ từng đoạn ngắn để không lệch lịch khi máy sleep/đổi giờ
+            while (delay := (when - datetime.now()).total_seconds()) > 0:
+                await asyncio.sleep(min(delay, 60.0))
+            self.jobs.add_full(name)
+
+    async def _consume(self):
+        while True:
+            job = await self.jobs.get(timeout=POLL_INTERVAL)
+            self.metrics.record_queue_depth(len(self.jobs))
+            if job is None:
+                if self.master.should_flush():
+                    await self._call(self.flush_master)
+                continue
+            kind, paths_or_reasons, extra = job
+            if kind == FULL:
+                await self._call(self.run_full_merge, paths_or_reasons, extra)
+            else:
+                await self._call(self.run_event_merge, paths_or_reasons, extra)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.master = await self._call(self.open_master)
+        await self._call(self.warm_template)
+
+        handler = watcher.HRFileWatcher(_LoopQueue(loop, self.jobs), metrics=self.metrics)
+        observer = Observer()
+        observer.schedule(handler, HR_FILES_DIR, recursive=False)
+        observer.start()
+        log.info(f"Monitoring {HR_FILES_DIR} directory for changes...")
+        scheduler = asyncio.create_task(self._schedule())
+        try:
+            await self._consume()
+        finally:
+            scheduler.cancel()
+            observer.stop()
+            observer.join()
+            # Tắt daemon -> ghi nốt các thay đổi chưa flush
+            if self.master is not None:
+                self.runner.submit(self.flush_master, True).result()
+            self.runner.shutdown()
+            if self.pool is not None:
+                self.pool.shutdown()
+            log.info("Stopped HR daemon")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy watcher file HR và merge đầy đủ theo lịch trong 1 process")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE)
+    parser.add_argument("--workers", type=int, default=scheduled.MERGE_WORKERS,
+                        help="Số process đọc file HR (1 -> đọc tuần tự)")
+    args = parser.parse_args()
+
+    # Cấu hình logging/metrics 1 lần cho cả process: log chung vào daemon.log, log riêng của watcher theo route
+    # như merge_hr_files.py
+    setup_logging(scheduled.logs_path, default_file='daemon.log', routes=watcher.LOG_ROUTES,
+                  rate_limits={"hr_watcher.events": watcher.WATCHDOG_LOG_INTERVAL})
+    instrumentation.configure(scheduled.METRICS_DIR)
+    for path in (HR_FILES_DIR, MASTER_ORIGIN_FILE):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} does not exist")
+    daemon = HRDaemon(load_config(args.config), max_workers=args.workers)
+    start_time = time.time()
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        log.info(f"HR daemon ran for {time.time() - start_time:.0f} seconds")
+
+
+if __name__ == "__main__":
+    main()
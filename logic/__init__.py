@@ -8,17 +8,48 @@ from openpyxl.workbook import Workbook
 from functools import lru_cache
 import os
 
+import numpy as np
 
-TEMPLATE_FILE = os.path.abspath("workday_data.xlsx")
-wb_template = load_workbook(TEMPLATE_FILE, data_only=False, keep_vba=False)
+from logic import instrumentation
+from logic.read_cache import cached_object
+from logic.xml_writer import SharedFormula, write_sheet_xml
 
-@lru_cache(maxsize=8)
-def parse_template(template_path: str, sheet_name: str, header_skip_rows: int, keep_formula_columns: tuple[str, ...]):
-    ws = wb_template[sheet_name]
+
+WRITER_ENGINES = ("openpyxl", "xml")
+
+
+def _copy_style(cell):
+    # COPY STYLE OBJECTS to avoid StyleProxy hashing issues (EmptyCell ở chế độ read-only không có style)
+    font = getattr(cell, 'font', None)
+    fill = getattr(cell, 'fill', None)
+    border = getattr(cell, 'border', None)
+    alignment = getattr(cell, 'alignment', None)
+    return {
+        'font': copy(font) if font else Font(),
+        'fill': copy(fill) if fill else PatternFill(),
+        'border': copy(border) if border else Border(),
+        'alignment': copy(alignment) if alignment else Alignment(),
+    }
+
+
+def _load_template(template_path, sheet_name, header_skip_rows, keep_formula_columns):
+    """Đọc template ở chế độ read-only, chỉ các dòng pre-header, header và dòng dữ liệu đầu tiên."""
     header_row_idx = header_skip_rows + 1
     data_start_row = header_row_idx + 1
 
-    header_row = ws[header_row_idx]
+    with instrumentation.stage("template_parse") as st:
+        wb = load_workbook(template_path, read_only=True, data_only=False, keep_vba=False)
+        try:
+            ws = wb[sheet_name]
+            rows = [list(r) for r in ws.iter_rows(min_row=1, max_row=data_start_row)]
+        finally:
+            wb.close()
+        st.add("bytes_read", instrumentation.file_size(template_path))
+    rows += [[] for _ in range(data_start_row - len(rows))]
+
+    header_row = rows[header_row_idx - 1]
+    first_data_row = rows[data_start_row - 1]
+    row_len = max(len(r) for r in rows[:header_row_idx])
     header_map = {}
     header_styles = []
     formula_templates = {}
@@ -28,31 +59,19 @@ def parse_template(template_path: str, sheet_name: str, header_skip_rows: int, k
             continue
         header = str(cell.value).strip()
         header_map[header] = col_idx
-        # COPY STYLE OBJECTS to avoid StyleProxy hashing issues
-        header_styles.append({
-            'font': copy(cell.font) if cell.font else Font(),
-            'fill': copy(cell.fill) if cell.fill else PatternFill(),
-            'border': copy(cell.border) if cell.border else Border(),
-            'alignment': copy(cell.alignment) if cell.alignment else Alignment(),
-        })
-        if header in keep_formula_columns:
-            tcell = ws.cell(row=data_start_row, column=col_idx)
+        header_styles.append(_copy_style(cell))
+        if header in keep_formula_columns and col_idx <= len(first_data_row):
+            tcell = first_data_row[col_idx - 1]
             if isinstance(tcell.value, str) and tcell.value.startswith("="):
                 formula_templates[header] = tcell.value
 
     # Cache các dòng pre-header (value + style refs)
     pre_header_rows = []
-    for row_idx in range(1, header_row_idx):
+    for row in rows[:header_row_idx - 1]:
         row_cells = []
-        for col_idx in range(1, len(header_row) + 1):
-            c = ws.cell(row=row_idx, column=col_idx)
-            row_cells.append({
-                'value': c.value,
-                'font': copy(c.font) if c.font else Font(),
-                'fill': copy(c.fill) if c.fill else PatternFill(),
-                'border': copy(c.border) if c.border else Border(),
-                'alignment': copy(c.alignment) if c.alignment else Alignment(),
-            })
+        for col_idx in range(row_len):
+            c = row[col_idx] if col_idx < len(row) else None
+            row_cells.append(dict(_copy_style(c), value=getattr(c, 'value', None)))
         pre_header_rows.append(row_cells)
 
     ordered_headers = list(header_map.keys())
@@ -62,12 +81,77 @@ def parse_template(template_path: str, sheet_name: str, header_skip_rows: int, k
         'header_styles': header_styles,
         'formula_templates': formula_templates,
         'pre_header_rows': pre_header_rows,
-        'header_row_len': len(header_row),
+        'header_row_len': row_len,
         'data_start_row': data_start_row,
     }
 
-def write_preserving_formulas_and_styles(template_path, output_path, df, sheet_name, header_skip_rows, keep_formula_columns):
-    tpl = parse_template(template_path, sheet_name, header_skip_rows, tuple(keep_formula_columns))
+
+@lru_cache(maxsize=8)
+def _parse_template_cached(template_path, mtime_ns, size, sheet_name, header_skip_rows, keep_formula_columns):
+    # mtime/size nằm trong key -> template đổi là parse lại; metadata còn được lưu xuống đĩa
+    # nên lần khởi động sau của watcher/scheduler không phải mở lại workbook
+    return cached_object(
+        template_path,
+        lambda: _load_template(template_path, sheet_name, header_skip_rows, keep_formula_columns),
+        sheet_name=sheet_name,
+        header_skip_rows=header_skip_rows,
+        keep_formula_columns=keep_formula_columns,
+    )
+
+
+def parse_template(template_path: str, sheet_name: str, header_skip_rows: int, keep_formula_columns: tuple[str, ...]):
+    template_path = os.path.abspath(template_path)
+    st = os.stat(template_path)
+    return _parse_template_cached(template_path, st.st_mtime_ns, st.st_size, sheet_name, header_skip_rows,
+                                  tuple(keep_formula_columns))
+
+
+def write_preserving_formulas_and_styles(template_path, output_path, df, sheet_name, header_skip_rows, keep_formula_columns,
+                                         engine="openpyxl"):
+    """engine="openpyxl": WriteOnlyCell như cũ; engine="xml": stream XML trực tiếp từ mảng cột (nhanh, ít RAM hơn)."""
+    if engine not in WRITER_ENGINES:
+        raise ValueError(f"Unknown writer engine {engine!r}, expected one of {WRITER_ENGINES}")
+    with instrumentation.stage("write_xlsx") as st:
+        tpl = parse_template(template_path, sheet_name, header_skip_rows, tuple(keep_formula_columns))
+        _write_rows(tpl, output_path, frame_rows(df, tpl['ordered_headers']), len(df), sheet_name, engine)
+        st.add("rows", len(df))
+        st.add("bytes_written", instrumentation.file_size(output_path))
+
+
+def write_rows_preserving_formulas_and_styles(template_path, output_path, rows, sheet_name, header_skip_rows,
+                                              keep_formula_columns, engine="xml", num_rows=None):
+    """Như write_preserving_formulas_and_styles nhưng dữ liệu là iterator các dòng (không cần DataFrame trong RAM).
+
+    Mỗi dòng là sequence giá trị theo đúng thứ tự parse_template(...)['ordered_headers'] (giá trị ở cột công
+    thức bị bỏ qua). num_rows=None (chưa biết số dòng): cột công thức dịch theo Translator ghi công thức riêng
+    từng ô thay vì shared formula. Trả về số dòng đã ghi.
+    """
+    if engine not in WRITER_ENGINES:
+        raise ValueError(f"Unknown writer engine {engine!r}, expected one of {WRITER_ENGINES}")
+    with instrumentation.stage("write_xlsx") as st:
+        tpl = parse_template(template_path, sheet_name, header_skip_rows, tuple(keep_formula_columns))
+        written = _write_rows(tpl, output_path, rows, num_rows, sheet_name, engine)
+        st.add("rows", written)
+        st.add("bytes_written", instrumentation.file_size(output_path))
+    return written
+
+
+def _cell_values(ser):
+    # Category/string (Arrow) lấy từng phần tử rất chậm -> chuyển 1 lần sang mảng object
+    values = ser.values
+    return values if isinstance(values, np.ndarray) else np.asarray(values, dtype=object)
+
+
+def frame_rows(df, headers):
+    """Các dòng của df theo thứ tự headers (cột df không có -> None), dùng cho _write_rows."""
+    num_rows = len(df)
+    columns = [_cell_values(df[h]) if h in df.columns else [None] * num_rows for h in headers]
+    if not columns:
+        return ((),) * num_rows
+    return zip(*columns)
+
+
+def _write_rows(tpl, output_path, rows, num_rows, sheet_name, engine):
     header_map = tpl['header_map']
     ordered_headers = tpl['ordered_headers']
     header_styles = tpl['header_styles']
@@ -75,8 +159,64 @@ def write_preserving_formulas_and_styles(template_path, output_path, df, sheet_n
     formula_templates = tpl['formula_templates']
     data_start_row = tpl['data_start_row']
 
-    num_rows = len(df)
-    df_values = {h: (df[h].values if h in df.columns else [None]*num_rows) for h in ordered_headers}
+    # Công thức theo cột: chỉ giữ công thức gốc, từng dòng được sinh lazy (không dựng list num_rows chuỗi)
+    formula_columns = {}
+    for header, formula in formula_templates.items():
+        col_letter = get_column_letter(header_map[header])
+        base_ref = f"{col_letter}{data_start_row}"
+        # fast path (same-col refs)
+        if base_ref in formula:
+            formula_columns[header] = ('replace', formula, base_ref, col_letter)
+        else:
+            # fallback Translator once per column
+            formula_columns[header] = ('translate', Translator(formula, origin=base_ref), col_letter)
+
+    def formula_at(spec, ridx):
+        row_num = data_start_row + ridx
+        if spec[0] == 'replace':
+            return spec[1].replace(spec[2], f"{spec[3]}{row_num}")
+        return spec[1].translate_formula(dest=f"{spec[2]}{row_num}")
+
+    written = [0]
+
+    def counted(source):
+        for values in source:
+            written[0] += 1
+            yield values
+        # Số dòng sai -> ref của shared formula sai, báo lỗi thay vì ghi file hỏng
+        if num_rows is not None and written[0] != num_rows:
+            raise ValueError(f"Expected {num_rows} data rows, got {written[0]}")
+
+    if engine == "xml":
+        header_cells = [dict(style, value=header) for header, style in zip(ordered_headers, header_styles)]
+
+        # Cột công thức dịch theo Translator -> shared formula: ô đầu giữ công thức + ref, các ô sau chỉ tham chiếu si.
+        # Mỗi cột output có si riêng (header trùng tên như FROM/TO chỉ xuất hiện 1 lần trong ordered_headers).
+        shared = {}
+        for out_idx, header in enumerate(ordered_headers, 1):
+            spec = formula_columns.get(header)
+            if spec is None or spec[0] != 'translate' or not num_rows:
+                continue
+            letter = get_column_letter(out_idx)
+            ref = f"{letter}{data_start_row}:{letter}{data_start_row + num_rows - 1}"
+            si = len(shared)
+            shared[header] = (SharedFormula(si, formula_templates[header], ref), SharedFormula(si))
+
+        def data_rows():
+            for ridx, values in enumerate(counted(rows)):
+                row = []
+                for h, value in zip(ordered_headers, values):
+                    if h in shared:
+                        row.append(shared[h][0] if ridx == 0 else shared[h][1])
+                    elif h in formula_columns:
+                        row.append(formula_at(formula_columns[h], ridx))
+                    else:
+                        row.append(value)
+                yield row
+
+        write_sheet_xml(output_path, sheet_name, pre_header_rows, header_cells, data_rows(),
+                        max(tpl['header_row_len'], len(ordered_headers)))
+        return written[0]
 
     wb = Workbook(write_only=True)
     ws = wb.create_sheet(sheet_name)
@@ -98,31 +238,18 @@ def write_preserving_formulas_and_styles(template_path, output_path, df, sheet_n
         header_cells.append(c)
     ws.append(header_cells)
 
-    # precompute translated formulas per column (prefer fast path)
-    translated_formulas = {}
-    for header, formula in formula_templates.items():
-        col_idx = header_map[header]
-        col_letter = get_column_letter(col_idx)
-        base_ref = f"{col_letter}{data_start_row}"
-        # fast path (same-col refs)
-        if base_ref in formula:
-            translated_formulas[header] = [formula.replace(base_ref, f"{col_letter}{data_start_row + i}") for i in range(num_rows)]
-        else:
-            # fallback Translator once per column
-            tr = Translator(formula, origin=f"{col_letter}{data_start_row}")
-            translated_formulas[header] = [tr.translate_formula(dest=f"{col_letter}{data_start_row + i}") for i in range(num_rows)]
-
     # write data rows
-    for ridx in range(num_rows):
+    for ridx, values in enumerate(counted(rows)):
         row = []
-        for header in ordered_headers:
+        for header, value in zip(ordered_headers, values):
             cell = WriteOnlyCell(ws)
-            if header in translated_formulas:
-                cell.value = translated_formulas[header][ridx]
+            if header in formula_columns:
+                cell.value = formula_at(formula_columns[header], ridx)
             else:
-                cell.value = df_values[header][ridx]
+                cell.value = value
             row.append(cell)
         ws.append(row)
 
     wb.save(output_path)
-    wb.close()
\ No newline at end of file
+    wb.close()
+    return written[0]
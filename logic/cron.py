@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+# (tên, min, max) của 5 trường cron: phút giờ ngày tháng thứ (0/7 = Chủ nhật)
+FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+# Tìm lần chạy kế tiếp trong tối đa N ngày (vd. "0 0 29 2 *" cần tới ~4 năm)
+MAX_SEARCH_DAYS = 366 * 5
+
+
+def _parse_field(text, name, low, high):
+    values = set()
+    for part in text.split(','):
+        base, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if base == '*':
+            start, end = low, high
+        elif '-' in base:
+            start, end = (int(v) for v in base.split('-', 1))
+        else:
+            start = end = int(base)
+            if step != 1:
+                end = high
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Invalid cron {name} field '{text}'")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """Lịch kiểu cron 5 trường ("38 14 * * *" = 14:38 hằng ngày), hỗ trợ *, a-b, a,b và /bước.
+
+    Như cron: nếu cả ngày-trong-tháng lẫn thứ đều bị giới hạn thì khớp 1 trong 2 là đủ.
+    """
+
+    def __init__(self, expr):
+        parts = expr.split()
+        if len(parts) != len(FIELDS):
+            raise ValueError(f"Cron expression '{expr}' must have {len(FIELDS)} fields")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(part, *field) for part, field in zip(parts, FIELDS))
+        self.weekdays = frozenset(d % 7 for d in weekdays)
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+
+    def __repr__(self):
+        return f"CronSchedule({self.expr!r})"
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, dt):
+        """Thời điểm (phút tròn) đầu tiên sau dt khớp lịch."""
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=MAX_SEARCH_DAYS)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"Cron expression '{self.expr}' never matches")
+
+
+def load_schedules(config):
+    """{tên: CronSchedule} từ mục schedules của config (tên -> biểu thức cron)."""
+    return {name: CronSchedule(str(expr)) for name, expr in (config.get('schedules') or {}).items()}
+
+
+def next_due(schedules, now=None):
+    """(tên, thời điểm) của lịch đến hạn sớm nhất sau now; None nếu không có lịch nào."""
+    now = now or datetime.now()
+    runs = [(schedule.next_after(now), name) for name, schedule in schedules.items()]
+    if not runs:
+        return None
+    when, name = min(runs)
+    return name, when
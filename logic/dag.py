@@ -0,0 +1,253 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from logic import instrumentation
+
+STATE_FILE = "state.json"
+DAG_WORKERS = min(8, os.cpu_count() or 4)
+
+
+def _digest(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(repr(part).encode('utf-8'))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _func_ident(func):
+    """Định danh hàm của stage (gồm tham số của functools.partial) để đổi tham số thì stage chạy lại."""
+    if isinstance(func, functools.partial):
+        return (_func_ident(func.func), [_arg_ident(a) for a in func.args],
+                sorted((k, _arg_ident(v)) for k, v in func.keywords.items()))
+    return f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+
+
+def _arg_ident(value):
+    # repr của hàm chứa địa chỉ bộ nhớ -> đổi mỗi process, dùng tên hàm thay thế
+    if callable(value):
+        return _func_ident(value)
+    return repr(value)
+
+
+def _stats(paths):
+    result = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            result.append([path, None, None])
+            continue
+        result.append([path, st.st_size, st.st_mtime_ns])
+    return result
+
+
+def _run_captured(func, args):
+    # Chạy trong process con: gửi kèm metrics các stage con về process cha
+    with instrumentation.capture() as captured:
+        value = func(*args)
+    return value, captured.export()
+
+
+class Stage:
+    """1 node của DAG: value = func(*giá trị các deps)."""
+
+    def __init__(self, name, func, deps=(), inputs=None, outputs=None, io=False, persist=True):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        # inputs() -> list file đầu vào: size/mtime đổi -> stage (và các stage phía sau) chạy lại
+        self.inputs = inputs
+        # outputs(value) -> list file stage ghi ra: bị sửa/xóa từ bên ngoài -> stage chạy lại
+        self.outputs = outputs
+        # io=True: đọc file, các stage io cùng lượt chạy song song trong process pool
+        self.io = io
+        # persist=False: không lưu giá trị xuống cache_dir (vd. đã có cache đọc xlsx riêng)
+        self.persist = persist
+
+
+class Pipeline:
+    """DAG các stage, chỉ chạy lại stage có đầu vào đổi và các stage phía sau nó.
+
+    Fingerprint của stage = hàm + tham số + stat các file inputs + fingerprint các deps, nên tính
+    được trước khi chạy. Giá trị giữ trong bộ nhớ giữa các lần run() và (nếu có cache_dir) được
+    pickle xuống đĩa cùng state.json để process sau cũng bỏ qua được các stage không đổi.
+    """
+
+    def __init__(self, cache_dir=None, max_workers=DAG_WORKERS, executor="process"):
+        self.stages = {}
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.executor = executor
+        self._memory = {}  # name -> (fingerprint, value)
+        self._state = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            try:
+                with open(os.path.join(cache_dir, STATE_FILE), 'r', encoding='utf-8') as f:
+                    self._state = json.load(f)
+            except (OSError, ValueError):
+                # Không có/hỏng -> chạy lại toàn bộ
+                self._state = {}
+
+    def add(self, name, func, deps=(), inputs=None, outputs=None, io=False, persist=True):
+        """Thêm stage; deps phải được add trước (thứ tự add là 1 thứ tự topo hợp lệ)."""
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage '{name}'")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Unknown dependency '{dep}' of stage '{name}'")
+        self.stages[name] = Stage(name, func, deps, inputs, outputs, io, persist)
+        return self.stages[name]
+
+    def _required(self, targets):
+        """Các stage cần cho targets (gồm tổ tiên), theo thứ tự add."""
+        needed = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'")
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].deps)
+        return [name for name in self.stages if name in needed]
+
+    def _fingerprint(self, stage, fingerprints):
+        parts = [stage.name, _func_ident(stage.func), [fingerprints[d] for d in stage.deps]]
+        if stage.inputs is not None:
+            parts.append(_stats(stage.inputs()))
+        return _digest(*parts)
+
+    def _value_path(self, name):
+        return os.path.join(self.cache_dir, f"{name}.pkl")
+
+    def _has_value(self, name, fingerprint):
+        cached = self._memory.get(name)
+        if cached is not None and cached[0] == fingerprint:
+            return True
+        entry = self._state.get(name)
+        return bool(self.cache_dir and entry and entry.get('fingerprint') == fingerprint
+                    and entry.get('persisted') and os.path.exists(self._value_path(name)))
+
+    def _is_fresh(self, stage, fingerprint):
+        entry = self._state.get(stage.name)
+        if entry is None or entry.get('fingerprint') != fingerprint:
+            return False
+        if stage.outputs is not None and entry.get('outputs') != _stats([p for p, _, _ in entry.get('outputs', [])]):
+            return False
+        return True
+
+    def _load(self, name, fingerprint):
+        cached = self._memory.get(name)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        with open(self._value_path(name), 'rb') as f:
+            value = pickle.load(f)
+        self._memory[name] = (fingerprint, value)
+        return value
+
+    def _store(self, stage, fingerprint, value):
+        self._memory[stage.name] = (fingerprint, value)
+        entry = {'fingerprint': fingerprint, 'persisted': False}
+        if stage.outputs is not None:
+            entry['outputs'] = _stats(stage.outputs(value))
+        if self.cache_dir and stage.persist:
+            path = self._value_path(stage.name)
+            tmp_path = f"{path}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+                entry['persisted'] = True
+            except Exception:
+                # Cache chỉ là tối ưu: không pickle được thì lần sau chạy lại stage
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self._state[stage.name] = entry
+
+    def _save_state(self):
+        if not self.cache_dir:
+            return
+        path = os.path.join(self.cache_dir, STATE_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def run(self, targets=None, force=False):
+        """Chạy các stage cần cho targets (mặc định: các stage không stage nào phụ thuộc).
+
+        Trả về dict: ran / skipped (list tên stage) và values ({target: giá trị}).
+        """
+        if targets is None:
+            used = {dep for stage in self.stages.values() for dep in stage.deps}
+            targets = [name for name in self.stages if name not in used]
+        order = self._required(targets)
+
+        fingerprints = {}
+        stale = set()
+        for name in order:
+            stage = self.stages[name]
+            fingerprints[name] = self._fingerprint(stage, fingerprints)
+            if force or not self._is_fresh(stage, fingerprints[name]):
+                stale.add(name)
+
+        # Stage không đổi nhưng không còn giá trị (chưa persist) mà stage sau/target cần -> chạy lại
+        needed_values = set(targets)
+        for name in order:
+            if name in stale:
+                needed_values.update(self.stages[name].deps)
+        to_run = set(stale)
+        for name in reversed(order):
+            if name in needed_values and name not in to_run and not self._has_value(name, fingerprints[name]):
+                to_run.add(name)
+                needed_values.update(self.stages[name].deps)
+
+        result = {'ran': [], 'skipped': [name for name in order if name not in to_run], 'values': {}}
+        done = set(order) - to_run
+        try:
+            while len(done) < len(order):
+                # 1 lượt = các stage đã đủ deps; stage io trong lượt chạy song song
+                wave = [name for name in order if name not in done
+                        and all(dep in done for dep in self.stages[name].deps)]
+                self._run_wave(wave, fingerprints)
+                done.update(wave)
+                result['ran'].extend(wave)
+        finally:
+            self._save_state()
+
+        for name in targets:
+            result['values'][name] = self._load(name, fingerprints[name])
+        return result
+
+    def _run_wave(self, wave, fingerprints):
+        io_stages = [name for name in wave if self.stages[name].io]
+        pool = None
+        futures = {}
+        if len(io_stages) > 1 and self.max_workers > 1:
+            pool_cls = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+            pool = pool_cls(max_workers=min(self.max_workers, len(io_stages)))
+        try:
+            if pool is not None:
+                for name in io_stages:
+                    futures[name] = pool.submit(_run_captured, self.stages[name].func, self._args(name, fingerprints))
+            for name in wave:
+                stage = self.stages[name]
+                with instrumentation.stage(f"pipeline_{name}"):
+                    if name in futures:
+                        value, captured = futures[name].result()
+                        instrumentation.merge_stages(captured)
+                    else:
+                        value = stage.func(*self._args(name, fingerprints))
+                self._store(stage, fingerprints[name], value)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _args(self, name, fingerprints):
+        return [self._load(dep, fingerprints[dep]) for dep in self.stages[name].deps]
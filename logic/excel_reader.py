@@ -0,0 +1,106 @@
+import importlib.util
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from logic.read_cache import READ_CACHE_MAX_BYTES, cached_frame, cached_object
+
+# Ép engine đọc xlsx (vd. "openpyxl" để so sánh/khắc phục lỗi engine nhanh)
+ENGINE_ENV = "HR_EXCEL_ENGINE"
+DEFAULT_ENGINE = "openpyxl"
+# Engine nhanh theo thứ tự ưu tiên: (engine của pandas, module cần cài, phiên bản pandas tối thiểu)
+FAST_ENGINES = (("calamine", "python_calamine", (2, 2)),)
+# Cột chữ ít giá trị khác nhau -> category (mỗi giá trị chỉ lưu 1 lần)
+CATEGORY_COLUMNS = frozenset({
+    "GENDER", "PROJECT", "BANK NAME", "MARITAL STATUS", "NATIONALITY", "ETHNIC", "RELIGION", "EDUCATION",
+})
+
+
+@lru_cache(maxsize=None)
+def _has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def _pandas_version():
+    return tuple(int(part) for part in pd.__version__.split('.')[:2] if part.isdigit())
+
+
+def excel_engine():
+    """Engine đọc xlsx: HR_EXCEL_ENGINE nếu có, không thì engine nhanh đầu tiên đã cài, cuối cùng là openpyxl."""
+    forced = os.environ.get(ENGINE_ENV)
+    if forced:
+        return forced
+    for engine, module, min_pandas in FAST_ENGINES:
+        if _pandas_version() >= min_pandas and _has_module(module):
+            return engine
+    return DEFAULT_ENGINE
+
+
+def _string_dtype():
+    # NA là NaN như cột object cũ (pandas >= 2.3); StringDtype cũ dùng pd.NA mà writer openpyxl không ghi được
+    try:
+        return pd.StringDtype(na_value=np.nan)
+    except TypeError:
+        return None
+
+
+def compact_dtypes(df, category_columns=CATEGORY_COLUMNS):
+    """Cột chữ trong category_columns -> category, cột chữ khác -> string; cột lẫn kiểu (số + chữ) giữ object."""
+    str_dtype = _string_dtype()
+    for pos, col in enumerate(df.columns):
+        ser = df.iloc[:, pos]
+        is_object = ser.dtype == object
+        if not (is_object or isinstance(ser.dtype, pd.StringDtype)):
+            continue
+        if is_object and pd.api.types.infer_dtype(ser, skipna=True) != 'string':
+            continue
+        if str(col).strip() in category_columns:
+            df.isetitem(pos, ser.astype('category'))
+        elif is_object and str_dtype is not None:
+            df.isetitem(pos, ser.astype(str_dtype))
+    return df
+
+
+def column_filter(columns):
+    """usecols dạng hàm: chỉ giữ cột có tên (bỏ khoảng trắng 2 đầu) thuộc columns, cột thiếu trong file bỏ qua."""
+    wanted = {str(c).strip() for c in columns}
+    return lambda name: str(name).strip() in wanted
+
+
+def read_excel(path, columns=None, compact=True, engine=None, **kwargs):
+    """pd.read_excel qua engine nhanh nhất có sẵn; columns -> chỉ parse các cột này; compact -> dtype gọn."""
+    if columns is not None:
+        kwargs['usecols'] = column_filter(columns)
+    df = pd.read_excel(path, engine=engine or excel_engine(), **kwargs)
+    return compact_dtypes(df) if compact else df
+
+
+def cached_read(path, columns=None, compact=True, engine=None, max_bytes=READ_CACHE_MAX_BYTES, **kwargs):
+    """read_excel qua cache snapshot cạnh file nguồn (tự mất hiệu lực khi file hoặc engine/cột/tham số đổi)."""
+    engine = engine or excel_engine()
+    params = dict(kwargs, columns=None if columns is None else sorted({str(c).strip() for c in columns}),
+                  compact=compact, engine=engine)
+    return cached_frame(path, lambda: read_excel(path, columns, compact, engine, **kwargs),
+                        max_bytes=max_bytes, **params)
+
+
+def sheet_columns(path, sheet_name=0, skiprows=None):
+    """Tên cột của sheet (chỉ đọc dòng header, cache theo phiên bản file)."""
+    return cached_object(path, lambda: list(read_excel(path, compact=False, sheet_name=sheet_name,
+                                                       skiprows=skiprows, nrows=0).columns),
+                         sheet_name=sheet_name, skiprows=skiprows)
+
+
+def open_workbook(path, engine=None):
+    """Mở workbook 1 lần để parse nhiều sheet (parse_sheet)."""
+    return pd.ExcelFile(path, engine=engine or excel_engine())
+
+
+def parse_sheet(xls, sheet_name, columns=None, compact=True, **kwargs):
+    """Như read_excel nhưng trên workbook đã mở bằng open_workbook."""
+    if columns is not None:
+        kwargs['usecols'] = column_filter(columns)
+    df = xls.parse(sheet_name, **kwargs)
+    return compact_dtypes(df) if compact else df
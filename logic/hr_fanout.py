@@ -0,0 +1,222 @@
+import functools
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from logic import instrumentation
+
+FANOUT_MANIFEST_FILE = ".hr_fanout.json"
+FANOUT_TMP_DIR = ".hr_fanout_tmp"
+FANOUT_WORKERS = min(8, os.cpu_count() or 4)
+NA_OWNER = "NA"
+
+
+def sanitize_filename(name: str) -> str:
+    return re.sub(r'[<>:"/\\|?*]', '_', str(name))
+
+
+def hr_file_name(sso) -> str:
+    return f"HR_{sanitize_filename(sso)}.xlsx"
+
+
+def fast_to_excel(path: str, df: pd.DataFrame, sheet_name: str = "master_data") -> None:
+    # xlsxwriter nhanh hơn openpyxl với write-only
+    with pd.ExcelWriter(path, engine="xlsxwriter", engine_kwargs={'options': {"strings_to_formulas": False}}) as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+
+
+def _write_with_template(path, df, template_path, sheet_name, header_skip_rows, keep_formula_columns, engine):
+    from logic import write_preserving_formulas_and_styles
+    write_preserving_formulas_and_styles(template_path, path, df, sheet_name, header_skip_rows,
+                                         keep_formula_columns, engine=engine)
+
+
+def template_writer(template_path, sheet_name, header_skip_rows, keep_formula_columns, engine="xml"):
+    """Writer (path, df) ghi theo template giữ công thức/style; pickle được để chạy trong process pool."""
+    return functools.partial(_write_with_template, template_path=os.path.abspath(template_path),
+                             sheet_name=sheet_name, header_skip_rows=header_skip_rows,
+                             keep_formula_columns=tuple(keep_formula_columns), engine=engine)
+
+
+def _writer_ident(writer):
+    """Định danh writer để đổi writer/tham số (vd. template) thì hash đổi -> ghi lại toàn bộ."""
+    if isinstance(writer, functools.partial):
+        parts = [_writer_ident(writer.func), repr(writer.args), repr(sorted(writer.keywords.items()))]
+        # Template đổi nội dung cũng phải ghi lại
+        for value in list(writer.args) + list(writer.keywords.values()):
+            if isinstance(value, str) and os.path.isfile(value):
+                st = os.stat(value)
+                parts.append(f"{value}:{st.st_size}:{st.st_mtime_ns}")
+        return "|".join(parts)
+    return f"{getattr(writer, '__module__', '')}.{getattr(writer, '__qualname__', repr(writer))}"
+
+
+def _file_stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # Không có/hỏng -> coi như lần đầu, ghi lại toàn bộ
+        return {}
+
+
+def _save_manifest(path, entries):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _write_one(writer, path, df):
+    # Ghi ra file tạm trong thư mục con (watcher không recursive -> bỏ qua) rồi replace: watcher chỉ thấy 1 lần đổi
+    tmp_dir = os.path.join(os.path.dirname(path), FANOUT_TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, f"{os.getpid()}.{os.path.basename(path)}")
+    try:
+        writer(tmp_path, df)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+class _Done:
+    """Kết quả chạy inline có cùng giao diện result() như Future."""
+
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def _run_inline(func, *args):
+    try:
+        return _Done(func(*args))
+    except Exception as e:
+        return _Done(error=e)
+
+
+def _group_hashes(df, groups, prefix):
+    """SHA1 nội dung từng nhóm: hash từng dòng 1 lần cho cả frame (vector hóa) rồi gộp theo nhóm."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    result = {}
+    for key, positions in groups.items():
+        h = hashlib.sha1(prefix)
+        h.update(row_hashes[positions].tobytes())
+        result[key] = h.hexdigest()
+    return result
+
+
+def write_hr_files(df, out_dir, writer=fast_to_excel, sso_col="SSO", max_workers=FANOUT_WORKERS,
+                   executor="process", delete_stale=True, manifest_path=None):
+    """Tách df thành HR_<sso>.xlsx theo sso_col, chỉ ghi lại file có nội dung đổi.
+
+    So hash nội dung từng nhóm SSO với manifest của lần chạy trước; file không đổi (và chưa bị sửa
+    từ bên ngoài) được giữ nguyên nên mtime không đổi và watcher không bị kích hoạt. File của owner
+    không còn trong df bị xóa (chỉ file do hàm này tạo ra). writer(path, df) phải pickle được nếu
+    executor="process" (hàm cấp module hoặc functools.partial, vd. template_writer(...)).
+
+    Trả về dict: written / unchanged / deleted (list SSO), failed ({sso: lỗi}), files ({sso: path}).
+    """
+    if sso_col not in df.columns:
+        raise ValueError(f"Missing owner column '{sso_col}'")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(out_dir, FANOUT_MANIFEST_FILE)
+    old_entries = _load_manifest(manifest_path)
+
+    with instrumentation.stage("fanout_hash") as st:
+        # groupby 1 lần, chỉ lấy vị trí dòng của từng nhóm
+        codes, uniques = pd.factorize(df[sso_col], use_na_sentinel=False)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        groups = {int(codes[part[0]]): part for part in np.split(order, bounds) if len(part)}
+        owners = {code: (NA_OWNER if pd.isna(sso) else str(sso)) for code, sso in enumerate(uniques)}
+        prefix = "\0".join([_writer_ident(writer)] + [f"{c}:{t}" for c, t in zip(df.columns, df.dtypes)])
+        hashes = _group_hashes(df, groups, prefix.encode('utf-8'))
+        st.add("rows", len(df))
+        st.add("owners", len(groups))
+
+    result = {'written': [], 'unchanged': [], 'deleted': [], 'failed': {}, 'files': {}}
+    entries = {}
+    to_write = []
+    for code, positions in groups.items():
+        owner = owners[code]
+        file_name = hr_file_name(owner)
+        path = os.path.join(out_dir, file_name)
+        result['files'][owner] = path
+        entry = old_entries.get(file_name)
+        if entry and entry.get('hash') == hashes[code] and entry.get('stat') == _file_stat(path):
+            entries[file_name] = entry
+            result['unchanged'].append(owner)
+        else:
+            to_write.append((owner, file_name, path, positions, hashes[code]))
+
+    with instrumentation.stage("fanout_write") as st:
+        if to_write:
+            workers = max(1, min(max_workers, len(to_write)))
+            if workers == 1:
+                pool = None
+                futures = [_run_inline(_write_one, writer, path, df.iloc[positions])
+                           for _, _, path, positions, _ in to_write]
+            else:
+                pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+                pool = pool_cls(max_workers=workers)
+                futures = [pool.submit(_write_one, writer, path, df.iloc[positions])
+                           for _, _, path, positions, _ in to_write]
+            try:
+                for (owner, file_name, path, positions, digest), future in zip(to_write, futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        # Không ghi manifest cho file lỗi -> lần sau ghi lại
+                        result['failed'][owner] = str(e)
+                        continue
+                    entries[file_name] = {'sso': owner, 'hash': digest, 'rows': len(positions),
+                                          'stat': _file_stat(path)}
+                    result['written'].append(owner)
+                    st.add("rows", len(positions))
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+        st.add("files", len(result['written']))
+
+    # Owner không còn trong dữ liệu -> xóa file cũ (chỉ file có trong manifest)
+    for file_name, entry in old_entries.items():
+        owner = entry.get('sso', file_name)
+        if file_name in entries or owner in result['files']:
+            continue
+        if not delete_stale:
+            entries[file_name] = entry
+            continue
+        try:
+            os.remove(os.path.join(out_dir, file_name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Giữ trong manifest để lần sau xóa lại
+            result['failed'][owner] = str(e)
+            entries[file_name] = entry
+            continue
+        result['deleted'].append(owner)
+
+    _save_manifest(manifest_path, entries)
+    return result
+
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha1(file_path, chunk_size=1 << 20):
+    """Tính SHA1 nội dung file (đọc theo chunk để không tốn bộ nhớ)."""
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class HRFileManifest:
+    """Manifest lưu (size, mtime, hash) và frame đã chuẩn hóa của từng file HR giữa các lần chạy."""
+
+    def __init__(self, manifest_dir):
+        self.manifest_dir = manifest_dir
+        self.manifest_path = os.path.join(manifest_dir, MANIFEST_FILE)
+        os.makedirs(manifest_dir, exist_ok=True)
+        self.entries = {}
+        self._orphans = []
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                # Manifest hỏng -> coi như chạy lại từ đầu
+                self.entries = {}
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.normcase(os.path.abspath(file_path))
+
+    def _frame_path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.manifest_dir, f"{name}.pkl")
+
+    def lookup(self, file_path, params=None):
+        """Trả về frame đã lưu nếu file chưa đổi và được đọc với cùng params (vd. danh sách cột), ngược lại None."""
+        key = self._key(file_path)
+        entry = self.entries.get(key)
+        if entry is None or entry.get('params') != params:
+            return None
+        frame_path = self._frame_path(key)
+        if not os.path.exists(frame_path):
+            return None
+
+        st = os.stat(file_path)
+        if st.st_size != entry['size'] or st.st_mtime_ns != entry['mtime_ns']:
+            # size/mtime đổi nhưng nội dung có thể giống (file chỉ được save lại)
+            if st.st_size != entry['size'] or file_sha1(file_path) != entry['sha1']:
+                return None
+            entry['mtime_ns'] = st.st_mtime_ns
+
+        try:
+            return pd.read_pickle(frame_path)
+        except Exception:
+            return None
+
+    def update(self, file_path, frame, params=None):
+        """Ghi nhận trạng thái hiện tại của file cùng frame đã chuẩn hóa (đọc với params)."""
+        key = self._key(file_path)
+        st = os.stat(file_path)
+        frame_path = self._frame_path(key)
+        tmp_path = f"{frame_path}.tmp"
+        frame.to_pickle(tmp_path)
+        os.replace(tmp_path, frame_path)
+        self.entries[key] = {
+            'path': file_path,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha1': file_sha1(file_path),
+            'params': params,
+        }
+
+    def load_frame(self, key):
+        try:
+            return pd.read_pickle(self._frame_path(key))
+        except Exception:
+            return None
+
+    def prune(self, current_paths):
+        """Xóa các entry của file không còn tồn tại. Trả về {key: frame} của các file đã bị xóa."""
+        current_keys = {self._key(p) for p in current_paths}
+        removed = {}
+        for key in list(self.entries):
+            if key in current_keys:
+                continue
+            frame = self.load_frame(key)
+            if frame is not None:
+                removed[key] = frame
+            del self.entries[key]
+            # Chỉ xóa frame sau khi manifest đã được save thành công
+            self._orphans.append(self._frame_path(key))
+        return removed
+
+    def save(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        for frame_path in self._orphans:
+            try:
+                os.remove(frame_path)
+            except OSError:
+                pass
+        self._orphans = []
@@ -0,0 +1,248 @@
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+NATIONAL_ID_COL = "National ID (SSN/SIN) (National Identifiers)"
+EMP_ID_COLUMNS = ["WD EE ID", "Emp ID", "Emp id", "Employee Id"]
+
+# float < 1e16 có str() dạng 'N.0' (không scientific) -> đổi thẳng sang int
+_FLOAT_EXACT_LIMIT = 1e16
+
+
+def _clean_id_value(x):
+    """
+    Chuyển 1 ô (có thể int/float/str) về chuỗi chỉ chứa chữ số, xử lý .0 và scientific.
+    Trả về pd.NA nếu rỗng. Bản từng ô gốc: dùng cho các giá trị hiếm không đi được đường vector hóa.
+    """
+    if pd.isna(x):
+        return pd.NA
+    s = str(x).strip()
+
+    # float hiển thị như '75203213222.0' hoặc scientific '7.52032e+11'
+    # nếu có 'e' hoặc 'E', format lại bằng float -> không mất precision cho 22 chữ số
+    if 'e' in s or 'E' in s:
+        try:
+            s = '{:.0f}'.format(float(x))
+        except Exception:
+            pass
+
+    # loại .0 cuối cùng (ví dụ '75203213222.0' -> '75203213222')
+    if s.endswith('.0'):
+        s = s[:-2]
+
+    # giữ lại chữ số
+    s = re.sub(r'\D+', '', s)
+
+    return s if s != '' else pd.NA
+
+
+def _clean_ints(values):
+    # str(int) chỉ có thể thêm dấu '-' -> bỏ dấu là xong
+    return pd.Series(values.astype(str), dtype=object).str.lstrip('-').to_numpy()
+
+
+def _clean_floats(values, out, mask):
+    """Điền out[mask] cho mảng float64: số nguyên < 1e16 đi đường numpy. Trả về vị trí cần xử lý từng ô."""
+    with np.errstate(invalid='ignore'):
+        fast = mask & np.isfinite(values) & (np.abs(values) < _FLOAT_EXACT_LIMIT) & (values == np.floor(values))
+    if fast.any():
+        out[fast] = np.abs(values[fast]).astype(np.int64).astype(str)
+    # Phần lẻ, scientific, inf -> từng ô
+    return np.flatnonzero(mask & ~fast)
+
+
+def _clean_strings(strings):
+    """_clean_id_value cho Series object chỉ chứa str, trả về mảng object (chuỗi chữ số hoặc pd.NA)."""
+    cleaned = strings.to_numpy(copy=True)
+    # Ô đã toàn chữ số (isdecimal <=> toàn \d) thì làm sạch không đổi gì -> chỉ xử lý phần còn lại
+    rest = np.flatnonzero(~strings.str.isdecimal().to_numpy(dtype=bool))
+    if not len(rest):
+        return cleaned
+    s = strings.iloc[rest]
+    # Chuỗi có 'e'/'E' có thể là scientific -> đi bản từng ô (float(x))
+    sci = s.str.contains('e', case=False, regex=False).to_numpy(dtype=bool)
+    s = s[~sci].str.strip()
+    ends = s.str.endswith('.0').to_numpy(dtype=bool)
+    if ends.any():
+        s[ends] = s[ends].str[:-2]
+    # re.sub của Python (không dùng regex pyarrow) -> \D giống hệt bản từng ô, kể cả chữ số Unicode
+    s = s.str.replace(r'\D+', '', regex=True).to_numpy(dtype=object, copy=True)
+    s[s == ''] = pd.NA
+    cleaned[rest[~sci]] = s
+    for i in rest[sci]:
+        cleaned[i] = _clean_id_value(cleaned[i])
+    return cleaned
+
+
+def _vector_kind(dtype):
+    """Loại dtype có đường vector hóa: 'int', 'float', 'str' (object/string); None -> map từng ô."""
+    if isinstance(dtype, np.dtype):
+        if dtype.kind in 'iu':
+            return 'int'
+        if dtype == np.float64:
+            return 'float'
+        if dtype == object:
+            return 'str'
+        return None
+    if isinstance(dtype, pd.StringDtype):
+        return 'str'
+    return None
+
+
+def _str_mask(values, valid):
+    """Vị trí các ô là str (không NA) trong mảng object."""
+    if pd.api.types.infer_dtype(values, skipna=True) == 'string':
+        return valid
+    return np.fromiter((type(v) is str for v in values), dtype=bool, count=len(values)) & valid
+
+
+def _zfill(values, width, na_value):
+    """str.zfill(width) cho mảng object chỉ chứa chuỗi chữ số hoặc NA; NA được thay bằng na_value."""
+    padded = values.copy()
+    na = pd.isna(values)
+    padded[na] = na_value
+    idx = np.flatnonzero(~na)
+    lengths = np.fromiter(map(len, values[idx]), dtype=np.int64, count=len(idx))
+    short = idx[lengths < width]
+    padded[short] = [v.zfill(width) for v in values[short]]
+    return padded
+
+
+def _clean_id_array(ser: pd.Series) -> np.ndarray:
+    """Mảng object: chuỗi chữ số hoặc pd.NA, cùng kết quả với ser.map(_clean_id_value)."""
+    n = len(ser)
+    out = np.full(n, pd.NA, dtype=object)
+    na = ser.isna().to_numpy(dtype=bool)
+    valid = ~na
+    if not valid.any():
+        return out
+
+    kind = _vector_kind(ser.dtype)
+    if kind is None:
+        # dtype khác (bool, Int64 nullable, datetime, category...): map từng ô như cũ để giữ nguyên
+        # cách pandas truyền giá trị vào hàm (vd. Int64 có NA được truyền dưới dạng float)
+        return ser.map(_clean_id_value).to_numpy(dtype=object)
+    if kind == 'int':
+        out[valid] = _clean_ints(ser.to_numpy()[valid])
+    elif kind == 'float':
+        values = ser.to_numpy()
+        for i in _clean_floats(values, out, valid):
+            out[i] = _clean_id_value(values[i])
+    else:
+        values = ser.astype(object).to_numpy()
+        is_str = _str_mask(values, valid)
+        if is_str.any():
+            out[is_str] = _clean_strings(pd.Series(values[is_str], dtype=object))
+        # Ô không phải str trong cột object (số, ngày...) -> từng ô
+        for i in np.flatnonzero(valid & ~is_str):
+            out[i] = _clean_id_value(values[i])
+    return out
+
+
+def normalize_id_series(ser: pd.Series, expected_len: int | None = None) -> pd.Series:
+    """
+    Chuyển series về chuỗi chữ số (string), remove non-digits, optional zfill tới expected_len.
+    Xử lý đúng các giá trị float hiển thị dạng '... .0' hoặc scientific notation để KHÔNG sinh thêm số 0.
+    """
+    # Dựng Series từ mảng object (pandas suy luận dtype giống kết quả ser.map) rồi astype như bản cũ
+    values = _clean_id_array(ser)
+    cleaned = pd.Series(values, index=ser.index, name=ser.name).astype("string")
+    # Series rỗng: map của bản cũ giữ nguyên dtype string
+    if expected_len is not None and len(cleaned):
+        cleaned = pd.Series(_zfill(values, expected_len, cleaned.dtype.na_value), index=ser.index, name=ser.name)
+    return cleaned
+
+
+def normalize_emp_id_columns(df: pd.DataFrame, cols=None, dst_col: str = "Emp id") -> pd.DataFrame:
+    """
+    Chuẩn hóa và gộp dữ liệu Emp id dựa trên các cột đầu vào (mặc định EMP_ID_COLUMNS).
+
+    - Giữ nguyên các cột gốc, chỉ cập nhật cột đích `dst_col`.
+    - Làm sạch giá trị (chỉ còn chữ số), bảo toàn leading zero.
+    - Quy tắc gộp: ưu tiên theo thứ tự cột trong `cols`; lấy giá trị
+      non-null đầu tiên sau khi làm sạch.
+    """
+    if cols is None:
+        cols = EMP_ID_COLUMNS
+
+    # Tạo bản sao nhẹ các series đã làm sạch (không làm thay đổi cột gốc)
+    cleaned_series = []
+    for col in cols:
+        if col in df.columns:
+            cleaned_series.append(normalize_id_series(df[col], expected_len=None))
+        else:
+            cleaned_series.append(pd.Series([pd.NA] * len(df), index=df.index, dtype="string"))
+
+    # Coalesce theo thứ tự ưu tiên
+    if cleaned_series:
+        coalesced = cleaned_series[0]
+        for s in cleaned_series[1:]:
+            coalesced = coalesced.fillna(s)
+        df[dst_col] = coalesced
+        logger.info(
+            f"Normalized '{dst_col}' from columns: " + ", ".join([c for c in cols if c in df.columns])
+        )
+    else:
+        # Không có cột nào để xử lý
+        if dst_col not in df.columns:
+            df[dst_col] = pd.Series([pd.NA] * len(df), index=df.index, dtype="string")
+        logger.warning("No ID columns found to normalize for Emp id.")
+
+    return df
+
+
+def _is_valid_id(x):
+    if pd.isna(x):
+        return False
+    return bool(re.match(r'^\d+$', str(x)))
+
+
+def valid_id_mask(ser: pd.Series) -> pd.Series:
+    """True cho ô không rỗng mà str(x) khớp r'^\\d+$' (giống re.match của bản cũ, kể cả '\\n' cuối)."""
+    kind = _vector_kind(ser.dtype)
+    if kind is None:
+        return ser.map(_is_valid_id).astype(bool)
+    valid = ~ser.isna().to_numpy(dtype=bool)
+    mask = np.zeros(len(ser), dtype=bool)
+    if kind == 'int':
+        # str(int) toàn chữ số trừ khi âm
+        mask = valid & (ser.to_numpy() >= 0)
+    elif kind == 'str' and valid.any():
+        values = ser.astype(object).to_numpy()
+        is_str = _str_mask(values, valid)
+        if is_str.any():
+            strings = pd.Series(values[is_str], dtype=object)
+            # isdecimal <=> toàn \d; phần còn lại vẫn có thể khớp (vd. '\n' cuối) -> re.match của Python
+            matched = strings.str.isdecimal().to_numpy(dtype=bool, copy=True)
+            rest = np.flatnonzero(~matched)
+            if len(rest):
+                matched[rest] = strings.iloc[rest].str.match(r'^\d+$').to_numpy(dtype=bool)
+            mask[is_str] = matched
+        for i in np.flatnonzero(valid & ~is_str):
+            mask[i] = _is_valid_id(values[i])
+    # kind == 'float': str(float) luôn có '.', 'e', 'inf' hoặc 'nan' -> không bao giờ hợp lệ
+    return pd.Series(mask, index=ser.index)
+
+
+def clean_lineup(lineup, nat_col: str = NATIONAL_ID_COL):
+    """Chỉ giữ các dòng có National ID toàn chữ số, bỏ trùng (giữ dòng đầu)."""
+    valid = valid_id_mask(lineup[nat_col])
+
+    # Đếm số bản ghi lỗi trước khi làm sạch
+    invalid_count = int((~valid).sum())
+    if invalid_count > 0:
+        logger.warning(f"Found {invalid_count} invalid National IDs (non-numeric) in lineup. Removing them.")
+
+    # Giữ lại chỉ các bản ghi có National ID hợp lệ
+    lineup = lineup[valid]
+
+    # Loại bỏ trùng lặp
+    if lineup[nat_col].duplicated().any():
+        logger.warning(f"Found duplicates in {nat_col} in lineup. Keeping first occurrence.")
+        lineup = lineup.drop_duplicates(subset=[nat_col], keep='first')
+
+    return lineup
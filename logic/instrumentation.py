@@ -0,0 +1,338 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:  # psutil không bắt buộc -> Linux đọc /proc, nơi khác không đo RSS
+    psutil = None
+
+# Thư mục ghi metrics; rỗng/không đặt -> tắt. Đặt qua env để process con (ProcessPool spawn) cũng thấy.
+METRICS_DIR_ENV = "HR_METRICS_DIR"
+JSONL_FILE = "hr_metrics.jsonl"
+PROM_PREFIX = "hr_merge"
+# Lấy mẫu RSS mỗi N giây trong lúc run/capture đang chạy (cộng thêm mẫu ở đầu/cuối run và cuối mỗi stage)
+RSS_SAMPLE_INTERVAL = 0.1
+
+_state = {'dir': os.environ.get(METRICS_DIR_ENV) or None}
+_local = threading.local()
+_emit_lock = threading.Lock()
+_run_totals = {}  # (run, status) -> số lần chạy, cho counter Prometheus
+
+
+def configure(metrics_dir):
+    """Bật ghi metrics vào metrics_dir (None/"" -> tắt)."""
+    metrics_dir = metrics_dir or None
+    _state['dir'] = metrics_dir
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        os.environ[METRICS_DIR_ENV] = metrics_dir
+    else:
+        os.environ.pop(METRICS_DIR_ENV, None)
+
+
+def enabled():
+    return _state['dir'] is not None
+
+
+def current_rss_bytes():
+    """RSS hiện tại của process; None nếu không đo được."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class _RssSampler(threading.Thread):
+    """Thread nền lấy mẫu RSS trong lúc 1 run chạy; peak là mẫu lớn nhất của riêng run đó.
+
+    ru_maxrss/peak_wset là peak suốt đời process: trong watcher/daemon chạy lâu, mọi run sau run lớn nhất sẽ
+    báo lại con số cũ, nên phải tự lấy mẫu.
+    """
+
+    def __init__(self):
+        super().__init__(name="hr-metrics-rss", daemon=True)
+        self.peak = current_rss_bytes()
+        self._stop_event = threading.Event()
+        if self.peak is not None:
+            self.start()
+
+    def sample(self):
+        rss = current_rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def run(self):
+        while not self._stop_event.wait(RSS_SAMPLE_INTERVAL):
+            self.sample()
+
+    def stop(self):
+        """Dừng lấy mẫu, trả về peak RSS (byte) trong run."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.sample()
+        return self.peak
+
+
+class RunMetrics:
+    """Số liệu của 1 lần chạy: thời gian từng stage (cộng dồn theo tên), các counter rows/bytes và peak RSS
+    trong run (của process này và của phần việc chạy ở process con, xem capture())."""
+
+    def __init__(self, name):
+        self.name = name
+        self.pid = os.getpid()
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.seconds = None
+        self.status = 'ok'
+        self.stages = {}  # stage -> {'seconds', 'calls', <counter>...} (stage chỉ có counter thì không có seconds)
+        self.gauges = {}
+        self.peak_rss_bytes = None
+        self.peak_rss_children_bytes = None
+        self._rss = _RssSampler()
+
+    def _stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {}
+        return stage
+
+    def add_time(self, stage, seconds):
+        self._rss.sample()
+        entry = self._stage(stage)
+        entry['seconds'] = entry.get('seconds', 0.0) + seconds
+        entry['calls'] = entry.get('calls', 0) + 1
+
+    def add(self, stage, kind, value=1):
+        entry = self._stage(stage)
+        entry[kind] = entry.get(kind, 0) + value
+
+    def merge(self, stages, peak_rss_bytes=None):
+        """Cộng dồn stages lấy từ process con (xem capture()); peak RSS con lấy max."""
+        for name, values in (stages or {}).items():
+            entry = self._stage(name)
+            for kind, value in values.items():
+                entry[kind] = entry.get(kind, 0) + value
+        if peak_rss_bytes is not None:
+            self.peak_rss_children_bytes = max(self.peak_rss_children_bytes or 0, peak_rss_bytes)
+
+    def stop_sampling(self):
+        self.peak_rss_bytes = self._rss.stop()
+
+    def finish(self, status='ok'):
+        self.seconds = time.perf_counter() - self._start
+        self.status = status
+        self.stop_sampling()
+
+    def to_record(self):
+        return {
+            'ts': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+            'run': self.name,
+            'status': self.status,
+            'seconds': round(self.seconds or 0.0, 6),
+            'peak_rss_bytes': self.peak_rss_bytes,
+            'peak_rss_children_bytes': self.peak_rss_children_bytes,
+            'stages': {name: {k: (round(v, 6) if isinstance(v, float) else v) for k, v in values.items()}
+                       for name, values in self.stages.items()},
+            'gauges': dict(self.gauges),
+        }
+
+
+class _NullStage:
+    """Dùng khi tắt metrics hoặc ngoài run: mọi thao tác là no-op."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, kind, value=1):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('run', 'name', '_start')
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.run.add_time(self.name, time.perf_counter() - self._start)
+        return False
+
+    def add(self, kind, value=1):
+        self.run.add(self.name, kind, value)
+
+
+def current_run():
+    return getattr(_local, 'run', None)
+
+
+def stage(name):
+    """Đo thời gian 1 stage của run hiện tại: `with stage("read_excel") as s: ...; s.add("rows", n)`."""
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return _NULL_STAGE
+    return _Stage(run, name)
+
+
+def count(stage_name, kind, value=1):
+    """Cộng counter (rows, bytes_read, bytes_written, hits...) cho stage của run hiện tại."""
+    run = getattr(_local, 'run', None)
+    if run is not None:
+        run.add(stage_name, kind, value)
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+@contextmanager
+def locked(lock, stage_name="lock_wait"):
+    """Giữ lock (FileLock/threading.Lock) và ghi thời gian chờ lấy lock vào stage_name."""
+    with stage(stage_name):
+        lock.acquire()
+    try:
+        yield lock
+    finally:
+        lock.release()
+
+
+@contextmanager
+def run(name):
+    """1 lần chạy có đo đạc; khi kết thúc ghi 1 dòng JSON và file Prometheus. Lồng nhau -> dùng run ngoài."""
+    if not enabled() or getattr(_local, 'run', None) is not None:
+        yield getattr(_local, 'run', None)
+        return
+    metrics = _local.run = RunMetrics(name)
+    status = 'error'
+    try:
+        yield metrics
+        # Caller có thể tự đặt metrics.status = 'error' khi lỗi đã được xử lý (không raise)
+        status = metrics.status
+    finally:
+        _local.run = None
+        metrics.finish(status)
+        try:
+            emit(metrics)
+        except OSError as e:
+            logging.warning(f"Cannot write metrics to {_state['dir']}: {e}")
+
+
+class _Capture:
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def export(self):
+        """Gửi về process cha cho merge_stages(): stages + peak RSS của phần việc trong process con."""
+        if self.metrics is None:
+            return None
+        self.metrics.stop_sampling()
+        return {'stages': self.metrics.stages, 'peak_rss_bytes': self.metrics.peak_rss_bytes}
+
+
+@contextmanager
+def capture():
+    """Gom stage trong process con (không có run của process cha); gửi export() về để merge_stages()."""
+    previous = getattr(_local, 'run', None)
+    # Process con tạo bằng fork vẫn mang bản sao run của process cha -> coi như không có
+    if not enabled() or (previous is not None and previous.pid == os.getpid()):
+        yield _Capture(None)
+        return
+    metrics = _local.run = RunMetrics('capture')
+    try:
+        yield _Capture(metrics)
+    finally:
+        _local.run = previous
+        metrics.stop_sampling()
+
+
+def merge_stages(captured):
+    """Cộng kết quả _Capture.export() của process con vào run hiện tại."""
+    run_metrics = getattr(_local, 'run', None)
+    if run_metrics is not None and captured:
+        run_metrics.merge(captured['stages'], captured['peak_rss_bytes'])
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _prometheus_text(record, totals):
+    run_label = f'run="{_label(record["run"])}"'
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        full = f"{PROM_PREFIX}_{name}"
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        for labels, value in samples:
+            lines.append(f"{full}{{{labels}}} {value}")
+
+    metric("last_run_timestamp_seconds", "gauge", "Thời điểm bắt đầu lần chạy gần nhất.",
+           [(run_label, datetime.fromisoformat(record['ts']).timestamp())])
+    metric("last_run_duration_seconds", "gauge", "Thời gian lần chạy gần nhất.", [(run_label, record['seconds'])])
+    metric("last_run_success", "gauge", "1 nếu lần chạy gần nhất thành công.",
+           [(run_label, 1 if record['status'] == 'ok' else 0)])
+    metric("runs_total", "counter", "Số lần chạy từ khi process khởi động.",
+           [(f'{run_label},status="{_label(status)}"', n) for (name, status), n in sorted(totals.items())
+            if name == record['run']])
+    if record['peak_rss_bytes'] is not None:
+        metric("peak_rss_bytes", "gauge", "Peak RSS của process trong lần chạy gần nhất.",
+               [(run_label, record['peak_rss_bytes'])])
+    if record['peak_rss_children_bytes'] is not None:
+        metric("peak_rss_children_bytes", "gauge", "Peak RSS lớn nhất của process con trong lần chạy gần nhất.",
+               [(run_label, record['peak_rss_children_bytes'])])
+
+    kinds = sorted({k for values in record['stages'].values() for k in values})
+    for kind in kinds:
+        samples = [(f'{run_label},stage="{_label(name)}"', values[kind])
+                   for name, values in sorted(record['stages'].items()) if kind in values]
+        if kind == 'seconds':
+            metric("stage_duration_seconds", "gauge", "Tổng thời gian của stage trong lần chạy gần nhất.", samples)
+        else:
+            metric(f"stage_{kind}", "gauge", f"Counter {kind} của stage trong lần chạy gần nhất.", samples)
+    for name, value in sorted(record['gauges'].items()):
+        metric(name, "gauge", f"{name} tại cuối lần chạy gần nhất.", [(run_label, value)])
+    return "\n".join(lines) + "\n"
+
+
+def emit(metrics):
+    """Ghi RunMetrics: nối 1 dòng vào hr_metrics.jsonl và thay file <prefix>_<run>.prom (textfile collector)."""
+    metrics_dir = _state['dir']
+    if metrics_dir is None:
+        return
+    record = metrics.to_record()
+    with _emit_lock:
+        key = (record['run'], record['status'])
+        _run_totals[key] = _run_totals.get(key, 0) + 1
+        os.makedirs(metrics_dir, exist_ok=True)
+        with open(os.path.join(metrics_dir, JSONL_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # node_exporter có thể đọc giữa chừng -> ghi file tạm rồi os.replace
+        prom_path = os.path.join(metrics_dir, f"{PROM_PREFIX}_{record['run']}.prom")
+        tmp_path = f"{prom_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(_prometheus_text(record, _run_totals))
+        os.replace(tmp_path, prom_path)
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+
+FULL = "full"
+EVENT = "event"
+
+
+class SettleTracker:
+    """Debounce event file theo path, dùng chung cho MergeWorker (watcher) và MergeJobQueue (daemon).
+
+    File chỉ được coi là đã yên khi không có event mới và size/mtime không đổi trong settle_seconds (file bị
+    xóa/đổi tên trước khi yên thì bỏ). Các file đã yên gom thành 1 lô, chờ tới khi mọi file đang theo dõi đều
+    yên, trừ khi file đầu tiên đã chờ quá max_batch_delay. File trả về từ take() không cần kiểm tra ổn định lại.
+    """
+
+    def __init__(self, settle_seconds=2.0, max_batch_delay=30.0):
+        self.settle_seconds = settle_seconds
+        self.max_batch_delay = max_batch_delay
+        # path -> {'first_event', 'changed_at', 'stat'} (monotonic)
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, path, event_time=None):
+        event_time = event_time if event_time is not None else time.monotonic()
+        entry = self.pending.get(path)
+        if entry is None:
+            self.pending[path] = {'first_event': event_time, 'changed_at': event_time, 'stat': None}
+        else:
+            # Event mới của cùng file -> reset timer (debounce)
+            entry['changed_at'] = max(entry['changed_at'], event_time)
+
+    def clear(self):
+        """Bỏ mọi file đang chờ, trả về danh sách path (đã sắp xếp)."""
+        paths, self.pending = sorted(self.pending), {}
+        return paths
+
+    def _settled_paths(self, now):
+        """Trả về các file đã ổn định (size/mtime không đổi trong settle_seconds)."""
+        settled = []
+        for path, entry in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # File đã bị xóa/đổi tên trước khi kịp merge
+                del self.pending[path]
+                continue
+            stat = (st.st_size, st.st_mtime_ns)
+            if stat != entry['stat']:
+                entry['stat'] = stat
+                entry['changed_at'] = now
+            elif now - entry['changed_at'] >= self.settle_seconds:
+                settled.append(path)
+        return settled
+
+    def take(self):
+        """Lô file đã yên: (path đã sắp xếp, thời điểm event đầu của từng file); ([], []) khi chưa có lô."""
+        if not self.pending:
+            return [], []
+        now = time.monotonic()
+        settled = self._settled_paths(now)
+        if not settled:
+            return [], []
+        # Chờ cả đợt ổn định để gộp thành 1 lần merge, trừ khi đã chờ quá lâu
+        oldest = min(entry['first_event'] for entry in self.pending.values())
+        if len(settled) < len(self.pending) and now - oldest < self.max_batch_delay:
+            return [], []
+        batch = sorted(settled)
+        return batch, [self.pending.pop(path)['first_event'] for path in batch]
+
+    def wait_time(self):
+        """Số giây tới lần take() kế tiếp có thể ra lô (gọi sau take()); None khi không có file nào chờ."""
+        if not self.pending:
+            return None
+        now = time.monotonic()
+        unsettled = [entry['changed_at'] for entry in self.pending.values()
+                     if now - entry['changed_at'] < self.settle_seconds]
+        wait = min(unsettled) + self.settle_seconds - now if unsettled else self.settle_seconds
+        if len(unsettled) < len(self.pending):
+            # Đã có file yên -> không chờ quá max_batch_delay tính từ event đầu tiên
+            oldest = min(entry['first_event'] for entry in self.pending.values())
+            wait = min(wait, oldest + self.max_batch_delay - now)
+        return max(wait, 0.05)
+
+
+class MergeJobQueue:
+    """Hàng đợi job merge (asyncio) gộp việc trùng lặp.
+
+    - Event file được debounce bằng SettleTracker (cùng cách MergeWorker của watcher): file yên (không có event
+      mới, size/mtime không đổi trong settle_seconds) gom thành 1 job, trừ khi file đầu tiên đã chờ quá
+      max_batch_delay.
+    - Nhiều yêu cầu merge đầy đủ đang chờ gộp thành 1, và job đầy đủ hấp thụ mọi event đang chờ
+      (merge đầy đủ đọc lại toàn bộ thư mục HR nên event merge riêng là thừa).
+    Chỉ dùng từ thread của event loop (thread khác gọi qua loop.call_soon_threadsafe).
+    """
+
+    def __init__(self, settle_seconds=2.0, max_batch_delay=30.0):
+        self.tracker = SettleTracker(settle_seconds, max_batch_delay)
+        self.full_reasons = []
+        self.absorbed = 0
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self.tracker) + (1 if self.full_reasons else 0)
+
+    def add_event(self, path, event_time=None):
+        self.tracker.add(path, event_time)
+        self._wakeup.set()
+
+    def add_full(self, reason):
+        self.full_reasons.append(reason)
+        self._wakeup.set()
+
+    def _take(self):
+        if self.full_reasons:
+            reasons, absorbed = self.full_reasons, self.tracker.clear()
+            self.full_reasons = []
+            self.absorbed += len(absorbed)
+            return (FULL, reasons, absorbed), None
+        settled, first_events = self.tracker.take()
+        if settled:
+            return (EVENT, settled, first_events), None
+        # Ngủ tới lần kiểm tra kế tiếp (file chưa yên sớm nhất hết settle_seconds hoặc hết max_batch_delay)
+        return None, self.tracker.wait_time()
+
+    async def get(self, timeout=None):
+        """Job kế tiếp: (FULL, lý do, path bị hấp thụ) hoặc (EVENT, path đã yên, thời điểm event đầu); None khi hết timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._wakeup.clear()
+            job, wait = self._take()
+            if job is not None:
+                return job
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                wait = remaining if wait is None else min(wait, remaining)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,236 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Xoay file log khi vượt kích thước này (byte), giữ LOG_BACKUPS bản cũ (.1 mới nhất)
+LOG_MAX_BYTES = int(os.environ.get("HR_LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.environ.get("HR_LOG_BACKUPS", 5))
+# Writer nền gom record tối đa LOG_FLUSH_INTERVAL giây hoặc LOG_BATCH_SIZE record rồi ghi 1 lần mỗi file
+LOG_FLUSH_INTERVAL = float(os.environ.get("HR_LOG_FLUSH_INTERVAL", 1.0))
+LOG_BATCH_SIZE = 500
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+_state = {'handler': None, 'writer': None}
+
+
+class JsonFormatter(logging.Formatter):
+    """1 record = 1 dòng JSON: time, level, message + các trường truyền qua extra={'fields': {...}}."""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='seconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'fields', None) or {})
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DuplicateFilter(logging.Filter):
+    """Bỏ record trùng nội dung trong vòng interval giây; lần ghi kế tiếp kèm số bản đã bỏ.
+
+    Gắn vào logger (không phải handler) nên record bị bỏ ngay trên thread gọi, không vào hàng đợi.
+    """
+
+    def __init__(self, interval, max_keys=1024):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self._seen = {}  # message -> [lần ghi cuối (monotonic), số bản đã bỏ]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        message = record.getMessage()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(message)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry is not None else 0
+            if len(self._seen) >= self.max_keys:
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.interval}
+            self._seen[message] = [now, 0]
+        if suppressed:
+            record.msg = f"{message} (+{suppressed} duplicates suppressed)"
+            record.args = None
+        return True
+
+
+class LogWriter(threading.Thread):
+    """Thread nền đọc record từ hàng đợi, gom theo lô và ghi mỗi file 1 lần/lô (xoay file theo kích thước).
+
+    routes: {tên logger: {'file': tên file trong logs_path (None -> không ghi file), 'format': 'json' hoặc
+    format chữ, 'console': có in ra console không}}; logger con dùng route của logger cha gần nhất.
+    Record không thuộc route nào ghi vào default_file (nếu có) và console.
+    """
+
+    def __init__(self, log_queue, logs_path, routes=None, default_file=None, console=True,
+                 flush_interval=LOG_FLUSH_INTERVAL, batch_size=LOG_BATCH_SIZE, max_bytes=LOG_MAX_BYTES,
+                 backups=LOG_BACKUPS):
+        super().__init__(name="hr-log-writer", daemon=True)
+        self.log_queue = log_queue
+        self.logs_path = logs_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.default_route = self._route_spec({'file': default_file, 'console': console})
+        self.routes = {name: self._route_spec(dict(route, console=route.get('console', True) and console))
+                       for name, route in (routes or {}).items()}
+        self._resolved = {}
+
+    def _route_spec(self, route):
+        fmt = route.get('format') or TEXT_FORMAT
+        formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(fmt)
+        path = os.path.join(self.logs_path, route['file']) if route.get('file') else None
+        return path, formatter, bool(route.get('console'))
+
+    def _route(self, name):
+        spec = self._resolved.get(name)
+        if spec is None:
+            lookup = name
+            while lookup not in self.routes and '.' in lookup:
+                lookup = lookup.rsplit('.', 1)[0]
+            spec = self._resolved[name] = self.routes.get(lookup, self.default_route)
+        return spec
+
+    def _next_batch(self):
+        """Chờ record đầu tiên rồi gom thêm tới khi đủ lô, hết flush_interval hoặc gặp ERROR. None -> dừng."""
+        record = self.log_queue.get()
+        if record is None:
+            return None
+        batch = [record]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and record.levelno < logging.ERROR:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                record = self.log_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if record is None:
+                self.log_queue.put(None)  # dừng sau khi ghi nốt lô này
+                break
+            batch.append(record)
+        return batch
+
+    def _rotate(self, path):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    def _write_file(self, path, lines):
+        data = ''.join(lines)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if self.max_bytes and size and size + len(data) > self.max_bytes:
+            self._rotate(path)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(data)
+
+    def write_batch(self, batch):
+        by_file = {}
+        console = []
+        for record in batch:
+            path, formatter, to_console = self._route(record.name)
+            try:
+                line = formatter.format(record) + '\n'
+            except Exception:
+                line = f"{record.levelname} {record.name}: {record.msg!r}\n"
+            if path is not None:
+                by_file.setdefault(path, []).append(line)
+            if to_console:
+                console.append(line)
+        for path, lines in by_file.items():
+            try:
+                self._write_file(path, lines)
+            except OSError as e:
+                console.append(f"Cannot write log {path}: {e}\n")
+        if console:
+            sys.stderr.write(''.join(console))
+            sys.stderr.flush()
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self.write_batch(batch)
+
+    def stop(self):
+        self.log_queue.put(None)
+        self.join()
+
+
+def setup_logging(logs_path, default_file=None, routes=None, level=logging.INFO, console=True, rate_limits=None):
+    """Cấu hình logging dùng chung: root logger -> QueueHandler -> LogWriter nền (xem LogWriter về routes).
+
+    rate_limits: {tên logger: số giây} -> bỏ record trùng nội dung của logger đó trong khoảng thời gian này.
+    Gọi lại sẽ thay cấu hình cũ (ghi nốt record còn trong hàng đợi trước). Trả về LogWriter.
+    """
+    shutdown_logging()
+    os.makedirs(logs_path, exist_ok=True)
+    log_queue = queue.SimpleQueue()
+    writer = LogWriter(log_queue, logs_path, routes=routes, default_file=default_file, console=console)
+    handler = logging.handlers.QueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, interval in (rate_limits or {}).items():
+        logger = logging.getLogger(name)
+        for f in [f for f in logger.filters if isinstance(f, DuplicateFilter)]:
+            logger.removeFilter(f)
+        logger.addFilter(DuplicateFilter(interval))
+    writer.start()
+    _state['handler'], _state['writer'] = handler, writer
+    return writer
+
+
+def shutdown_logging():
+    """Gỡ QueueHandler và chờ writer ghi hết các record còn lại."""
+    handler, writer = _state['handler'], _state['writer']
+    _state['handler'] = _state['writer'] = None
+    if handler is not None:
+        logging.getLogger().removeHandler(handler)
+    if writer is not None and writer.is_alive():
+        writer.stop()
+
+
+class _DirectQueue:
+    """Thay hàng đợi trong process con: ghi record ngay (process con có thể thoát bằng os._exit, không kịp flush)."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._lock = threading.Lock()
+
+    def put_nowait(self, record):
+        with self._lock:
+            self.writer.write_batch([record])
+
+
+def _after_fork_in_child():
+    # Thread writer không tồn tại trong process con tạo bằng fork
+    handler, writer = _state['handler'], _state['writer']
+    if handler is not None:
+        handler.queue = _DirectQueue(writer)
+        _state['writer'] = None
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
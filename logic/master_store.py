@@ -0,0 +1,375 @@
+import datetime
+import json
+import os
+import sqlite3
+import time
+from collections import defaultdict, deque
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from logic import instrumentation
+
+UPSERT_BATCH_ROWS = 5000
+# Tăng khi đổi schema; store tạo bằng schema cũ được dựng lại (nạp lại từ master_data.xlsx)
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS master (
+    id INTEGER PRIMARY KEY,
+    eid TEXT,
+    pos INTEGER NOT NULL,
+    sso TEXT,
+    source TEXT,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS master_eid ON master (eid) WHERE deleted = 0;
+CREATE INDEX IF NOT EXISTS master_pos ON master (pos) WHERE deleted = 0;
+CREATE INDEX IF NOT EXISTS master_sso ON master (sso) WHERE deleted = 0;
+CREATE INDEX IF NOT EXISTS master_version ON master (version);
+CREATE INDEX IF NOT EXISTS master_updated_at ON master (updated_at);
+CREATE TABLE IF NOT EXISTS columns (name TEXT PRIMARY KEY, position INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS exports (path TEXT PRIMARY KEY, version INTEGER NOT NULL, size INTEGER, mtime_ns INTEGER);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+_TABLES = ("master", "columns", "exports", "meta")
+
+
+def _json_default(value):
+    if isinstance(value, (pd.Timestamp, datetime.datetime)):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$d': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {'$t': value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {'$td': [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, Decimal):
+        return {'$dec': str(value)}
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_hook(obj):
+    if len(obj) == 1:
+        if '$dt' in obj:
+            return pd.Timestamp(obj['$dt'])
+        if '$d' in obj:
+            return datetime.date.fromisoformat(obj['$d'])
+        if '$t' in obj:
+            return datetime.time.fromisoformat(obj['$t'])
+        if '$td' in obj:
+            return datetime.timedelta(*obj['$td'])
+        if '$dec' in obj:
+            return Decimal(obj['$dec'])
+    return obj
+
+
+def _key(value):
+    """Khóa text của EID: NA -> None (dòng không có EID, không khớp dòng nào), 123.0 -> '123'."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _file_stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, None
+    return st.st_size, st.st_mtime_ns
+
+
+class MasterStore:
+    """Master data lưu trong SQLite: mỗi dòng có id riêng (EID chỉ là cột có index, không unique), index theo
+    SSO, thứ tự dòng (pos) và version/updated_at.
+
+    Cùng quy tắc với logic.master_stream.merge_master_frame: upsert thay dòng đầu tiên của EID tại chỗ (bản
+    trùng sau đó bị xóa), EID mới nối vào cuối, dòng df không có EID bị bỏ; dòng không có EID hoặc trùng EID
+    nạp qua replace() được giữ nguyên. Mỗi dòng lưu dạng JSON (giữ nguyên kiểu ngày/giờ/số); chỉ dòng có dữ
+    liệu thật sự đổi mới được ghi (và tăng version), nên "dòng đổi từ version/thời điểm T" là 1 truy vấn index.
+    File xlsx chỉ là view xuất ra từ store (export_xlsx), bỏ qua khi không có dòng nào đổi kể từ lần xuất trước.
+    """
+
+    def __init__(self, path, key='EID', owner='SSO'):
+        self.path = path
+        self.key = key
+        self.owner = owner
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Store dựng lại được từ master_data.xlsx -> bỏ bảng schema cũ (meta 'bootstrapped' mất -> nạp lại)
+            with self.conn:
+                for table in _TABLES:
+                    self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM master WHERE deleted = 0").fetchone()[0]
+
+    # ---------- meta ----------
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) "
+                              "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, json.dumps(value)))
+
+    @property
+    def version(self):
+        """Version của lần ghi gần nhất (0 nếu store rỗng)."""
+        row = self.conn.execute("SELECT MAX(version) FROM master").fetchone()
+        return row[0] or 0
+
+    def columns(self):
+        return [r[0] for r in self.conn.execute("SELECT name FROM columns ORDER BY position")]
+
+    def _add_columns(self, names):
+        known = set(self.columns())
+        position = len(known)
+        new = []
+        for name in names:
+            if name not in known:
+                known.add(name)
+                new.append((name, position))
+                position += 1
+        if new:
+            self.conn.executemany("INSERT INTO columns (name, position) VALUES (?, ?)", new)
+
+    # ---------- ghi ----------
+
+    def _rows(self, df, source):
+        columns = [str(c) for c in df.columns]
+        na = df.isna().to_numpy()
+        key_pos = columns.index(self.key)
+        owner_pos = columns.index(self.owner) if self.owner in columns else None
+        for i, values in enumerate(df.itertuples(index=False, name=None)):
+            row_na = na[i]
+            # Bỏ ô rỗng -> JSON gọn, ô không có trong JSON đọc lại là NA
+            data = {c: v for c, v, missing in zip(columns, values, row_na) if not missing}
+            owner = None if owner_pos is None or row_na[owner_pos] else str(values[owner_pos])
+            yield (_key(values[key_pos]), owner, source,
+                   json.dumps(data, default=_json_default, ensure_ascii=False))
+
+    def _live_ids(self):
+        """{EID: deque id các dòng còn sống theo thứ tự pos}; dòng không có EID nằm ở khóa None."""
+        ids = defaultdict(deque)
+        for row_id, eid in self.conn.execute("SELECT id, eid FROM master WHERE deleted = 0 ORDER BY pos, id"):
+            ids[eid].append(row_id)
+        return ids
+
+    def _next_pos(self):
+        row = self.conn.execute("SELECT MAX(pos) FROM master").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def _write_rows(self, updates, inserts):
+        """updates: (id, sso, source, data, version, now); inserts: (eid, pos, sso, source, data, version, now)."""
+        for start in range(0, len(updates), UPSERT_BATCH_ROWS):
+            # Dòng không đổi (cùng data/sso/source) -> không ghi, giữ nguyên version cũ
+            self.conn.executemany(
+                "UPDATE master SET sso = ?2, source = ?3, data = ?4, version = ?5, updated_at = ?6 "
+                "WHERE id = ?1 AND (data IS NOT ?4 OR sso IS NOT ?2 OR source IS NOT ?3)",
+                updates[start:start + UPSERT_BATCH_ROWS])
+        for start in range(0, len(inserts), UPSERT_BATCH_ROWS):
+            self.conn.executemany(
+                "INSERT INTO master (eid, pos, sso, source, data, version, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                inserts[start:start + UPSERT_BATCH_ROWS])
+
+    def _tombstone(self, ids, version, now):
+        self.conn.executemany("UPDATE master SET deleted = 1, version = ?, updated_at = ? WHERE id = ? AND deleted = 0",
+                              [(version, now, i) for i in ids])
+
+    def upsert(self, df, source=None):
+        """Ghi các dòng của df theo EID (dòng sau thắng nếu trùng EID). Trả về số dòng thực sự thay đổi.
+
+        Dòng đầu tiên (theo thứ tự master) của EID được thay tại chỗ, các dòng trùng EID khác bị xóa; EID chưa
+        có nối vào cuối; dòng df không có EID bị bỏ (như merge_master_frame).
+        """
+        if df.empty:
+            return 0
+        if self.key not in df.columns:
+            raise ValueError(f"Missing key column '{self.key}'")
+        keys = df[self.key].map(_key)
+        keep = keys.notna() & ~keys.duplicated(keep='last')
+        if not keep.all():
+            df = df[keep.to_numpy()]
+        with instrumentation.stage("store_upsert") as st:
+            version = self.version + 1
+            now = time.time()
+            with self.conn:
+                self._add_columns([str(c) for c in df.columns])
+                before = self.conn.total_changes
+                live = self._live_ids()
+                pos = self._next_pos()
+                updates, inserts, duplicates = [], [], []
+                for eid, owner, row_source, data in self._rows(df, source):
+                    ids = live.get(eid)
+                    if ids:
+                        updates.append((ids[0], owner, row_source, data, version, now))
+                        duplicates.extend(list(ids)[1:])
+                    else:
+                        inserts.append((eid, pos, owner, row_source, data, version, now))
+                        pos += 1
+                self._write_rows(updates, inserts)
+                self._tombstone(duplicates, version, now)
+            changed = self.conn.total_changes - before
+            st.add("rows", len(df))
+            st.add("changed", changed)
+        return changed
+
+    def delete(self, eids):
+        """Đánh dấu xóa (tombstone, vẫn thấy trong changed_since) mọi dòng của các EID. Trả về số dòng bị xóa."""
+        keys = {_key(e) for e in eids} - {None}
+        if not keys:
+            return 0
+        version = self.version + 1
+        now = time.time()
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany("UPDATE master SET deleted = 1, version = ?, updated_at = ? "
+                                  "WHERE eid = ? AND deleted = 0", [(version, now, k) for k in keys])
+        return self.conn.total_changes - before
+
+    def sync_source(self, df, source):
+        """Upsert df với nhãn source; dòng đang mang nhãn này mà không còn trong df chỉ bị bỏ nhãn (không xóa)."""
+        present = {_key(e) for e in df[self.key]} - {None} if self.key in df.columns else set()
+        released = [row_id for row_id, eid in
+                    self.conn.execute("SELECT id, eid FROM master WHERE source = ? AND deleted = 0", (source,))
+                    if eid not in present]
+        if released:
+            version = self.version + 1
+            now = time.time()
+            with self.conn:
+                self.conn.executemany("UPDATE master SET source = NULL, version = ?, updated_at = ? WHERE id = ?",
+                                      [(version, now, i) for i in released])
+        return self.upsert(df, source=source) + len(released)
+
+    def replace(self, df, source=None):
+        """Đồng bộ store theo df: đúng các dòng và thứ tự của df, kể cả dòng không có EID hoặc trùng EID.
+
+        Dòng thứ n của 1 EID trong df khớp dòng thứ n của EID đó trong store (chỉ ghi khi dữ liệu đổi), dòng
+        store thừa bị xóa. Trả về số dòng đổi.
+        """
+        if self.key not in df.columns:
+            raise ValueError(f"Missing key column '{self.key}'")
+        version = self.version + 1
+        now = time.time()
+        with self.conn:
+            self._add_columns([str(c) for c in df.columns])
+            before = self.conn.total_changes
+            live = self._live_ids()
+            updates, inserts, moves = [], [], []
+            for pos, (eid, owner, row_source, data) in enumerate(self._rows(df, source)):
+                ids = live.get(eid)
+                if ids:
+                    row_id = ids.popleft()
+                    updates.append((row_id, owner, row_source, data, version, now))
+                    moves.append((pos, row_id, pos))
+                else:
+                    inserts.append((eid, pos, owner, row_source, data, version, now))
+            self._write_rows(updates, inserts)
+            self._tombstone([i for ids in live.values() for i in ids], version, now)
+            changed = self.conn.total_changes - before
+            # Đổi thứ tự không phải đổi dữ liệu -> không tăng version, không tính vào số dòng đổi
+            self.conn.executemany("UPDATE master SET pos = ? WHERE id = ? AND pos != ?", moves)
+        return changed
+
+    # ---------- đọc ----------
+
+    def _frame(self, where="", params=()):
+        columns = self.columns()
+        rows = [json.loads(data, object_hook=_json_hook)
+                for (data,) in self.conn.execute(f"SELECT data FROM master WHERE deleted = 0 {where} ORDER BY pos, id",
+                                                 params)]
+        if not rows:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame.from_records(rows, columns=columns).infer_objects()
+
+    def frame(self, sso=None):
+        """Master hiện tại (theo thứ tự dòng của master); sso -> chỉ các dòng của owner đó (dùng index)."""
+        if sso is None:
+            return self._frame()
+        return self._frame("AND sso = ?", (str(sso),))
+
+    def source_frame(self):
+        """Các dòng đến từ file HR (source khác NULL), tức phần master_data_updated."""
+        return self._frame("AND source IS NOT NULL")
+
+    def changed_since(self, since=None, version=None):
+        """Dòng đổi sau thời điểm since (epoch giây) hoặc sau version; cột '_deleted' đánh dấu dòng bị xóa."""
+        if version is not None:
+            cond, param = "version > ?", version
+        else:
+            cond, param = "updated_at > ?", since or 0
+        records = []
+        for eid, data, deleted in self.conn.execute(
+                f"SELECT eid, data, deleted FROM master WHERE {cond} ORDER BY version, pos, id", (param,)):
+            record = json.loads(data, object_hook=_json_hook)
+            record['_deleted'] = bool(deleted)
+            records.append(record)
+        return pd.DataFrame.from_records(records, columns=self.columns() + ['_deleted']).infer_objects()
+
+    # ---------- xuất xlsx ----------
+
+    def export_needed(self, path):
+        """True nếu file chưa xuất, bị sửa/xóa từ bên ngoài, hoặc store có dòng đổi từ lần xuất trước."""
+        row = self.conn.execute("SELECT version, size, mtime_ns FROM exports WHERE path = ?",
+                                (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return True
+        version, size, mtime_ns = row
+        return self.version > version or _file_stat(path) != (size, mtime_ns)
+
+    def external_change(self, path):
+        """True nếu file đã từng được xuất và sau đó bị sửa từ bên ngoài (cần nạp lại vào store)."""
+        row = self.conn.execute("SELECT size, mtime_ns FROM exports WHERE path = ?",
+                                (os.path.abspath(path),)).fetchone()
+        return row is not None and _file_stat(path) != tuple(row)
+
+    def mark_exported(self, path, version=None):
+        size, mtime_ns = _file_stat(path)
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO exports (path, version, size, mtime_ns) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET version = excluded.version, size = excluded.size, "
+                "mtime_ns = excluded.mtime_ns",
+                (os.path.abspath(path), self.version if version is None else version, size, mtime_ns))
+
+    def export_xlsx(self, path, writer, view=None, force=False):
+        """Ghi view() (mặc định frame()) ra xlsx bằng writer(path, df) nếu cần. Trả về số dòng đã ghi hoặc None."""
+        if not force and not self.export_needed(path):
+            return None
+        version = self.version
+        df = (view or self.frame)()
+        with instrumentation.stage("store_export") as st:
+            writer(path, df)
+            st.add("rows", len(df))
+        self.mark_exported(path, version)
+        return len(df)
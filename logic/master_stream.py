@@ -0,0 +1,164 @@
+import math
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas._libs.parsers import STR_NA_VALUES
+
+from logic import frame_rows, instrumentation, parse_template, write_rows_preserving_formulas_and_styles
+
+# Ô chữ pd.read_excel coi là rỗng (na_values mặc định) + mã lỗi Excel (pandas đọc thành NaN)
+NA_STRINGS = frozenset(STR_NA_VALUES) | frozenset(ERROR_CODES)
+
+
+def _cell(value):
+    # Giống pd.read_excel (engine openpyxl): chuỗi NA/mã lỗi -> rỗng, số thực nguyên -> int
+    if isinstance(value, str):
+        return None if value in NA_STRINGS else value
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def _key(value):
+    """Khóa so khớp EID: NA (None/NaN/NA) gom về None như isin/drop_duplicates của pandas."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value
+
+
+def iter_sheet_rows(path, skiprows, sheet_name=None):
+    """Stream header rồi các dòng dữ liệu của sheet (workbook read-only, không giữ cả sheet trong RAM).
+
+    Khớp cách pd.read_excel(path, skiprows=...) đọc: dòng trống cuối sheet bị bỏ, dòng trống ở giữa giữ lại
+    (thành dòng toàn ô rỗng). Dòng sinh ra là tuple giá trị đã qua _cell; header giữ nguyên giá trị gốc.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb[sheet_name] if sheet_name is not None else wb.worksheets[0]
+        header_seen = False
+        blank_rows = 0  # dòng trống chưa biết có phải đuôi sheet không
+        for idx, row in enumerate(ws.iter_rows(values_only=True)):
+            if idx < skiprows:
+                continue
+            if not header_seen:
+                header_seen = True
+                yield tuple(_cell(v) if isinstance(v, float) else v for v in row)
+                continue
+            if all(v is None for v in row):
+                blank_rows += 1
+                continue
+            for _ in range(blank_rows):
+                yield ()
+            blank_rows = 0
+            yield tuple(_cell(v) for v in row)
+    finally:
+        wb.close()
+
+
+def _row_key(row, key_pos):
+    return _key(row[key_pos]) if key_pos is not None and key_pos < len(row) else None
+
+
+def _column_positions(header, headers):
+    # Như df[h] sau pd.read_excel: cột đầu tiên có tên đúng bằng h (cột trùng tên đã bị đổi thành "h.1")
+    positions = {}
+    for pos, name in enumerate(header):
+        if isinstance(name, str) and name not in positions:
+            positions[name] = pos
+    return [positions.get(h) for h in headers]
+
+
+def stream_merge(origin_path, output_path, updates, deleted_keys, template_path, sheet_name, header_skip_rows,
+                 keep_formula_columns, key='EID', engine="xml"):
+    """Ghi master mới trong 1 lượt đọc master (workbook read-only), không dựng DataFrame cho master.
+
+    Dòng master có key trong updates được thay bằng dòng updates ngay tại chỗ (bản trùng sau đó của cùng key bị
+    bỏ), key trong deleted_keys bị bỏ, dòng khác chép nguyên (giá trị theo kiểu lưu trong ô). Dòng updates
+    chưa có trong master nối vào cuối. Key rỗng không khớp dòng nào: dòng master key rỗng giữ nguyên, dòng
+    updates key rỗng bị bỏ (không có key để lần merge sau nhận ra, nối vào sẽ nhân bản mỗi lần chạy).
+    Cùng kết quả với merge_master_frame. Bộ nhớ ~ kích thước updates chứ không theo kích thước master.
+    Trả về dict số dòng: rows (đã ghi), replaced, appended, deleted, skipped (dòng updates key rỗng).
+    """
+    if key not in updates.columns:
+        raise ValueError(f"Missing key column '{key}' in updates")
+    headers = parse_template(template_path, sheet_name, header_skip_rows, tuple(keep_formula_columns))['ordered_headers']
+    blank = updates[key].isna()
+    updates = updates[~blank].drop_duplicates(subset=[key], keep='last')
+    update_rows = list(frame_rows(updates, headers))
+    update_keys = [_key(k) for k in updates[key]]
+    positions_by_key = {k: i for i, k in enumerate(update_keys)}
+    deleted = {_key(k) for k in deleted_keys} - {None}
+    counts = {'replaced': 0, 'appended': 0, 'deleted': 0, 'skipped': int(blank.sum())}
+
+    def rows():
+        emitted = set()
+        source = iter_sheet_rows(origin_path, header_skip_rows)
+        header = next(source, ())
+        positions = _column_positions(header, headers)
+        key_pos = _column_positions(header, [key])[0]
+        if key_pos is None:
+            raise ValueError(f"Missing key column '{key}' in {origin_path}")
+        for row in source:
+            k = _row_key(row, key_pos)
+            i = positions_by_key.get(k)
+            if i is not None:
+                if k not in emitted:
+                    emitted.add(k)
+                    counts['replaced'] += 1
+                    yield update_rows[i]
+                continue
+            if k in deleted:
+                counts['deleted'] += 1
+                continue
+            width = len(row)
+            yield [row[p] if p is not None and p < width else None for p in positions]
+        for i, k in enumerate(update_keys):
+            if k not in emitted:
+                counts['appended'] += 1
+                yield update_rows[i]
+
+    with instrumentation.stage("stream_merge") as st:
+        counts['rows'] = write_rows_preserving_formulas_and_styles(template_path, output_path, rows(), sheet_name,
+                                                                   header_skip_rows, keep_formula_columns,
+                                                                   engine=engine)
+        for name, value in counts.items():
+            st.add(name, value)
+    return counts
+
+
+def merge_master_frame(origin, updates, deleted_keys, key='EID'):
+    """Bản DataFrame của stream_merge (master đã đọc vào origin), cùng quy tắc thay/xóa/nối và cùng thứ tự dòng.
+
+    Trả về (DataFrame kết quả, dict số dòng: rows, replaced, appended, deleted, skipped).
+    """
+    if key not in updates.columns:
+        raise ValueError(f"Missing key column '{key}' in updates")
+    if key not in origin.columns:
+        raise ValueError(f"Missing key column '{key}' in master")
+    blank = updates[key].isna()
+    updates = updates[~blank].drop_duplicates(subset=[key], keep='last').reset_index(drop=True)
+    origin = origin.reset_index(drop=True)
+    update_keys, origin_keys = updates[key], origin[key]
+
+    matched = origin_keys.notna() & origin_keys.isin(update_keys)
+    # Dòng đầu tiên của mỗi key khớp được thay tại chỗ, bản trùng sau đó bị bỏ
+    replaced = matched & ~origin_keys.where(matched).duplicated()
+    deleted = ~matched & origin_keys.notna() & origin_keys.isin([k for k in deleted_keys if not pd.isna(k)])
+    kept = ~(matched & ~replaced) & ~deleted
+    appended = ~update_keys.isin(origin_keys[matched])
+
+    # Thứ tự ghi: vị trí dòng master (dòng thay giữ vị trí dòng cũ), rồi các dòng updates nối vào cuối
+    order = np.flatnonzero(kept.to_numpy())
+    is_replaced = replaced.to_numpy()[order]
+    source_rows = pd.Index(update_keys).get_indexer(origin_keys.to_numpy()[order][is_replaced])
+    pieces = [origin.iloc[order[~is_replaced]], updates.iloc[source_rows], updates[appended]]
+    positions = np.concatenate([np.flatnonzero(~is_replaced), np.flatnonzero(is_replaced),
+                                len(order) + np.arange(int(appended.sum()))])
+    final = pd.concat(pieces, ignore_index=True).iloc[np.argsort(positions, kind='stable')].reset_index(drop=True)
+    counts = {'rows': len(final), 'replaced': int(is_replaced.sum()), 'appended': int(appended.sum()),
+              'deleted': int(deleted.sum()), 'skipped': int(blank.sum())}
+    return final, counts
@@ -0,0 +1,81 @@
+import os
+import time
+import uuid
+
+from filelock import FileLock
+
+from logic import instrumentation
+
+# expected=UNCHECKED: ghi đè không cần kiểm tra generation (đầu ra dựng lại toàn bộ từ nguồn khác)
+UNCHECKED = object()
+LOCK_TIMEOUT = 120
+REPLACE_RETRIES = 5
+
+
+class StaleOutputError(Exception):
+    """File đích đã được ghi bởi process khác sau khi người ghi đọc dữ liệu nền -> không ghi đè."""
+
+    def __init__(self, path, expected, actual):
+        super().__init__(f"{path} changed since it was read (expected {expected}, found {actual})")
+        self.path = path
+        self.expected = expected
+        self.actual = actual
+
+
+def generation(path):
+    """Generation của file đích = (size, mtime_ns); None nếu chưa có file."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def lock_path(target):
+    return f"{os.path.abspath(target)}.lock"
+
+
+def temp_path(target):
+    """File tạm cùng thư mục với đích (os.replace mới atomic), giữ đuôi để writer nhận đúng định dạng."""
+    directory, name = os.path.split(os.path.abspath(target))
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp{ext}")
+
+
+def _replace(src, dst):
+    # Windows: đích đang được mở (Excel, process đọc) -> PermissionError, thử lại vài lần
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(0.2 * (2 ** attempt))
+
+
+def commit_output(target, render, expected=UNCHECKED, lock_timeout=LOCK_TIMEOUT):
+    """Ghi file đích theo kiểu render ngoài lock, swap trong lock.
+
+    render(tmp_path) ghi toàn bộ nội dung ra file tạm cùng thư mục, không giữ lock nào. Sau đó lấy lock
+    riêng của đích (<target>.lock) chỉ để kiểm tra generation và os.replace, nên người đọc luôn thấy
+    file cũ hoặc file mới hoàn chỉnh. expected là generation() mà người ghi thấy lúc đọc dữ liệu nền;
+    nếu file đã đổi -> bỏ file tạm và raise StaleOutputError. Trả về generation mới của đích.
+    """
+    tmp_path = temp_path(target)
+    try:
+        with instrumentation.stage("render_output"):
+            render(tmp_path)
+        with instrumentation.locked(FileLock(lock_path(target), timeout=lock_timeout)):
+            with instrumentation.stage("commit_output") as st:
+                if expected is not UNCHECKED:
+                    actual = generation(target)
+                    if actual != (None if expected is None else tuple(expected)):
+                        st.add("stale")
+                        raise StaleOutputError(target, expected, actual)
+                _replace(tmp_path, target)
+                st.add("bytes_written", instrumentation.file_size(target))
+                return generation(target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
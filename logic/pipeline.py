@@ -0,0 +1,313 @@
+import functools
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from logic import instrumentation
+from logic.dag import Pipeline
+from logic.hr_fanout import fast_to_excel, template_writer, write_hr_files
+from logic.excel_reader import cached_read, open_workbook, sheet_columns
+from logic.id_normalization import (EMP_ID_COLUMNS, NATIONAL_ID_COL, clean_lineup, normalize_emp_id_columns,
+                                    normalize_id_series)
+from logic.output_commit import commit_output
+from logic.read_cache import cached_object
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_FILE = "config.yaml"
+PIPELINE_CACHE_DIR = ".pipeline_cache"
+SOURCES = ("master", "hiring", "emp", "lineup", "permission")
+REQUIRED_KEYS = ("template_file", "output_master", "hr_dir", "sheets", "skip_rows")
+OUTPUT_WRITERS = ("template", "xlsxwriter")
+
+EMP_KEY = "Emp id"
+PERMISSION_KEY = "MSA Client"
+OWNER_KEY = "SSO"
+ID_COLUMNS = [EMP_KEY, "EMPLOYEE_NUMBER", NATIONAL_ID_COL, "Số CMND/CCCD:"]
+NAME_COLUMNS = ["Last Name (Family Name)", "Middle Name", "First Name"]
+FULL_NAME_COL = "EMPLOYEE FULL NAME_EN"
+HIRING_EXTENSIONS = ('.xlsx', '.xls', '.xlsm')
+HIRING_SHEET = "Hiring_data"
+
+
+def load_config(path=DEFAULT_CONFIG_FILE):
+    """Đọc config.yaml; đường dẫn tương đối được tính từ thư mục chứa file config."""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    missing = [key for key in REQUIRED_KEYS if key not in config]
+    missing += [f"{section}.{name}" for section in ("sheets", "skip_rows") if section in config
+                for name in SOURCES if name not in config[section]]
+    if missing:
+        raise ValueError(f"Missing config keys in {path}: {', '.join(missing)}")
+    if config.setdefault('output_writer', "template") not in OUTPUT_WRITERS:
+        raise ValueError(f"Unknown output_writer '{config['output_writer']}', expected one of {OUTPUT_WRITERS}")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for key in ("template_file", "output_master", "hr_dir", "hiring_dir", "cache_dir"):
+        if config.get(key):
+            config[key] = os.path.join(base_dir, config[key])
+    config.setdefault('cache_dir', os.path.join(base_dir, PIPELINE_CACHE_DIR))
+    config.setdefault('column_mapping', {})
+    config.setdefault('keep_format_columns', [])
+    config.setdefault('schedules', {})
+    config.setdefault('daemon', {})
+    return config
+
+
+# ===================== SOURCES =====================
+
+def read_sheet(path, sheet_name, skiprows, dtype=None, columns=None):
+    """Đọc 1 sheet qua cache snapshot (chỉ parse lại xlsx khi file đổi); columns -> chỉ parse các cột này."""
+    with instrumentation.stage("read_excel") as st:
+        kwargs = {'sheet_name': sheet_name, 'skiprows': skiprows}
+        if dtype:
+            kwargs['dtype'] = dtype
+        df = cached_read(path, columns=columns, **kwargs)
+        st.add("rows", len(df))
+        st.add("bytes_read", instrumentation.file_size(path))
+    return df
+
+
+def hiring_files(directory):
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"Hiring directory not found: {directory}")
+    # Sắp xếp để thứ tự dòng (và bản ghi được giữ khi trùng) cố định giữa các lần chạy
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(HIRING_EXTENSIONS) and not name.startswith('~$')]
+
+
+def _sheet_names(path):
+    # Đóng file ngay: handle còn mở làm HR trên Windows không lưu được file
+    with open_workbook(path) as xls:
+        return xls.sheet_names
+
+
+def read_hiring_dir(directory, skiprows, columns=None):
+    """Gộp các file hiring trong thư mục (sheet Hiring_data nếu có, không thì sheet đầu); file lỗi bị bỏ qua."""
+    frames = []
+    for path in hiring_files(directory):
+        fname = os.path.basename(path)
+        try:
+            sheet_names = cached_object(path, lambda: _sheet_names(path))
+            sheet = HIRING_SHEET if HIRING_SHEET in sheet_names else sheet_names[0]
+            df = read_sheet(path, sheet, skiprows, dtype={NATIONAL_ID_COL: 'string'}, columns=columns)
+            df['__source_file__'] = fname  # Thêm cột để track nguồn
+            frames.append(df)
+        except Exception as e:
+            logger.warning(f"Skip hiring file due to error: {fname} -> {e}")
+    if not frames:
+        raise ValueError(f"No hiring Excel files loaded from {directory}")
+    return pd.concat(frames, ignore_index=True)
+
+
+def source_columns(master_columns, column_mapping):
+    """Các cột cần đọc từ hiring/emp/lineup: cột template, cột nguồn của column_mapping, các cột khóa/ID/tên.
+
+    Cột khác bị reindex bỏ ở map_to_master nên không cần parse. Khóa mapping dạng "<cột>_x"/"<cột>_y" (hậu
+    tố do join) cũng giữ cột gốc, để cột trùng tên giữa các nguồn vẫn sinh đúng hậu tố như khi đọc đủ cột.
+    """
+    columns = set(map(str, master_columns))
+    for key in column_mapping:
+        key = str(key)
+        columns.add(key)
+        if key.endswith(("_x", "_y")):
+            columns.add(key[:-2])
+    columns.update(ID_COLUMNS + NAME_COLUMNS + EMP_ID_COLUMNS + [PERMISSION_KEY, OWNER_KEY])
+    return sorted(columns)
+
+
+# ===================== TRANSFORMS =====================
+
+def coalesce_duplicate_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Khi rename theo column_mapping có thể xuất hiện các cột trùng tên (VD: DOJ đến từ 2 nguồn).
+    Giữ lại 1 cột cho mỗi tên, ưu tiên giá trị non-null đầu tiên theo thứ tự cột hiện tại.
+    Chỉ đụng tới các cột trùng (không transpose cả frame) nên giữ nguyên dtype của các cột còn lại.
+    """
+    if not df.columns.has_duplicates:
+        return df
+    codes, uniques = pd.factorize(df.columns)
+    columns = {}
+    for code, name in enumerate(uniques):
+        positions = np.flatnonzero(codes == code)
+        ser = df.iloc[:, positions[0]]
+        if len(positions) > 1 and isinstance(ser.dtype, pd.CategoricalDtype):
+            # fillna trên category không nhận giá trị ngoài categories
+            ser = ser.astype(object)
+        for pos in positions[1:]:
+            ser = ser.fillna(df.iloc[:, pos])
+        columns[code] = ser
+    result = pd.DataFrame(columns, index=df.index)
+    result.columns = uniques
+    return result
+
+
+def combine_full_name(df, name_cols=None, target_col=FULL_NAME_COL):
+    """Gộp các cột tên (Last, Middle, First) thành target_col; dòng không có phần tên nào -> NA."""
+    if name_cols is None:
+        name_cols = NAME_COLUMNS
+    available_cols = [col for col in name_cols if col in df.columns]
+    if not available_cols:
+        logger.warning("No name columns found in dataframe. Skipping name combination.")
+        return df
+
+    full = None
+    for col in available_cols:
+        ser = df[col]
+        part = ser.astype(object).where(ser.notna(), "").map(str).str.strip()
+        if full is None:
+            full = part
+        else:
+            # Nối bằng 1 dấu cách, bỏ qua phần rỗng (như " ".join(filter(None, parts)))
+            full = full + np.where((full != "") & (part != ""), " ", "") + part
+    combined = full.astype(object)
+    combined[full == ""] = pd.NA
+    df[target_col] = combined
+    logger.info(f"Combined {target_col} from columns: {available_cols}")
+    return df
+
+
+def _ids_as_string(df):
+    return df.astype({col: 'string' for col in ID_COLUMNS if col in df.columns})
+
+
+def _rename_if_missing(df, src_col, dst_col):
+    if src_col in df.columns and dst_col not in df.columns:
+        df = df.rename(columns={src_col: dst_col})
+        logger.info(f"Renamed column {src_col} to {dst_col}")
+    elif dst_col not in df.columns:
+        logger.warning(f"Missing column {dst_col} in dataframe")
+    return df
+
+
+def _national_ids(df):
+    return normalize_id_series(df.get(NATIONAL_ID_COL, pd.Series(dtype="string")), expected_len=12)
+
+
+def prepare_hiring(hiring):
+    hiring = normalize_emp_id_columns(_ids_as_string(hiring))
+    hiring = combine_full_name(hiring)
+    hiring[NATIONAL_ID_COL] = _national_ids(hiring)
+    return hiring
+
+
+def index_emp(emp):
+    """Employee Master đã chuẩn hóa, index theo Emp id (dựng 1 lần, dùng cho join)."""
+    emp = _rename_if_missing(_ids_as_string(emp), "EMPLOYEE_NUMBER", EMP_KEY)
+    emp = normalize_emp_id_columns(emp)
+    return emp.set_index(EMP_KEY)
+
+
+def index_lineup(lineup):
+    """Lineup hợp lệ (National ID toàn chữ số, không trùng), index theo National ID."""
+    lineup = _rename_if_missing(_ids_as_string(lineup), "Số CMND/CCCD:", NATIONAL_ID_COL)
+    lineup[NATIONAL_ID_COL] = _national_ids(lineup)
+    return clean_lineup(lineup).set_index(NATIONAL_ID_COL)
+
+
+def index_permission(permission):
+    if PERMISSION_KEY not in permission.columns:
+        return None
+    return permission.set_index(PERMISSION_KEY)
+
+
+def _left_join(left, right_indexed, key):
+    # Giống left.merge(right, on=key, how="left"): giữ thứ tự bên trái, hậu tố _x/_y cho cột trùng
+    joined = left.join(right_indexed, on=key, how="left", lsuffix="_x", rsuffix="_y")
+    return joined.reset_index(drop=True)
+
+
+def join_sources(hiring, emp_indexed, lineup_indexed):
+    merged = _left_join(hiring, emp_indexed, EMP_KEY)
+    return _left_join(merged, lineup_indexed, NATIONAL_ID_COL)
+
+
+def map_to_master(joined, master, column_mapping):
+    """Đổi tên theo column_mapping, gộp cột trùng, giữ đúng cột của template rồi nối sau dữ liệu master."""
+    # Lấy danh sách cột chuẩn từ template, bỏ cột Unnamed (header layout)
+    master_cols = [c for c in master.columns if not str(c).startswith("Unnamed")]
+    mapped = coalesce_duplicate_columns(joined.rename(columns=column_mapping)).reindex(columns=master_cols)
+    return pd.concat([master.loc[:, master_cols], mapped], ignore_index=True)
+
+
+def attach_permission(master_df, permission_indexed):
+    if permission_indexed is None or PERMISSION_KEY not in master_df.columns:
+        # Không có MSA Client để merge – vẫn tiếp tục
+        return master_df
+    return _left_join(master_df, permission_indexed, PERMISSION_KEY)
+
+
+# ===================== OUTPUTS =====================
+
+def write_master(path, writer, final_df):
+    with instrumentation.stage("write_master") as st:
+        # Render ra file tạm rồi swap atomic: người đọc master không bao giờ thấy file ghi dở
+        commit_output(path, lambda tmp_path: writer(tmp_path, final_df))
+        st.add("rows", len(final_df))
+    return {'path': path, 'rows': len(final_df)}
+
+
+def write_owner_files(hr_dir, writer, final_df):
+    if OWNER_KEY not in final_df.columns:
+        raise ValueError(f"Thiếu cột '{OWNER_KEY}' sau khi xử lý. Kiểm tra nguồn Permission/mapping.")
+    result = write_hr_files(final_df, hr_dir, writer=writer, sso_col=OWNER_KEY)
+    for sso, err in result['failed'].items():
+        logger.error(f"Failed to write HR file for {sso}: {err}")
+    logger.info(f"HR files: {len(result['written'])} written, {len(result['unchanged'])} unchanged, "
+                f"{len(result['deleted'])} deleted")
+    return result
+
+
+def build_pipeline(config, cache_dir=None, max_workers=None, executor="process"):
+    """DAG: đọc 5 nguồn (song song, mỗi nguồn 1 lần) -> chuẩn hóa/index -> join -> ghi master và file HR."""
+    cache_dir = config['cache_dir'] if cache_dir is None else cache_dir
+    kwargs = {} if max_workers is None else {'max_workers': max_workers}
+    pipeline = Pipeline(cache_dir=cache_dir or None, executor=executor, **kwargs)
+
+    template = config['template_file']
+    sheets = config['sheets']
+    skips = config['skip_rows']
+
+    # master/permission đi thẳng vào kết quả -> đọc đủ cột; các nguồn join chỉ đọc cột template/mapping cần
+    needed = source_columns(sheet_columns(template, sheets['master'], skips['master']), config['column_mapping'])
+
+    def source(name, dtype=None, columns=None):
+        pipeline.add(name, functools.partial(read_sheet, template, sheets[name], skips[name], dtype, columns),
+                     inputs=lambda: [template], io=True, persist=False)
+
+    source("master")
+    hiring_dir = config.get('hiring_dir')
+    if hiring_dir:
+        # hiring đọc từ thư mục (sheets.hiring chỉ dùng khi không khai báo hiring_dir)
+        pipeline.add("hiring", functools.partial(read_hiring_dir, hiring_dir, skips['hiring'], needed),
+                     inputs=lambda: hiring_files(hiring_dir), io=True, persist=False)
+    else:
+        source("hiring", columns=needed)
+    source("emp", dtype={'EMPLOYEE_NUMBER': 'string'}, columns=needed)
+    source("lineup", dtype={'Số CMND/CCCD:': 'string'}, columns=needed)
+    source("permission")
+
+    pipeline.add("hiring_norm", prepare_hiring, deps=["hiring"])
+    pipeline.add("emp_index", index_emp, deps=["emp"])
+    pipeline.add("lineup_index", index_lineup, deps=["lineup"])
+    pipeline.add("permission_index", index_permission, deps=["permission"])
+    pipeline.add("joined", join_sources, deps=["hiring_norm", "emp_index", "lineup_index"])
+    pipeline.add("master_df", functools.partial(map_to_master, column_mapping=dict(config['column_mapping'])),
+                 deps=["joined", "master"])
+    pipeline.add("final", attach_permission, deps=["master_df", "permission_index"])
+
+    if config['output_writer'] == "template":
+        writer = template_writer(template, sheets['master'], skips['master'], config['keep_format_columns'])
+        writer_inputs = lambda: [template]  # noqa: E731
+    else:
+        writer = fast_to_excel
+        writer_inputs = None
+    output_master = config['output_master']
+    pipeline.add("write_master", functools.partial(write_master, output_master, writer), deps=["final"],
+                 inputs=writer_inputs, outputs=lambda value: [value['path']])
+    pipeline.add("write_hr", functools.partial(write_owner_files, config['hr_dir'], writer), deps=["final"],
+                 inputs=writer_inputs, outputs=lambda value: list(value['files'].values()))
+    return pipeline
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+
+from logic import instrumentation
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow không bắt buộc -> fallback sang pickle
+    feather = None
+
+
+CACHE_DIR_NAME = ".xlsx_cache"
+READ_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def _digest(value):
+    return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()[:16]
+
+
+def _cache_key(file_path, kwargs):
+    """Key = (đường dẫn + size + mtime của file nguồn, các tham số đọc như skiprows/sheet/dtype)."""
+    st = os.stat(file_path)
+    file_ident = _digest((os.path.normcase(os.path.abspath(file_path)), st.st_size, st.st_mtime_ns))
+    args_ident = _digest(sorted((k, repr(v)) for k, v in kwargs.items()))
+    return file_ident, args_ident
+
+
+def _load_cached(path):
+    if path.endswith('.feather'):
+        # memory-map -> không phải parse lại XML
+        return feather.read_table(path, memory_map=True).to_pandas()
+    return pd.read_pickle(path)
+
+
+def _store_cached(df, base_path):
+    """Ghi snapshot dạng Feather nếu được, ngược lại pickle (cột object lẫn kiểu không lưu được Arrow)."""
+    if feather is not None:
+        path = f"{base_path}.feather"
+        tmp_path = f"{path}.tmp"
+        try:
+            feather.write_feather(df, tmp_path)
+            os.replace(tmp_path, path)
+            return path
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    path = f"{base_path}.pkl"
+    tmp_path = f"{path}.tmp"
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _evict(cache_dir, max_bytes, keep=None):
+    """Xóa snapshot ít dùng nhất (theo mtime) cho tới khi tổng dung lượng <= max_bytes."""
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _cached(file_path, params, load_source, store, max_bytes):
+    """Khung chung: tra snapshot theo (phiên bản file nguồn, params), miss thì gọi load_source rồi lưu lại."""
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR_NAME)
+    file_ident, args_ident = _cache_key(file_path, params)
+    prefix = f"{os.path.basename(file_path)}."
+    base_path = os.path.join(cache_dir, f"{prefix}{file_ident}.{args_ident}")
+
+    for ext in ('.feather', '.pkl'):
+        path = base_path + ext
+        if ext == '.feather' and feather is None:
+            continue
+        if os.path.exists(path):
+            try:
+                result = _load_cached(path)
+                os.utime(path)  # đánh dấu vừa dùng cho LRU
+                instrumentation.count("read_cache", "hits")
+                return result
+            except Exception:
+                # Snapshot hỏng -> đọc lại từ xlsx
+                os.remove(path)
+
+    instrumentation.count("read_cache", "misses")
+    result = load_source()
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Snapshot của phiên bản cũ của file nguồn đã stale -> xóa trước khi ghi mới
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix) and not name.startswith(f"{prefix}{file_ident}."):
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                except OSError:
+                    pass
+        path = store(result, base_path)
+        _evict(cache_dir, max_bytes, keep=path)
+    except Exception:
+        # Cache chỉ là tối ưu, lỗi ghi cache không được làm hỏng việc đọc
+        pass
+    return result
+
+
+def _store_pickle(obj, base_path):
+    path = f"{base_path}.pkl"
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def cached_frame(file_path, loader, max_bytes=READ_CACHE_MAX_BYTES, **params):
+    """Cache (Feather/pickle) DataFrame loader() đọc từ file_path; params phân biệt các biến thể đọc."""
+    return _cached(file_path, dict(params, _loader=loader.__qualname__), loader, _store_cached, max_bytes)
+
+
+def cached_object(file_path, loader, max_bytes=READ_CACHE_MAX_BYTES, **params):
+    """Cache (pickle) kết quả loader() suy ra từ file_path, vd. metadata template; params phân biệt các biến thể."""
+    return _cached(file_path, dict(params, _loader=loader.__qualname__), loader, _store_pickle, max_bytes)
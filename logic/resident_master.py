@@ -0,0 +1,186 @@
+import os
+import time
+
+import pandas as pd
+
+from logic.output_commit import StaleOutputError, commit_output
+
+FLUSH_RETRIES = 3
+
+
+def _norm_key(value):
+    # NaN/None gom về 1 key giống drop_duplicates
+    return None if pd.isna(value) else value
+
+
+def _file_stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class ResidentMaster:
+    """Master data giữ thường trú trong bộ nhớ với index key (EID) -> vị trí dòng.
+
+    Mỗi lần upsert chỉ tốn O(số dòng thay đổi); file xlsx được ghi lại theo chu kỳ
+    (flush_interval giây hoặc flush_rows dòng thay đổi) và khi tắt. Nếu file master bị
+    sửa từ bên ngoài, bản trong bộ nhớ được nạp lại rồi áp lại các dòng chưa flush.
+    """
+
+    def __init__(self, path, key='EID', reader=None, writer=None, flush_interval=30.0, flush_rows=1000):
+        self.path = path
+        self.key = key
+        self.reader = reader or pd.read_excel
+        self.writer = writer or (lambda df, p: df.to_excel(p, index=False))
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+
+        self._frame = pd.DataFrame()
+        self._appended = []  # các frame dòng mới, gộp vào _frame khi cần (_compact)
+        self._appended_rows = 0
+        self._index = {}
+        self._dirty_keys = set()
+        self._dirty_since = None
+        self._stat = None
+        self.load()
+
+    def __len__(self):
+        return len(self._frame) + self._appended_rows
+
+    @property
+    def dirty(self):
+        return bool(self._dirty_keys)
+
+    @property
+    def frame(self):
+        self._compact()
+        return self._frame
+
+    def load(self):
+        """Nạp (lại) master từ file và dựng index."""
+        self._stat = _file_stat(self.path)
+        frame = self.reader(self.path) if self._stat is not None else pd.DataFrame()
+        if self.key in frame.columns:
+            # Dữ liệu cũ có thể còn trùng key -> giữ dòng cuối như drop_duplicates(keep='last')
+            frame = frame.drop_duplicates(subset=[self.key], keep='last')
+        self._frame = frame.reset_index(drop=True)
+        self._appended = []
+        self._appended_rows = 0
+        if self.key in self._frame.columns:
+            self._index = {_norm_key(k): i for i, k in enumerate(self._frame[self.key].tolist())}
+        else:
+            self._index = {}
+
+    def reset(self):
+        """Bỏ các thay đổi chưa flush và nạp lại từ file (file vừa được dựng lại đầy đủ từ nguồn)."""
+        self._dirty_keys = set()
+        self._dirty_since = None
+        self.load()
+
+    def _compact(self):
+        if self._appended:
+            self._frame = pd.concat([self._frame] + self._appended, ignore_index=True)
+            self._appended = []
+            self._appended_rows = 0
+
+    def check_external_change(self):
+        """Nạp lại nếu file master đã bị sửa từ bên ngoài. Trả về True nếu có nạp lại."""
+        stat = _file_stat(self.path)
+        if stat is None or stat == self._stat:
+            return False
+        dirty_rows = None
+        if self._dirty_keys:
+            frame = self.frame
+            mask = frame[self.key].map(_norm_key).isin(self._dirty_keys)
+            dirty_rows = frame[mask]
+        self.load()
+        if dirty_rows is not None and not dirty_rows.empty:
+            self._dirty_keys = set()
+            self.upsert(dirty_rows)
+        return True
+
+    def _set_rows(self, positions, rows, columns):
+        for col in columns:
+            values = rows[col].to_numpy() if col in rows.columns else None
+            col_idx = self._frame.columns.get_loc(col)
+            if values is None:
+                # Cột không có trong file HR -> để trống như khi thay nguyên dòng
+                values = [pd.NA] * len(positions)
+            try:
+                self._frame.iloc[positions, col_idx] = values
+            except (TypeError, ValueError):
+                # Không ép được dtype (vd. chuỗi vào cột số) -> chuyển cột sang object
+                self._frame[col] = self._frame[col].astype(object)
+                self._frame.iloc[positions, col_idx] = values
+
+    def upsert(self, df):
+        """Cập nhật/chèn các dòng của df theo key. Trả về (số dòng cập nhật, số dòng thêm mới)."""
+        if self.key not in df.columns:
+            raise ValueError(f"Missing key column '{self.key}'")
+        df = df.drop_duplicates(subset=[self.key], keep='last')
+        keys = [_norm_key(k) for k in df[self.key].tolist()]
+        positions = [self._index.get(k) for k in keys]
+        if any(p is not None and p >= len(self._frame) for p in positions):
+            # Dòng cần sửa còn nằm trong phần append -> gộp trước
+            self._compact()
+
+        new_columns = [c for c in df.columns if c not in self._frame.columns]
+        if new_columns:
+            self._compact()
+            for col in new_columns:
+                self._frame[col] = pd.NA
+
+        update_rows = [i for i, p in enumerate(positions) if p is not None]
+        insert_rows = [i for i, p in enumerate(positions) if p is None]
+
+        if update_rows:
+            self._set_rows([positions[i] for i in update_rows], df.iloc[update_rows], list(self._frame.columns))
+
+        if insert_rows:
+            new_rows = df.iloc[insert_rows].reset_index(drop=True)
+            start = len(self)
+            for offset, i in enumerate(insert_rows):
+                self._index[keys[i]] = start + offset
+            self._appended.append(new_rows)
+            self._appended_rows += len(new_rows)
+
+        if keys and not self._dirty_keys:
+            self._dirty_since = time.monotonic()
+        self._dirty_keys.update(keys)
+        return len(update_rows), len(insert_rows)
+
+    def should_flush(self):
+        if not self._dirty_keys:
+            return False
+        return (len(self._dirty_keys) >= self.flush_rows
+                or time.monotonic() - self._dirty_since >= self.flush_interval)
+
+    def flush(self):
+        """Ghi master xuống file xlsx nếu có thay đổi (render ra file tạm, swap atomic trong lock của file)."""
+        if not self._dirty_keys:
+            return False
+        for _ in range(FLUSH_RETRIES):
+            frame = self.frame
+            try:
+                self._stat = commit_output(self.path, lambda tmp_path: self.writer(frame, tmp_path),
+                                           expected=self._stat)
+                break
+            except StaleOutputError as e:
+                if e.actual is None:
+                    # File bị xóa -> ghi lại từ bản trong bộ nhớ
+                    self._stat = None
+                else:
+                    # Process khác đã ghi file sau lần nạp -> nạp lại, áp lại các dòng chưa flush rồi ghi lại
+                    self.check_external_change()
+        else:
+            raise RuntimeError(f"{self.path} keeps changing, gave up flushing after {FLUSH_RETRIES} attempts")
+        self._dirty_keys = set()
+        self._dirty_since = None
+        return True
+
+    def maybe_flush(self):
+        if self.should_flush():
+            return self.flush()
+        return False
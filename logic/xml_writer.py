@@ -0,0 +1,279 @@
+import datetime
+import math
+import zipfile
+from numbers import Integral, Number
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles.borders import DEFAULT_BORDER
+from openpyxl.styles.fills import DEFAULT_EMPTY_FILL, DEFAULT_GRAY_FILL
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import to_excel
+from openpyxl.utils.exceptions import IllegalCharacterError
+from openpyxl.xml.functions import tostring
+
+
+SHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+# Số dòng XML gom lại trước mỗi lần ghi vào zip
+WRITE_CHUNK_ROWS = 1000
+
+# Cùng number format openpyxl gán cho ô datetime/date/time/timedelta (time dùng format built-in "h:mm:ss")
+DATETIME_FORMAT_ID = 164
+DATE_FORMAT_ID = 165
+TIMEDELTA_FORMAT_ID = 166
+TIME_FORMAT_ID = 21
+NUMBER_FORMATS = {
+    DATETIME_FORMAT_ID: "yyyy-mm-dd h:mm:ss",
+    DATE_FORMAT_ID: "yyyy-mm-dd",
+    TIMEDELTA_FORMAT_ID: "[hh]:mm:ss",
+}
+
+CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+
+class SharedFormula:
+    """Ô thuộc nhóm shared formula: ô đầu có text công thức + ref, các ô còn lại chỉ mang si."""
+
+    __slots__ = ('si', 'formula', 'ref')
+
+    def __init__(self, si, formula=None, ref=None):
+        self.si = si
+        self.formula = formula
+        self.ref = ref
+
+
+def _style_xml(obj):
+    tree = obj.to_tree()
+    return tostring(tree).decode("utf-8") if tree is not None else ""
+
+
+class StyleTable:
+    """Bảng style đã khử trùng lặp: mỗi tổ hợp (font, fill, border, alignment, numFmt) chỉ có 1 xf."""
+
+    def __init__(self):
+        self.fonts = [_style_xml(DEFAULT_FONT)]
+        self.fills = [_style_xml(DEFAULT_EMPTY_FILL), _style_xml(DEFAULT_GRAY_FILL)]
+        self.borders = [_style_xml(DEFAULT_BORDER)]
+        self._font_ids = {self.fonts[0]: 0}
+        self._fill_ids = {self.fills[0]: 0, self.fills[1]: 1}
+        self._border_ids = {self.borders[0]: 0}
+        # (numFmtId, fontId, fillId, borderId, alignment xml) -> xf id
+        self.xfs = [(0, 0, 0, 0, "")]
+        self._xf_ids = {self.xfs[0]: 0}
+
+    @staticmethod
+    def _intern(xml, items, ids):
+        idx = ids.get(xml)
+        if idx is None:
+            idx = ids[xml] = len(items)
+            items.append(xml)
+        return idx
+
+    def _xf_id(self, key):
+        idx = self._xf_ids.get(key)
+        if idx is None:
+            idx = self._xf_ids[key] = len(self.xfs)
+            self.xfs.append(key)
+        return idx
+
+    def add(self, font=None, fill=None, border=None, alignment=None):
+        font_id = self._intern(_style_xml(font), self.fonts, self._font_ids) if font is not None else 0
+        fill_id = self._intern(_style_xml(fill), self.fills, self._fill_ids) if fill is not None else 0
+        border_id = self._intern(_style_xml(border), self.borders, self._border_ids) if border is not None else 0
+        align_xml = _style_xml(alignment) if alignment is not None else ""
+        if align_xml == "<alignment />":
+            align_xml = ""
+        return self._xf_id((0, font_id, fill_id, border_id, align_xml))
+
+    def with_number_format(self, xf, fmt_id):
+        """xf giữ font/fill/border/alignment của xf nhưng mang numFmt fmt_id (ô ngày giờ có style sẵn)."""
+        return self._xf_id((fmt_id,) + self.xfs[xf][1:])
+
+    def to_xml(self):
+        parts = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n', f'<styleSheet xmlns="{SHEET_NS}">']
+        parts.append(f'<numFmts count="{len(NUMBER_FORMATS)}">')
+        for fmt_id, code in NUMBER_FORMATS.items():
+            parts.append(f'<numFmt numFmtId="{fmt_id}" formatCode={quoteattr(code)}/>')
+        parts.append('</numFmts>')
+        for tag, items in (('fonts', self.fonts), ('fills', self.fills), ('borders', self.borders)):
+            parts.append(f'<{tag} count="{len(items)}">{"".join(items)}</{tag}>')
+        parts.append('<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>')
+        parts.append(f'<cellXfs count="{len(self.xfs)}">')
+        for num_fmt_id, font_id, fill_id, border_id, align_xml in self.xfs:
+            attrs = (f'numFmtId="{num_fmt_id}" fontId="{font_id}" fillId="{fill_id}" '
+                     f'borderId="{border_id}" xfId="0"')
+            if num_fmt_id:
+                attrs += ' applyNumberFormat="1"'
+            if font_id:
+                attrs += ' applyFont="1"'
+            if fill_id:
+                attrs += ' applyFill="1"'
+            if border_id:
+                attrs += ' applyBorder="1"'
+            if align_xml:
+                parts.append(f'<xf {attrs} applyAlignment="1">{align_xml}</xf>')
+            else:
+                parts.append(f'<xf {attrs}/>')
+        parts.append('</cellXfs>')
+        parts.append('<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>')
+        parts.append('</styleSheet>')
+        return "".join(parts)
+
+
+def _text_xml(value):
+    if ILLEGAL_CHARACTERS_RE.search(value):
+        raise IllegalCharacterError(f"{value} cannot be used in worksheets.")
+    text = escape(value)
+    if text != text.strip():
+        return f'<t xml:space="preserve">{text}</t>'
+    return f'<t>{text}</t>'
+
+
+def _date_format_id(value):
+    # Thứ tự như TIME_FORMATS của openpyxl: datetime là lớp con của date
+    if isinstance(value, datetime.datetime):
+        return DATETIME_FORMAT_ID
+    if isinstance(value, datetime.date):
+        return DATE_FORMAT_ID
+    if isinstance(value, datetime.time):
+        return TIME_FORMAT_ID
+    if isinstance(value, datetime.timedelta):
+        return TIMEDELTA_FORMAT_ID
+    return None
+
+
+def cell_xml(ref, value, xf, styles):
+    """Sinh XML cho 1 ô theo đúng quy tắc kiểu dữ liệu openpyxl (chuỗi bắt đầu '=' là công thức)."""
+    s_attr = f' s="{xf}"' if xf else ""
+    # Như openpyxl: chuỗi rỗng là ô trống; NaT (lớp con của datetime) là ô trống mang numFmt ngày giờ
+    if value is None or value is pd.NA or (isinstance(value, str) and not value):
+        return f'<c r="{ref}"{s_attr}/>' if xf else ""
+    if value is pd.NaT:
+        return f'<c r="{ref}" s="{styles.with_number_format(xf, DATETIME_FORMAT_ID)}"/>'
+    if isinstance(value, SharedFormula):
+        if value.formula is None:
+            return f'<c r="{ref}"{s_attr}><f t="shared" si="{value.si}"/></c>'
+        text = value.formula[1:] if value.formula.startswith("=") else value.formula
+        return f'<c r="{ref}"{s_attr}><f t="shared" ref="{value.ref}" si="{value.si}">{escape(text)}</f></c>'
+    if isinstance(value, str):
+        if value.startswith("=") and len(value) > 1:
+            return f'<c r="{ref}"{s_attr}><f>{escape(value[1:])}</f></c>'
+        return f'<c r="{ref}"{s_attr} t="inlineStr"><is>{_text_xml(value)}</is></c>'
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c r="{ref}"{s_attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, np.datetime64):
+        if np.isnat(value):
+            return f'<c r="{ref}" s="{styles.with_number_format(xf, DATETIME_FORMAT_ID)}"/>'
+        value = pd.Timestamp(value).to_pydatetime()
+    elif isinstance(value, np.timedelta64):
+        if np.isnat(value):
+            return f'<c r="{ref}"{s_attr}/>' if xf else ""
+        value = pd.Timedelta(value)
+    fmt_id = _date_format_id(value)
+    if fmt_id is not None:
+        return f'<c r="{ref}" s="{styles.with_number_format(xf, fmt_id)}"><v>{to_excel(value)}</v></c>'
+    if isinstance(value, Number):
+        if isinstance(value, Integral):
+            return f'<c r="{ref}"{s_attr}><v>{int(value)}</v></c>'
+        # float, Decimal, ... -> số thực (không cắt phần lẻ), cùng format "%.16g" với openpyxl (3.0 -> "3")
+        value = float(value)
+        if not math.isfinite(value):
+            return f'<c r="{ref}"{s_attr}/>' if xf else ""
+        return f'<c r="{ref}"{s_attr}><v>{value:.16g}</v></c>'
+    raise ValueError(f"Cannot convert {value!r} to Excel")
+
+
+def _workbook_xml(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<workbook xmlns="{SHEET_NS}" xmlns:r="{REL_NS}">'
+        f'<sheets><sheet name={quoteattr(sheet_name)} sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def write_sheet_xml(output_path, sheet_name, pre_header_rows, header_cells, data_rows, num_columns):
+    """Ghi workbook 1 sheet bằng cách stream XML từng dòng vào zip.
+
+    - pre_header_rows / header_cells: list các dict {'value', 'font', 'fill', 'border', 'alignment'}.
+    - data_rows: iterator trả về list giá trị của từng dòng dữ liệu (không style).
+    """
+    styles = StyleTable()
+    with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<worksheet xmlns="{SHEET_NS}" xmlns:r="{REL_NS}"><sheetData>'
+            ).encode("utf-8"))
+
+            letters = [get_column_letter(i) for i in range(1, num_columns + 1)]
+            row_idx = 0
+            chunk = []
+
+            # pre-header + header: ít dòng, có style -> tra bảng style cho từng ô
+            for cells in list(pre_header_rows) + [header_cells]:
+                row_idx += 1
+                parts = [f'<row r="{row_idx}">']
+                for col, meta in enumerate(cells):
+                    xf = styles.add(meta['font'], meta['fill'], meta['border'], meta['alignment'])
+                    parts.append(cell_xml(f"{letters[col]}{row_idx}", meta['value'], xf, styles))
+                parts.append('</row>')
+                chunk.append("".join(parts))
+
+            for values in data_rows:
+                row_idx += 1
+                r = str(row_idx)
+                parts = [f'<row r="{r}">']
+                for col, value in enumerate(values):
+                    parts.append(cell_xml(letters[col] + r, value, 0, styles))
+                parts.append('</row>')
+                chunk.append("".join(parts))
+                if len(chunk) >= WRITE_CHUNK_ROWS:
+                    sheet.write("".join(chunk).encode("utf-8"))
+                    chunk = []
+
+            chunk.append('</sheetData></worksheet>')
+            sheet.write("".join(chunk).encode("utf-8"))
+
+        zf.writestr("[Content_Types].xml", CONTENT_TYPES_XML)
+        zf.writestr("_rels/.rels", ROOT_RELS_XML)
+        zf.writestr("xl/workbook.xml", _workbook_xml(sheet_name))
+        zf.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS_XML)
+        zf.writestr("xl/styles.xml", styles.to_xml())
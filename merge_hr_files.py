@@ -1,38 +1,72 @@
 import time
-import pandas as pd
+import logging
 import os
+import queue
+import threading
+import pandas as pd
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from logic import instrumentation
+from logic.excel_reader import cached_read, read_excel
+from logic.job_queue import SettleTracker
+from logic.log_setup import setup_logging
+from logic.resident_master import ResidentMaster
+
 logs_path = "logs"
+# Log qua hàng đợi, writer nền ghi theo lô: logger -> file trong logs_path (None: chỉ console)
+LOG_ROUTES = {
+    "hr_watcher.errors": {'file': 'merge_error.log'},
+    "hr_watcher.events": {'file': 'watchdog_log.txt'},
+    "hr_watcher.merges": {'file': 'merge_log.txt', 'console': False},
+    "hr_watcher.missing_sso": {'file': 'missing_SSO_log.jsonl', 'format': 'json', 'console': False},
+}
+# Cùng 1 event (loại + path) chỉ ghi 1 lần trong N giây; Excel save bắn hàng loạt event giống nhau
+WATCHDOG_LOG_INTERVAL = 5.0
+log = logging.getLogger("hr_watcher")
+error_log = logging.getLogger("hr_watcher.errors")
+event_log = logging.getLogger("hr_watcher.events")
+merge_log = logging.getLogger("hr_watcher.merges")
+missing_sso_log = logging.getLogger("hr_watcher.missing_sso")
+MASTER_OUTPUT_FILE = os.path.join("update", "master_data_updated.xlsx")
+# Ghi master xuống file sau tối đa N giây hoặc khi có đủ N dòng thay đổi
+MASTER_FLUSH_INTERVAL = 30.0
+MASTER_FLUSH_ROWS = 1000
+# Metrics theo stage (JSON lines + file Prometheus, bật ở entry point); đặt HR_METRICS_DIR="" để tắt
+METRICS_DIR = os.environ.get(instrumentation.METRICS_DIR_ENV, os.path.join(logs_path, "metrics"))
 
-def read_file_with_retry(file_path, retries=3, delay=3):
-    """Đọc file Excel với retry để xử lý lỗi file đang được sử dụng."""
+def read_file_with_retry(file_path, retries=3, delay=3, use_cache=True, columns=None):
+    """Đọc file Excel với retry để xử lý lỗi file đang được sử dụng (mặc định qua cache snapshot).
+
+    Mặc định đọc toàn bộ cột: master_data_updated ở đây ghi lại mọi cột, không theo template.
+    """
     for attempt in range(retries):
         try:
-            return pd.read_excel(file_path)
+            with instrumentation.stage("read_excel") as st:
+                if use_cache:
+                    df = cached_read(file_path, columns=columns)
+                else:
+                    df = read_excel(file_path, columns=columns)
+                st.add("rows", len(df))
+                st.add("bytes_read", instrumentation.file_size(file_path))
+            return df
         except Exception as e:
-            print(f"[{time.ctime()}] Retry {attempt + 1}/{retries} for {file_path}: {e}")
-            with open(os.path.join(logs_path, 'merge_error.log'), 'a') as log_file:
-                log_file.write(f"[{time.ctime()}] Retry {attempt + 1}/{retries} for {file_path}: {e}\n")
+            error_log.error(f"Retry {attempt + 1}/{retries} for {file_path}: {e}")
             time.sleep(delay)
     raise Exception(f"[{time.ctime()}] Failed to read {file_path} after {retries} attempts")
 
 
-def is_file_stable(file_path, check_interval=1, max_checks=5):
-    """Kiểm tra file có ổn định (không còn được ghi) không."""
-    if not os.path.exists(file_path):
-        return False
-    initial_size = os.path.getsize(file_path)
-    for _ in range(max_checks):
-        time.sleep(check_interval)
-        if not os.path.exists(file_path):
-            return False
-        current_size = os.path.getsize(file_path)
-        if current_size == initial_size:
-            return True
-        initial_size = current_size
-    return False
+def log_missing_sso(file_path, hr_code, hr_data, missing):
+    """Ghi 1 record JSON cho các dòng thiếu SSO: file, mã HR, số dòng, EID và số dòng Excel (1-based, tính header)."""
+    rows = missing[missing].index
+    eids = hr_data.loc[missing, 'EID'].tolist() if 'EID' in hr_data.columns else []
+    missing_sso_log.warning("Rows with missing SSO", extra={'fields': {
+        'file': file_path,
+        'hr_code': hr_code,
+        'count': len(rows),
+        'eids': [None if pd.isna(e) else e for e in eids],
+        'rows': [int(i) + 2 for i in rows],
+    }})
 
 
 def extract_hr_code(file_name):
@@ -43,96 +77,236 @@ def extract_hr_code(file_name):
     return base_name  # Trả về tên không có tiền tố nếu không có HR_
 
 
-def merge_hr_files(file_path):
-    """Gộp file HR vào file master, điền SSO từ tên file nếu thiếu."""
-    hr_files_dir = "hr_files"
-    output_dir = "update"
-    output_file = os.path.join(output_dir, "master_data_updated.xlsx")
+def load_hr_file(file_path):
+    """Đọc 1 file HR, điền SSO từ tên file nếu thiếu. Trả về None nếu lỗi."""
+    hr_code = extract_hr_code(os.path.basename(file_path))
+    log.info(f"Processing file: {file_path}, HR code: {hr_code}")
 
-    # Kiểm tra file có phải là .xlsx và không phải file tạm
-    if not file_path.endswith('.xlsx') or os.path.basename(file_path).startswith('~$'):
-        print(f"[{time.ctime()}] Skipping invalid file: {file_path}")
-        return
+    try:
+        # File HR vừa thay đổi -> đọc thẳng, không tạo snapshot trong thư mục đang được watch
+        hr_data = read_file_with_retry(file_path, use_cache=False)
+        with instrumentation.stage("normalize") as st:
+            st.add("rows", len(hr_data))
+            if 'SSO' not in hr_data.columns:
+                log.warning(f"File {file_path} does not contain 'SSO' column. Adding SSO column.")
+                hr_data['SSO'] = hr_code
+            else:
+                # Ghi log các hàng thiếu SSO
+                missing_SSO = hr_data['SSO'].isna() | (hr_data['SSO'] == '')
+                if missing_SSO.any():
+                    log.warning(f"Found {missing_SSO.sum()} rows with missing SSO in {file_path}")
+                    log_missing_sso(file_path, hr_code, hr_data, missing_SSO)
+                    # Điền SSO từ tên file
+                    hr_data.loc[missing_SSO, 'SSO'] = hr_code
+                    st.add("missing_sso", int(missing_SSO.sum()))
+        log.info(f"Reading file: {file_path} with {len(hr_data)} rows")
+        return hr_data
+    except Exception as e:
+        error_log.error(f"Error reading {file_path}: {e}")
+        return None
 
-    # Kiểm tra file ổn định
-    if not is_file_stable(file_path):
-        print(f"[{time.ctime()}] File {file_path} is not stable, skipping.")
-        return
 
-    # Trích xuất mã HR từ tên file
-    hr_code = extract_hr_code(os.path.basename(file_path))
-    print(f"[{time.ctime()}] Processing file: {file_path}, HR code: {hr_code}")
+def open_master(output_file=MASTER_OUTPUT_FILE):
+    """Nạp master thường trú (EID -> dòng). Trả về None nếu không đọc được file master."""
+    try:
+        master = ResidentMaster(
+            output_file,
+            key='EID',
+            reader=read_file_with_retry,
+            flush_interval=MASTER_FLUSH_INTERVAL,
+            flush_rows=MASTER_FLUSH_ROWS,
+        )
+        log.info(f"Loaded existing master data with {len(master)} rows")
+        return master
+    except Exception as e:
+        error_log.error(f"Error reading {output_file}: {e}")
+        return None
 
-    # Đọc file HR
+
+def flush_master(master, force=True):
+    """Ghi master thường trú xuống file (force=False: chỉ khi tới ngưỡng thời gian/số dòng)."""
     try:
-        hr_data = read_file_with_retry(file_path)
-        if 'SSO' not in hr_data.columns:
-            print(f"[{time.ctime()}] Warning: File {file_path} does not contain 'SSO' column. Adding SSO column.")
-            hr_data['SSO'] = hr_code
-        else:
-            # Ghi log các hàng thiếu SSO
-            missing_SSO = hr_data['SSO'].isna() | (hr_data['SSO'] == '')
-            if missing_SSO.any():
-                print(f"[{time.ctime()}] Found {missing_SSO.sum()} rows with missing SSO in {file_path}")
-                with open(os.path.join(logs_path, 'missing_SSO_log.txt'), 'a') as log_file:
-                    log_file.write(f"[{time.ctime()}] File {file_path}: {missing_SSO.sum()} rows missing SSO\n")
-                    log_file.write(f"Rows with missing SSO:\n{hr_data[missing_SSO][['EID']].to_string()}\n")
-                # Điền SSO từ tên file
-                hr_data.loc[missing_SSO, 'SSO'] = hr_code
-        print(f"[{time.ctime()}] Reading file: {file_path} with {len(hr_data)} rows")
+        with instrumentation.stage("flush_master") as st:
+            flushed = master.flush() if force else master.maybe_flush()
+            if flushed:
+                st.add("rows", len(master))
+                st.add("bytes_written", instrumentation.file_size(master.path))
+        if flushed:
+            log.info(f"Master data updated and saved to: {master.path} with {len(master)} rows")
+        return flushed
     except Exception as e:
-        print(f"[{time.ctime()}] Error reading file {file_path}: {e}")
-        with open(os.path.join(logs_path, 'merge_error.log'), 'a') as log_file:
-            log_file.write(f"[{time.ctime()}] Error reading {file_path}: {e}\n")
+        error_log.error(f"Error saving {master.path}: {e}")
+        return False
+
+
+def merge_hr_batch(file_paths, master=None):
+    """Gộp một lô file HR (đã ổn định) vào master bằng upsert theo EID.
+
+    Nếu truyền master thường trú thì chỉ upsert, việc ghi file do flush định kỳ đảm nhận;
+    ngược lại nạp master từ file, upsert và ghi ngay.
+    """
+    frames = []
+    for file_path in file_paths:
+        hr_data = load_hr_file(file_path)
+        if hr_data is None:
+            continue
+        if 'EID' not in hr_data.columns:
+            log.warning(f"File {file_path} does not contain 'EID' column, skipping.")
+            continue
+        frames.append((file_path, hr_data))
+    if not frames:
         return
 
-    # Đọc file master hiện tại (nếu tồn tại)
-    master_data = pd.DataFrame()
-    if os.path.exists(output_file):
-        try:
-            master_data = read_file_with_retry(output_file)
-            print(f"[{time.ctime()}] Loaded existing master data with {len(master_data)} rows")
-        except Exception as e:
-            print(f"[{time.ctime()}] Error reading master data {output_file}: {e}")
-            with open(os.path.join(logs_path, 'merge_error.log'), 'a') as log_file:
-                log_file.write(f"[{time.ctime()}] Error reading {output_file}: {e}\n")
-
-    # Loại bỏ các hàng trong master data có 'EID' trùng với hr_data
-    if 'EID' in hr_data.columns and not master_data.empty and 'EID' in master_data.columns:
-        master_data = master_data[~master_data['EID'].isin(hr_data['EID'])]
-        print(f"[{time.ctime()}] Removed duplicate rows from master for EID")
-
-    # Gộp dữ liệu
-    merged_data = pd.concat([master_data, hr_data], ignore_index=True)
-
-    # Xử lý trùng lặp
-    if 'EID' in merged_data.columns:
-        merged_data = merged_data.drop_duplicates(subset=['EID'], keep='last')
-        print(f"[{time.ctime()}] Rows after removing duplicates by 'EID': {len(merged_data)}")
+    own_master = master is None
+    if own_master:
+        master = open_master()
+        if master is None:
+            return
     else:
-        print(f"[{time.ctime()}] Warning: 'EID' not found. Using 'SSO' to check for duplicates.")
-        merged_data = merged_data.drop_duplicates(subset=['SSO'], keep='last')
+        with instrumentation.stage("check_external_change"):
+            reloaded = master.check_external_change()
+        if reloaded:
+            log.info(f"Master file {master.path} changed externally, reloaded with {len(master)} rows")
 
-    # Lưu file master
-    try:
-        merged_data.to_excel(output_file, index=False)
-        print(f"[{time.ctime()}] Master data updated and saved to: {output_file} with {len(merged_data)} rows")
-        with open(os.path.join(logs_path, 'merge_log.txt'), 'a') as log_file:
-            log_file.write(
-                f"[{time.ctime()}] Merged {len(hr_data)} rows from {file_path} (HR: {hr_code}) into {output_file} ({len(merged_data)} total rows)\n")
-    except Exception as e:
-        print(f"[{time.ctime()}] Error saving master data to {output_file}: {e}")
-        with open(os.path.join(logs_path, 'merge_error.log'), 'a') as log_file:
-            log_file.write(f"[{time.ctime()}] Error saving {output_file}: {e}\n")
+    for file_path, hr_data in frames:
+        with instrumentation.stage("upsert") as st:
+            updated, inserted = master.upsert(hr_data)
+            st.add("updated", updated)
+            st.add("inserted", inserted)
+        hr_code = extract_hr_code(os.path.basename(file_path))
+        log.info(f"Upserted {file_path}: {updated} updated, {inserted} inserted")
+        merge_log.info(
+            f"Merged {len(hr_data)} rows from {file_path} (HR: {hr_code}) into {master.path} ({len(master)} total rows)")
+
+    flush_master(master, force=own_master)
+
+
+class WatcherMetrics:
+    """Thống kê độ sâu hàng đợi và độ trễ từ event tới lúc merge xong."""
+
+    def __init__(self):
+        self.events = 0
+        self.batches = 0
+        self.files_merged = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def record_queue_depth(self, depth):
+        self.queue_depth = depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_batch(self, first_event_times):
+        """first_event_times: thời điểm (monotonic) event đầu tiên của từng file trong lô."""
+        now = time.monotonic()
+        self.batches += 1
+        for t in first_event_times:
+            latency = now - t
+            self.files_merged += 1
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self.total_latency += latency
+
+    def gauges(self):
+        """Giá trị hiện tại để ghi kèm metrics của run (logic.instrumentation)."""
+        return {
+            'watcher_events': self.events,
+            'watcher_batches': self.batches,
+            'watcher_files_merged': self.files_merged,
+            'watcher_queue_depth': self.queue_depth,
+            'watcher_max_queue_depth': self.max_queue_depth,
+            'watcher_latency_last_seconds': self.last_latency,
+            'watcher_latency_max_seconds': self.max_latency,
+            'watcher_latency_avg_seconds': self.total_latency / self.files_merged if self.files_merged else 0.0,
+        }
+
+    def summary(self):
+        avg = self.total_latency / self.files_merged if self.files_merged else 0.0
+        return (f"events={self.events} batches={self.batches} files={self.files_merged} "
+                f"queue_depth={self.queue_depth} max_queue_depth={self.max_queue_depth} "
+                f"latency_last={self.last_latency:.2f}s latency_avg={avg:.2f}s latency_max={self.max_latency:.2f}s")
+
+
+class MergeWorker(threading.Thread):
+    """Thread nền: debounce từng file, chờ file ổn định (không sleep chặn) rồi gộp cả đợt thành 1 lần merge."""
+
+    def __init__(self, event_queue, master=None, settle_seconds=2.0, max_batch_delay=30.0, poll_interval=0.5,
+                 metrics=None):
+        super().__init__(name="hr-merge-worker", daemon=True)
+        self.event_queue = event_queue
+        self.master = master
+        self.poll_interval = poll_interval
+        self.metrics = metrics or WatcherMetrics()
+        self.tracker = SettleTracker(settle_seconds, max_batch_delay)
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _drain_queue(self):
+        while True:
+            try:
+                path, event_time = self.event_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.tracker.add(path, event_time)
+
+    def _process_pending(self):
+        self._drain_queue()
+        self.metrics.record_queue_depth(self.event_queue.qsize() + len(self.tracker))
+        batch, first_events = self.tracker.take()
+        if not batch:
+            return
+
+        log.info(f"Merging batch of {len(batch)} files: {batch}")
+        with instrumentation.run("watcher_batch") as run_metrics:
+            try:
+                merge_hr_batch(batch, master=self.master)
+            except Exception as e:
+                error_log.error(f"Error merging batch {batch}: {e}")
+                if run_metrics is not None:
+                    run_metrics.status = 'error'
+            self.metrics.record_batch(first_events)
+            if run_metrics is not None:
+                run_metrics.gauges.update(self.metrics.gauges())
+                run_metrics.gauges['batch_files'] = len(batch)
+        log.info(f"Watcher metrics: {self.metrics.summary()}")
+
+    def _flush(self, force):
+        # Chỉ mở run metrics khi thật sự ghi file, tránh 1 bản ghi mỗi lần poll
+        if force or self.master.should_flush():
+            with instrumentation.run("watcher_flush"):
+                flush_master(self.master)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._process_pending()
+            if self.master is not None:
+                self._flush(force=False)
+            self._stop_event.wait(self.poll_interval)
+        # Tắt worker -> ghi nốt các thay đổi chưa flush
+        if self.master is not None:
+            self._flush(force=True)
 
 
 class HRFileWatcher(FileSystemEventHandler):
+    """Chỉ đưa path vào hàng đợi; việc chờ ổn định và merge do MergeWorker đảm nhận."""
+
+    def __init__(self, event_queue, metrics=None):
+        super().__init__()
+        self.event_queue = event_queue
+        self.metrics = metrics or WatcherMetrics()
+
+    def _enqueue(self, path):
+        self.metrics.events += 1
+        self.event_queue.put((path, time.monotonic()))
+
     def on_any_event(self, event):
-        """Ghi lại tất cả sự kiện để debug."""
+        """Ghi lại tất cả sự kiện để debug (event trùng liên tiếp bị gộp, xem WATCHDOG_LOG_INTERVAL)."""
         if not event.is_directory:
-            print(f"[{time.ctime()}] Event: {event.event_type}, Path: {event.src_path}")
-            with open(os.path.join(logs_path, 'watchdog_log.txt'), 'a') as log_file:
-                log_file.write(f"[{time.ctime()}] Event: {event.event_type}, Path: {event.src_path}\n")
+            event_log.info(f"Event: {event.event_type}, Path: {event.src_path}")
 
     def on_modified(self, event):
         """Xử lý khi file được chỉnh sửa."""
@@ -140,42 +314,50 @@ class HRFileWatcher(FileSystemEventHandler):
             if os.path.basename(event.src_path).startswith('~$'):
                 main_file = event.src_path.replace('~$', '')
                 if os.path.exists(main_file):
-                    print(
-                        f"[{time.ctime()}] Detected temporary file: {event.src_path}, checking main file: {main_file}")
-                    time.sleep(1)
-                    if is_file_stable(main_file):
-                        merge_hr_files(main_file)
+                    event_log.info(f"Detected temporary file: {event.src_path}, checking main file: {main_file}")
+                    self._enqueue(main_file)
             else:
-                print(f"[{time.ctime()}] Detected modification: {event.src_path}")
-                time.sleep(1)
-                if is_file_stable(event.src_path):
-                    merge_hr_files(event.src_path)
+                event_log.info(f"Detected modification: {event.src_path}")
+                self._enqueue(event.src_path)
 
     def on_created(self, event):
         """Xử lý khi file được tạo mới."""
         if not event.is_directory and event.src_path.endswith('.xlsx') and not os.path.basename(
                 event.src_path).startswith('~$'):
-            print(f"[{time.ctime()}] Detected new file: {event.src_path}")
-            time.sleep(1)
-            if is_file_stable(event.src_path):
-                merge_hr_files(event.src_path)
+            event_log.info(f"Detected new file: {event.src_path}")
+            self._enqueue(event.src_path)
 
 
 if __name__ == "__main__":
+    # Chỉ cấu hình logging/metrics khi chạy trực tiếp; hr_daemon import module này và tự cấu hình 1 lần
+    setup_logging(logs_path, routes=LOG_ROUTES, rate_limits={"hr_watcher.events": WATCHDOG_LOG_INTERVAL})
+    instrumentation.configure(METRICS_DIR)
     hr_files_dir = "hr_files"
     if not os.path.exists(hr_files_dir):
         raise FileNotFoundError(f"Directory {hr_files_dir} does not exist")
 
-    event_handler = HRFileWatcher()
+    os.makedirs(os.path.dirname(MASTER_OUTPUT_FILE), exist_ok=True)
+    master = open_master()
+    if master is None:
+        raise RuntimeError(f"Cannot load master data {MASTER_OUTPUT_FILE}")
+
+    event_queue = queue.Queue()
+    metrics = WatcherMetrics()
+    worker = MergeWorker(event_queue, master=master, metrics=metrics)
+    worker.start()
+
+    event_handler = HRFileWatcher(event_queue, metrics=metrics)
     observer = Observer()
     observer.schedule(event_handler, hr_files_dir, recursive=False)
     observer.start()
-    print(f"[{time.ctime()}] Monitoring {hr_files_dir} directory for changes...")
+    log.info(f"Monitoring {hr_files_dir} directory for changes...")
 
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
-        print(f"[{time.ctime()}] Stopped monitoring")
-    observer.join()
\ No newline at end of file
+        log.info("Stopped monitoring")
+    observer.join()
+    worker.stop()
+    worker.join()
@@ -1,27 +1,43 @@
+import functools
 import os
 import time
 import pandas as pd
 import logging
-import schedule
-from filelock import FileLock
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-from logic import write_preserving_formulas_and_styles
+from logic import instrumentation, write_preserving_formulas_and_styles
+from logic.hr_manifest import HRFileManifest
+from logic.master_store import MasterStore
+from logic.master_stream import merge_master_frame, stream_merge
+from logic.output_commit import UNCHECKED, StaleOutputError, commit_output, generation
+from logic.pipeline import DEFAULT_CONFIG_FILE, load_config
+from logic.cron import load_schedules, next_due
+from logic.excel_reader import cached_read, read_excel, sheet_columns
+from logic.log_setup import setup_logging
 
-# Cấu hình logging
 logs_path = "logs"
-os.makedirs(logs_path, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(logs_path, 'merge.log')),
-        logging.StreamHandler()
-    ]
-)
+# Metrics theo stage (JSON lines + file Prometheus, bật ở entry point); đặt HR_METRICS_DIR="" để tắt
+METRICS_DIR = os.environ.get(instrumentation.METRICS_DIR_ENV, os.path.join(logs_path, "metrics"))
 
 SKIP_MASTER = 11
 SHEET_MASTER = "Masterdata_PSteam"
+MANIFEST_DIR = ".hr_manifest"
+MERGE_WORKERS = min(8, os.cpu_count() or 4)
+# File SQLite làm nguồn dữ liệu master (xlsx chỉ là view xuất ra), vd. "update/master.sqlite";
+# không đặt -> master_data.xlsx là nguồn như cũ
+MASTER_STORE_FILE = os.environ.get("HR_MASTER_STORE") or None
+HR_SOURCE = "hr_files"
+# Cột luôn đọc từ file HR dù template không có (khóa merge, owner)
+REQUIRED_COLUMNS = ['EID', 'SSO']
+# master_data.xlsx từ kích thước này (byte) được merge kiểu stream: bộ nhớ theo lượng dữ liệu HR chứ không theo
+# kích thước master (đổi lại đọc master bằng openpyxl read-only thay vì engine nhanh); 0 -> luôn stream.
+# Chỉ khác cách đọc: kết quả giống hệt nhánh DataFrame
+STREAM_MERGE_MIN_BYTES = int(os.environ.get("HR_STREAM_MERGE_MIN_BYTES", 32 * 1024 * 1024))
+# Số lần làm lại merge khi master_data.xlsx bị process khác ghi trong lúc đang merge
+COMMIT_RETRIES = 3
+# "xml": stream XML trực tiếp (nhanh); "openpyxl": WriteOnlyCell như cũ
+WRITER_ENGINE = "xml"
 keep_format_columns = [
         "SENIORITY", "PROBATION CONTRACT NO", "FROM", "TO", "DEFINITE CONTRACT 1 NO", "FROM", "TO",
         "DEFINITE CONTRACT 2 NO", "FROM", "TO", "IN-DEFINITE CONTRACT  NO", "FROM",
@@ -29,11 +45,21 @@ keep_format_columns = [
     ]
 
 
-def read_file_with_retry(file_path, retries=5, initial_delay=1):
-    """Đọc file Excel với cơ chế retry và backoff."""
+def read_file_with_retry(file_path, retries=5, initial_delay=1, use_cache=True, columns=None):
+    """Đọc file Excel với cơ chế retry và backoff (mặc định qua cache snapshot cạnh file).
+
+    columns: chỉ parse các cột này (cột thiếu trong file bỏ qua); None -> đọc toàn bộ cột.
+    """
     for attempt in range(retries):
         try:
-            return pd.read_excel(file_path, skiprows=11)  # Đọc toàn bộ cột
+            with instrumentation.stage("read_excel") as st:
+                if use_cache:
+                    df = cached_read(file_path, columns=columns, skiprows=SKIP_MASTER)
+                else:
+                    df = read_excel(file_path, columns=columns, skiprows=SKIP_MASTER)
+                st.add("rows", len(df))
+                st.add("bytes_read", instrumentation.file_size(file_path))
+            return df
         except Exception as e:
             delay = initial_delay * (2 ** attempt)  # Exponential backoff
             logging.error(f"Retry {attempt + 1}/{retries} for {file_path}: {e}")
@@ -68,8 +94,250 @@ def validate_excel_schema(df, required_columns=['EID']):
     return all(col in df.columns for col in required_columns)
 
 
-def merge_hr_files():
-    """Gộp tất cả file HR trong thư mục hr_files và hợp nhất với master_data."""
+def fill_missing_sso(hr_data, hr_code):
+    """Điền SSO bằng mã HR cho các dòng thiếu (thêm cột nếu chưa có). Trả về số dòng đã điền."""
+    if 'SSO' not in hr_data.columns:
+        hr_data['SSO'] = hr_code
+        return len(hr_data)
+    missing_sso = hr_data['SSO'].isna() | (hr_data['SSO'] == '')
+    if missing_sso.any():
+        hr_data.loc[missing_sso, 'SSO'] = hr_code
+    return int(missing_sso.sum())
+
+
+def template_columns(template_path):
+    """Các cột cần đọc từ file HR/master: header của template (writer chỉ ghi các cột này) + REQUIRED_COLUMNS.
+
+    None (đọc toàn bộ cột) nếu chưa có template.
+    """
+    if not os.path.exists(template_path):
+        return None
+    return [str(c) for c in sheet_columns(template_path, skiprows=SKIP_MASTER)] + REQUIRED_COLUMNS
+
+
+def load_hr_file(file_path, columns=None, check_stable=True):
+    """Đọc và chuẩn hóa 1 file HR (kiểm tra schema, điền SSO).
+
+    check_stable=False: bỏ is_file_stable (sleep >= 1s) cho file bên gọi đã biết là yên (vd. SettleTracker).
+
+    Chạy được trong process con: trả về (DataFrame hoặc None nếu lỗi, danh sách log (level, message),
+    metrics các stage) để process cha ghi log theo đúng thứ tự file và cộng metrics vào run hiện tại.
+    """
+    with instrumentation.capture() as captured:
+        hr_data, logs = _load_hr_file(file_path, columns, check_stable)
+    return hr_data, logs, captured.export()
+
+
+def _load_hr_file(file_path, columns=None, check_stable=True):
+    logs = []
+    if check_stable:
+        with instrumentation.stage("stability_check"):
+            stable = is_file_stable(file_path)
+        if not stable:
+            logs.append((logging.WARNING, f"File {file_path} is not stable, skipping"))
+            return None, logs
+
+    hr_code = extract_hr_code(os.path.basename(file_path))
+    logs.append((logging.INFO, f"Processing file: {file_path}, HR code: {hr_code}"))
+
+    try:
+        # File HR đã được cache qua manifest, không cần snapshot riêng
+        hr_data = read_file_with_retry(file_path, use_cache=False, columns=columns)
+        if not validate_excel_schema(hr_data):
+            logs.append((logging.ERROR, f"Invalid schema in {file_path}"))
+            return None, logs
+
+        had_sso = 'SSO' in hr_data.columns
+        with instrumentation.stage("normalize") as st:
+            missing_sso = fill_missing_sso(hr_data, hr_code)
+            st.add("rows", len(hr_data))
+            st.add("missing_sso", missing_sso if had_sso else 0)
+        if had_sso and missing_sso:
+            logs.append((logging.WARNING, f"Found {missing_sso} rows with missing SSO in {file_path}"))
+        return hr_data, logs
+    except Exception as e:
+        logs.append((logging.ERROR, f"Error processing {file_path}: {e}"))
+        return None, logs
+
+
+def load_hr_files_parallel(file_paths, max_workers=MERGE_WORKERS, columns=None, executor=None, check_stable=True):
+    """Đọc song song các file HR bằng process pool, trả về list (file_path, DataFrame hoặc None) theo đúng thứ tự đầu vào.
+
+    executor: pool dùng chung (vd. của hr_daemon.py), không bị shutdown ở đây; None -> tạo pool riêng cho lần gọi.
+    """
+    load = functools.partial(load_hr_file, columns=columns, check_stable=check_stable)
+    own_executor = None
+    if executor is not None:
+        results = executor.map(load, file_paths)
+    elif max_workers <= 1 or len(file_paths) <= 1:
+        results = map(load, file_paths)
+    else:
+        executor = own_executor = ProcessPoolExecutor(max_workers=min(max_workers, len(file_paths)))
+        results = executor.map(load, file_paths)
+
+    loaded = []
+    try:
+        for file_path, (hr_data, logs, captured) in zip(file_paths, results):
+            for level, message in logs:
+                logging.log(level, message)
+            instrumentation.merge_stages(captured)
+            loaded.append((file_path, hr_data))
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown()
+    return loaded
+
+
+def _save_to_xlsx(merged_data, deleted_eids, master_updated_file, master_origin_file, columns=None):
+    """Ghi master_data_updated và đọc-lọc-ghi lại toàn bộ master_data.xlsx (master_data.xlsx là nguồn dữ liệu).
+
+    master_data.xlsx lớn (>= STREAM_MERGE_MIN_BYTES) được merge kiểu stream qua logic.master_stream.
+    """
+    # Lưu file master_data_updated (dựng lại toàn bộ từ file HR -> không cần kiểm tra generation)
+    try:
+        commit_output(master_updated_file, lambda tmp_path: write_master_xlsx(master_origin_file, tmp_path, merged_data))
+        logging.info(f"Saved master_data_updated with {len(merged_data)} rows")
+    except Exception as e:
+        logging.error(f"Error saving {master_updated_file}: {e}")
+        return False
+
+    # Hợp nhất với master_data
+    if not os.path.exists(master_origin_file):
+        logging.warning(f"Don't merge data with {master_origin_file}")
+        return True
+    try:
+        for attempt in range(COMMIT_RETRIES):
+            # Generation đọc trước khi đọc dữ liệu: file bị process khác ghi trong lúc merge -> làm lại
+            base = generation(master_origin_file)
+            written = {}
+            if use_stream_merge(master_origin_file, merged_data):
+                render = functools.partial(_stream_master_xlsx, master_origin_file, merged_data, deleted_eids,
+                                           written)
+            else:
+                origin_data = read_file_with_retry(master_origin_file, columns=columns)
+                with instrumentation.stage("merge_origin") as st:
+                    if 'EID' in origin_data.columns and 'EID' in merged_data.columns:
+                        # Cùng quy tắc với nhánh stream: thay tại chỗ, xóa EID của file HR đã xóa, EID mới nối cuối
+                        final_data, counts = merge_master_frame(origin_data, merged_data, deleted_eids)
+                        logging.info(f"Merged {master_origin_file}: {counts['replaced']} replaced, "
+                                     f"{counts['appended']} appended, {counts['deleted']} deleted, "
+                                     f"{counts['skipped']} HR rows without EID skipped")
+                    else:
+                        final_data = pd.concat([origin_data, merged_data], ignore_index=True)
+                    st.add("rows", len(final_data))
+                written['rows'] = len(final_data)
+                render = lambda tmp_path: write_master_xlsx(master_origin_file, tmp_path, final_data)  # noqa: E731
+
+            # Lưu lại master_data
+            try:
+                commit_output(master_origin_file, render, expected=base)
+            except StaleOutputError:
+                logging.warning(f"{master_origin_file} changed while merging, retry {attempt + 1}/{COMMIT_RETRIES}")
+                continue
+            logging.info(f"Final merged data saved with {written['rows']} rows")
+            return True
+        logging.error(f"Gave up merging with {master_origin_file}: file kept changing")
+        return False
+    except Exception as e:
+        logging.error(f"Error merging with {master_origin_file}: {e}")
+        return False
+
+
+def use_stream_merge(master_origin_file, merged_data):
+    """Master đủ lớn (>= STREAM_MERGE_MIN_BYTES) -> merge kiểu stream thay vì đọc cả master vào DataFrame.
+
+    Hai nhánh cho cùng kết quả (stream_merge/merge_master_frame): dòng được thay giữ nguyên vị trí trong master
+    (như MasterStore), EID mới nối vào cuối, dòng EID rỗng/trùng không thuộc file HR giữ nguyên.
+    """
+    if 'EID' not in merged_data.columns:
+        return False
+    try:
+        return os.path.getsize(master_origin_file) >= STREAM_MERGE_MIN_BYTES
+    except OSError:
+        return False
+
+
+def _stream_master_xlsx(master_origin_file, merged_data, deleted_eids, written, output_path):
+    """Render master mới bằng stream_merge (master đọc từng dòng từ file, không dựng DataFrame)."""
+    counts = stream_merge(master_origin_file, output_path, merged_data, deleted_eids,
+                          template_path=master_origin_file, sheet_name=SHEET_MASTER, header_skip_rows=SKIP_MASTER,
+                          keep_formula_columns=keep_format_columns, engine=WRITER_ENGINE)
+    written['rows'] = counts['rows']
+    logging.info(f"Streamed {master_origin_file}: {counts['replaced']} replaced, {counts['appended']} appended, "
+                 f"{counts['deleted']} deleted, {counts['skipped']} HR rows without EID skipped")
+
+
+def write_master_xlsx(template_path, output_path, df):
+    write_preserving_formulas_and_styles(
+        template_path=template_path,
+        output_path=output_path,
+        df=df,
+        sheet_name=SHEET_MASTER,
+        header_skip_rows=SKIP_MASTER,
+        keep_formula_columns=keep_format_columns,
+        engine=WRITER_ENGINE
+    )
+
+
+def _save_to_store(merged_data, deleted_eids, master_updated_file, master_origin_file, columns=None):
+    """Upsert dữ liệu HR vào MasterStore (SQLite), chỉ xuất lại 2 file xlsx khi store có dòng đổi."""
+    try:
+        with MasterStore(MASTER_STORE_FILE) as store:
+            origin_generation = generation(master_origin_file)
+            with instrumentation.stage("store_sync") as st:
+                # Lần đầu, hoặc master_data.xlsx bị sửa tay sau lần xuất trước -> nạp lại làm dữ liệu gốc
+                if os.path.exists(master_origin_file) and (
+                        store.get_meta('bootstrapped') is None or store.external_change(master_origin_file)):
+                    origin_data = read_file_with_retry(master_origin_file, columns=columns)
+                    changed = store.replace(origin_data)
+                    store.mark_exported(master_origin_file)
+                    store.set_meta('bootstrapped', time.time())
+                    logging.info(f"Loaded {len(origin_data)} rows from {master_origin_file} into store ({changed} changed)")
+
+                changed = store.sync_source(merged_data, HR_SOURCE) if 'EID' in merged_data.columns else 0
+                # EID của file HR đã bị xóa (trừ EID vẫn còn trong file HR khác)
+                live_eids = set(merged_data['EID'].dropna()) if 'EID' in merged_data.columns else set()
+                removed = store.delete(deleted_eids - live_eids)
+                st.add("changed", changed)
+                st.add("deleted", removed)
+            logging.info(f"Store {MASTER_STORE_FILE}: {changed} rows changed, {removed} deleted, {len(store)} rows")
+
+            if not os.path.exists(master_origin_file):
+                logging.warning(f"Don't merge data with {master_origin_file}")
+                return True
+
+            def writer(path, df, expected=UNCHECKED):
+                commit_output(path, lambda tmp_path: write_master_xlsx(master_origin_file, tmp_path, df),
+                              expected=expected)
+
+            rows = store.export_xlsx(master_updated_file, writer, view=store.source_frame)
+            if rows is not None:
+                logging.info(f"Saved master_data_updated with {rows} rows")
+            # master_data.xlsx bị sửa sau khi store đã nạp -> không ghi đè, lần chạy sau sẽ nạp lại
+            rows = store.export_xlsx(master_origin_file, functools.partial(writer, expected=origin_generation))
+            if rows is not None:
+                logging.info(f"Final merged data saved with {rows} rows")
+            else:
+                logging.info("No rows changed since last export, skip writing master files")
+    except StaleOutputError as e:
+        logging.warning(f"{e}; it will be reloaded into the store on the next run")
+        return False
+    except Exception as e:
+        logging.error(f"Error saving master store {MASTER_STORE_FILE}: {e}")
+        return False
+    return True
+
+
+def merge_hr_files(max_workers=MERGE_WORKERS, executor=None):
+    """Gộp tất cả file HR trong thư mục hr_files và hợp nhất với master_data. Trả về True nếu ghi xong."""
+    with instrumentation.run("scheduled_merge") as metrics:
+        saved = _merge_hr_files(max_workers, executor)
+        if not saved and metrics is not None:
+            metrics.status = 'error'
+    return saved
+
+
+def _merge_hr_files(max_workers, executor=None):
     hr_files_dir = "hr_files"
     output_dir = "update"
     master_updated_file = os.path.join(output_dir, "master_data_updated.xlsx")
@@ -77,105 +345,109 @@ def merge_hr_files():
     os.makedirs(output_dir, exist_ok=True)
 
     start_time = time.time()
-    merged_data = pd.DataFrame()
+    manifest = HRFileManifest(os.path.join(output_dir, MANIFEST_DIR))
+    # Chỉ parse các cột template cần; đổi header template -> frame cũ trong manifest bị đọc lại
+    columns = template_columns(master_origin_file)
 
     # Quét tất cả file .xlsx trong thư mục hr_files
-    for file_name in os.listdir(hr_files_dir):
+    hr_file_paths = []
+    # Sắp xếp tên file để thứ tự gộp (và keep='last' khi trùng EID) luôn cố định
+    for file_name in sorted(os.listdir(hr_files_dir)):
         file_path = os.path.join(hr_files_dir, file_name)
         if not file_name.endswith('.xlsx') or file_name.startswith('~$'):
             logging.info(f"Skipping invalid file: {file_path}")
             continue
+        hr_file_paths.append(file_path)
 
-        if not is_file_stable(file_path):
-            logging.warning(f"File {file_path} is not stable, skipping")
-            continue
-
-        hr_code = extract_hr_code(file_name)
-        logging.info(f"Processing file: {file_path}, HR code: {hr_code}")
-
-        try:
-            hr_data = read_file_with_retry(file_path)
-            if not validate_excel_schema(hr_data):
-                logging.error(f"Invalid schema in {file_path}")
-                continue
+    with instrumentation.stage("manifest") as st:
+        # File bị xóa kể từ lần chạy trước -> loại EID của chúng khỏi kết quả
+        deleted_frames = manifest.prune(hr_file_paths)
+        deleted_eids = set()
+        for frame in deleted_frames.values():
+            if 'EID' in frame.columns:
+                deleted_eids.update(frame['EID'].dropna())
+        if deleted_frames:
+            logging.info(f"Detected {len(deleted_frames)} deleted HR files ({len(deleted_eids)} EIDs)")
 
-            if 'SSO' not in hr_data.columns:
-                hr_data['SSO'] = hr_code
+        # File không đổi -> lấy frame đã chuẩn hóa từ manifest, khỏi parse lại
+        frames = {}
+        changed_paths = []
+        for file_path in hr_file_paths:
+            hr_data = manifest.lookup(file_path, params=columns)
+            if hr_data is not None:
+                frames[file_path] = hr_data
             else:
-                missing_sso = hr_data['SSO'].isna() | (hr_data['SSO'] == '')
-                if missing_sso.any():
-                    logging.warning(f"Found {missing_sso.sum()} rows with missing SSO in {file_path}")
-                    hr_data.loc[missing_sso, 'SSO'] = hr_code
+                changed_paths.append(file_path)
+        logging.info(f"Reused {len(frames)}/{len(hr_file_paths)} unchanged HR files from manifest")
+        st.add("files", len(hr_file_paths))
+        st.add("reused", len(frames))
+        st.add("deleted", len(deleted_frames))
 
-            merged_data = pd.concat([merged_data, hr_data], ignore_index=True)
-            logging.info(f"Merged {len(hr_data)} rows from {file_path}")
-        except Exception as e:
-            logging.error(f"Error processing {file_path}: {e}")
-            continue
+    # File mới/đã đổi -> đọc song song, lỗi từng file chỉ bị log và bỏ qua
+    with instrumentation.stage("load_hr_files") as st:
+        for file_path, hr_data in load_hr_files_parallel(changed_paths, max_workers=max_workers, columns=columns,
+                                                         executor=executor):
+            if hr_data is None:
+                st.add("failed")
+                continue
+            manifest.update(file_path, hr_data, params=columns)
+            frames[file_path] = hr_data
+            st.add("rows", len(hr_data))
+        st.add("files", len(changed_paths))
 
-    # Loại bỏ trùng lặp trong merged_data
-    if 'EID' in merged_data.columns:
-        merged_data = merged_data.drop_duplicates(subset=['EID'], keep='last')
-        logging.info(f"Rows after removing duplicates: {len(merged_data)}")
-
-    # Lưu file master_data_updated
-    lock_file = f"{master_updated_file}.lock"
-    with FileLock(lock_file):
-        write_preserving_formulas_and_styles(
-            template_path=master_origin_file,  # file template gốc
-            output_path=master_updated_file,  # file đích
-            df=merged_data,  # dữ liệu đã merge
-            sheet_name=SHEET_MASTER,  # tên sheet trong template
-            header_skip_rows=SKIP_MASTER,  # số row skip trước header
-            keep_formula_columns=keep_format_columns  # cột cần giữ công thức
-        )
-        try:
-            logging.info(f"Saved master_data_updated with {len(merged_data)} rows")
-        except Exception as e:
-            logging.error(f"Error saving {master_updated_file}: {e}")
-            return
+    ordered_frames = [frames[p] for p in hr_file_paths if p in frames]
+    for file_path in hr_file_paths:
+        if file_path in frames:
+            logging.info(f"Merged {len(frames[file_path])} rows from {file_path}")
+    with instrumentation.stage("concat_dedupe") as st:
+        # Gộp 1 lần duy nhất thay vì concat dần trong vòng lặp
+        merged_data = pd.concat(ordered_frames, ignore_index=True) if ordered_frames else pd.DataFrame()
 
-    # Hợp nhất với master_data
-    if os.path.exists(master_origin_file):
-        try:
-            origin_data = read_file_with_retry(master_origin_file)
-            # Loại bỏ các EID trong origin_data có trong merged_data
-            if 'EID' in origin_data.columns and 'EID' in merged_data.columns:
-                origin_data = origin_data[~origin_data['EID'].isin(merged_data['EID'])]
-            final_data = pd.concat([origin_data, merged_data], ignore_index=True)
-            final_data = final_data.drop_duplicates(subset=['EID'], keep='last')
+        # Loại bỏ trùng lặp trong merged_data
+        if 'EID' in merged_data.columns:
+            merged_data = merged_data.drop_duplicates(subset=['EID'], keep='last')
+            logging.info(f"Rows after removing duplicates: {len(merged_data)}")
+        st.add("rows", len(merged_data))
 
-            # Lưu lại master_data
-            with FileLock(lock_file):
-                write_preserving_formulas_and_styles(
-                    template_path=master_origin_file,  # file template gốc
-                    output_path=master_origin_file,  # file đích
-                    df=final_data,  # dữ liệu đã merge
-                    sheet_name=SHEET_MASTER,  # tên sheet trong template
-                    header_skip_rows=SKIP_MASTER,  # số row skip trước header
-                    keep_formula_columns=keep_format_columns  # cột cần giữ công thức
-                )
-                # final_data.to_excel(master_updated_file, index=False)
-                logging.info(f"Final merged data saved with {len(final_data)} rows")
-        except Exception as e:
-            logging.error(f"Error merging with {master_origin_file}: {e}")
+    if MASTER_STORE_FILE:
+        saved = _save_to_store(merged_data, deleted_eids, master_updated_file, master_origin_file, columns)
     else:
-        logging.warning(f"Don't merge data with {master_origin_file}")
+        saved = _save_to_xlsx(merged_data, deleted_eids, master_updated_file, master_origin_file, columns)
+    if not saved:
+        return False
+
+    # Chỉ lưu manifest khi master đã được ghi xong, để lần chạy sau không bỏ sót file xóa
+    with instrumentation.stage("manifest_save"):
+        manifest.save()
     duration = time.time() - start_time
     logging.info(f"Completed merge in {duration:.2f} seconds")
+    return True
+
 
+def schedule_merge(config_path=DEFAULT_CONFIG_FILE):
+    """Chạy merge_hr_files theo các lịch cron trong mục schedules của config.yaml.
 
-def schedule_merge():
-    time_schedule="14:38"
-    schedule.every().day.at(time_schedule).do(merge_hr_files)
-    logging.info(f"Scheduled merge job at {time_schedule} AM daily")
+    hr_daemon.py chạy cùng lịch này kèm watcher trong 1 process; chỉ dùng hàm này khi không chạy daemon.
+    """
+    schedules = load_schedules(load_config(config_path))
+    if not schedules:
+        raise ValueError(f"No schedules configured in {config_path}")
+    for name, cron in schedules.items():
+        logging.info(f"Scheduled merge job '{name}' at '{cron.expr}'")
 
     while True:
-        schedule.run_pending()
-        time.sleep(60)  # Kiểm tra mỗi phút
+        name, when = next_due(schedules)
+        # Ngủ từng đoạn ngắn để không lệch lịch khi máy sleep/đổi giờ
+        while datetime.now() < when:
+            time.sleep(min(60.0, max((when - datetime.now()).total_seconds(), 0.0)))
+        logging.info(f"Running scheduled merge '{name}'")
+        merge_hr_files()
 
 
 if __name__ == "__main__":
+    # Cấu hình logging: qua hàng đợi, writer nền ghi theo lô + xoay file (logic.log_setup)
+    setup_logging(logs_path, default_file='merge.log')
+    instrumentation.configure(METRICS_DIR)
     if not os.path.exists("hr_files"):
         raise FileNotFoundError("Directory hr_files does not exist")
     schedule_merge()
\ No newline at end of file
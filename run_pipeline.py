@@ -0,0 +1,41 @@
+import argparse
+import logging
+import os
+import time
+
+from logic import instrumentation
+from logic.log_setup import setup_logging
+from logic.pipeline import DEFAULT_CONFIG_FILE, build_pipeline, load_config
+
+logs_path = "logs"
+# Metrics theo stage (JSON lines + file Prometheus, bật ở entry point); đặt HR_METRICS_DIR="" để tắt
+METRICS_DIR = os.environ.get(instrumentation.METRICS_DIR_ENV, os.path.join(logs_path, "metrics"))
+
+
+def run_pipeline(config_path=DEFAULT_CONFIG_FILE, targets=None, force=False):
+    """Dựng master_data và các file HR_<sso>.xlsx theo config.yaml, chỉ chạy lại các stage có đầu vào đổi."""
+    config = load_config(config_path)
+    pipeline = build_pipeline(config)
+    start_time = time.time()
+    with instrumentation.run("pipeline"):
+        result = pipeline.run(targets=targets, force=force)
+    logging.info(f"Pipeline ran {len(result['ran'])} stages ({', '.join(result['ran']) or '-'}), "
+                 f"skipped {len(result['skipped'])} unchanged")
+    logging.info(f"Completed pipeline in {time.time() - start_time:.2f} seconds")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy pipeline hiring/emp/lineup/permission -> master + file HR")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE)
+    parser.add_argument("--target", action="append", help="chỉ chạy tới stage này (lặp lại được)")
+    parser.add_argument("--force", action="store_true", help="chạy lại mọi stage, bỏ qua cache")
+    args = parser.parse_args()
+    # Cấu hình logging: qua hàng đợi, writer nền ghi theo lô + xoay file (logic.log_setup)
+    setup_logging(logs_path, default_file='pipeline.log')
+    instrumentation.configure(METRICS_DIR)
+    run_pipeline(args.config, targets=args.target, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
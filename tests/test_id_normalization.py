@@ -0,0 +1,189 @@
+"""So sánh logic.id_normalization với bản gốc trong notebook (test.ipynb trước khi tách ra logic/).
+
+Các hàm _old_* bên dưới chép nguyên văn từ notebook, chỉ đổi tên để tránh trùng.
+"""
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from logic.id_normalization import clean_lineup, normalize_emp_id_columns, normalize_id_series
+
+logger = logging.getLogger(__name__)
+
+
+# ===================== BẢN GỐC (notebook) =====================
+
+def _clean_id_value(x):
+    """
+    Chuyển 1 ô (có thể int/float/str) về chuỗi chỉ chứa chữ số, xử lý .0 và scientific.
+    Trả về pd.NA nếu rỗng.
+    """
+    if pd.isna(x):
+        return pd.NA
+    s = str(x).strip()
+
+    # float hiển thị như '75203213222.0' hoặc scientific '7.52032e+11'
+    # nếu có 'e' hoặc 'E', format lại bằng float -> không mất precision cho 22 chữ số
+    if 'e' in s or 'E' in s:
+        try:
+            s = '{:.0f}'.format(float(x))
+        except Exception:
+            pass
+
+    # loại .0 cuối cùng (ví dụ '75203213222.0' -> '75203213222')
+    if s.endswith('.0'):
+        s = s[:-2]
+
+    # giữ lại chữ số
+    s = re.sub(r'\D+', '', s)
+
+    return s if s != '' else pd.NA
+
+
+def _old_normalize_id_series(ser: pd.Series, expected_len: int | None = None) -> pd.Series:
+    """
+    Chuyển series về chuỗi chữ số (string), remove non-digits, optional zfill tới expected_len.
+    Xử lý đúng các giá trị float hiển thị dạng '... .0' hoặc scientific notation để KHÔNG sinh thêm số 0.
+    """
+    cleaned = ser.map(_clean_id_value).astype("string")
+    if expected_len is not None:
+        cleaned = cleaned.map(lambda v: v.zfill(expected_len) if pd.notna(v) else v)
+    return cleaned
+
+
+def _old_clean_lineup(lineup, nat_col: str = "National ID (SSN/SIN) (National Identifiers)"):
+    # Lọc các giá trị chỉ chứa số
+    def is_valid_id(x):
+        if pd.isna(x):
+            return False
+        return bool(re.match(r'^\d+$', str(x)))
+
+    # Đếm số bản ghi lỗi trước khi làm sạch
+    invalid_count = lineup[~lineup[nat_col].apply(is_valid_id)].shape[0]
+    if invalid_count > 0:
+        logger.warning(f"Found {invalid_count} invalid National IDs (non-numeric) in lineup. Removing them.")
+
+    # Giữ lại chỉ các bản ghi có National ID hợp lệ
+    lineup = lineup[lineup[nat_col].apply(is_valid_id)]
+
+    # Loại bỏ trùng lặp
+    if lineup[nat_col].duplicated().any():
+        logger.warning(f"Found duplicates in {nat_col} in lineup. Keeping first occurrence.")
+        lineup = lineup.drop_duplicates(subset=[nat_col], keep='first')
+
+    return lineup
+
+
+def _old_normalize_emp_id_columns(df: pd.DataFrame, cols=None, dst_col: str = "Emp id") -> pd.DataFrame:
+    """
+    Chuẩn hóa và gộp dữ liệu Emp id dựa trên tối đa ba cột đầu vào
+    (mặc định: ["WD EE ID", "Emp ID", "Emp id"]).
+
+    - Giữ nguyên các cột gốc, chỉ cập nhật cột đích `dst_col`.
+    - Làm sạch giá trị (chỉ còn chữ số), bảo toàn leading zero.
+    - Quy tắc gộp: ưu tiên theo thứ tự cột trong `cols`; lấy giá trị
+      non-null đầu tiên sau khi làm sạch.
+    """
+    if cols is None:
+        cols = ["WD EE ID", "Emp ID", "Emp id", "Employee Id"]
+
+    # Tạo bản sao nhẹ các series đã làm sạch (không làm thay đổi cột gốc)
+    cleaned_series = []
+    for col in cols:
+        if col in df.columns:
+            cleaned_series.append(_old_normalize_id_series(df[col], expected_len=None))
+        else:
+            cleaned_series.append(pd.Series([pd.NA] * len(df), index=df.index, dtype="string"))
+
+    # Coalesce theo thứ tự ưu tiên
+    if cleaned_series:
+        coalesced = cleaned_series[0]
+        for s in cleaned_series[1:]:
+            coalesced = coalesced.fillna(s)
+        df[dst_col] = coalesced
+        logger.info(
+            f"Normalized '{dst_col}' from columns: " + ", ".join([c for c in cols if c in df.columns])
+        )
+    else:
+        # Không có cột nào để xử lý
+        if dst_col not in df.columns:
+            df[dst_col] = pd.Series([pd.NA] * len(df), index=df.index, dtype="string")
+        logger.warning("No ID columns found to normalize for Emp id.")
+
+    return df
+
+
+# ===================== DỮ LIỆU =====================
+
+# Chuỗi: leading zero, '.0' cuối, scientific, ký tự lạ, khoảng trắng, rỗng, chữ số Unicode
+STRINGS = ['0123', '000', ' 75203213222.0 ', '7.52032e+11', '1E5', 'e', 'AB-12 3', '12.50', '',
+           '  ', 'abc', '١٢٣', '123\n', '00042.0', '4.0.0']
+FLOATS = [75203213222.0, 7.52032e+11, 1.5, np.nan, 1e22, -3.0, 0.0, np.inf, 123.0, 1e16, 9007199254740993.0]
+
+SERIES = {
+    'object_str': pd.Series(STRINGS, dtype=object),
+    'object_mixed': pd.Series(STRINGS[:5] + [None, np.nan, 12345, 7.5e11, -8, True, 1.5, pd.NA], dtype=object),
+    'str': pd.Series(STRINGS + [None], dtype='str'),
+    'string': pd.Series(STRINGS + [None], dtype='string'),
+    'float64': pd.Series(FLOATS, dtype='float64'),
+    'int64': pd.Series([1, 0, -5, 123456789012, 42], dtype='int64'),
+    'Int64': pd.Series([1, None, 300, -7], dtype='Int64'),
+    'all_na_object': pd.Series([None, np.nan, pd.NA], dtype=object),
+    'all_na_float': pd.Series([np.nan, np.nan], dtype='float64'),
+    'all_na_str': pd.Series([None, None], dtype='str'),
+    'empty_object': pd.Series([], dtype=object),
+    'empty_float': pd.Series([], dtype='float64'),
+    'empty_str': pd.Series([], dtype='str'),
+}
+
+
+def _series(name):
+    # Index không liên tục để kiểm tra index được giữ nguyên
+    ser = SERIES[name].copy()
+    ser.index = ser.index * 3 + 7
+    ser.name = name
+    return ser
+
+
+# ===================== TEST =====================
+
+@pytest.mark.parametrize("expected_len", [None, 12])
+@pytest.mark.parametrize("name", list(SERIES))
+def test_normalize_id_series_matches_notebook(name, expected_len):
+    ser = _series(name)
+    expected = _old_normalize_id_series(ser.copy(), expected_len=expected_len)
+    result = normalize_id_series(ser.copy(), expected_len=expected_len)
+    pd.testing.assert_series_equal(result, expected, check_dtype=True)
+
+
+@pytest.mark.parametrize("cols", [None, ["Emp id", "Missing col"], []])
+def test_normalize_emp_id_columns_matches_notebook(cols):
+    n = 6
+    df = pd.DataFrame({
+        "WD EE ID": pd.Series([None, '0012', 7.5e11, None, 'x', None], dtype=object),
+        "Emp ID": pd.Series([1.0, np.nan, 3.0, np.nan, 5.5, np.nan], dtype='float64'),
+        "Emp id": pd.Series(['A-01', '', None, '00099.0', None, '7.1e+3'], dtype='str'),
+        "Employee Id": pd.Series([None, 2, None, 4, None, -6], dtype='Int64'),
+        "Other": range(n),
+    })
+    expected = _old_normalize_emp_id_columns(df.copy(), cols=cols)
+    result = normalize_emp_id_columns(df.copy(), cols=cols)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=True)
+
+
+# Không có 'empty_*': bản notebook lỗi KeyError với lineup rỗng (apply trên Series rỗng không ra mask bool)
+@pytest.mark.parametrize("name", ['object_str', 'object_mixed', 'str', 'string', 'float64', 'int64', 'Int64',
+                                  'all_na_object'])
+def test_clean_lineup_matches_notebook(name):
+    nat_col = "National ID (SSN/SIN) (National Identifiers)"
+    ids = _series(name)
+    # Thêm bản trùng để kiểm tra drop_duplicates(keep='first')
+    ids = pd.concat([ids, ids.iloc[:3]])
+    lineup = pd.DataFrame({nat_col: ids.to_numpy(), "row": range(len(ids))}, index=range(100, 100 + len(ids)))
+    lineup[nat_col] = lineup[nat_col].astype(ids.dtype)
+    expected = _old_clean_lineup(lineup.copy(), nat_col=nat_col)
+    result = clean_lineup(lineup.copy(), nat_col=nat_col)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=True)
@@ -0,0 +1,42 @@
+"""Peak RSS trong metrics là của từng run, không phải peak suốt đời process."""
+import json
+
+import numpy as np
+import pytest
+
+from logic import instrumentation
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(instrumentation._state, 'dir', str(tmp_path))
+    return tmp_path
+
+
+def _records(metrics_dir):
+    with open(metrics_dir / instrumentation.JSONL_FILE, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.skipif(instrumentation.current_rss_bytes() is None, reason="không đo được RSS trên máy này")
+def test_peak_rss_is_per_run(metrics_dir):
+    with instrumentation.run("big"):
+        with instrumentation.stage("alloc"):
+            block = np.ones(256 * 1024 * 1024 // 8)
+        del block
+    with instrumentation.run("small"):
+        with instrumentation.stage("noop"):
+            pass
+    big, small = _records(metrics_dir)
+    assert big['peak_rss_bytes'] - small['peak_rss_bytes'] > 128 * 1024 * 1024
+    assert small['peak_rss_children_bytes'] is None
+
+
+def test_capture_reports_peak_to_parent_run(metrics_dir):
+    with instrumentation.run("parent"):
+        # Giả lập kết quả capture() gửi về từ 2 process con
+        instrumentation.merge_stages({'stages': {'read_excel': {'rows': 3}}, 'peak_rss_bytes': 100})
+        instrumentation.merge_stages({'stages': {'read_excel': {'rows': 4}}, 'peak_rss_bytes': 300})
+    record, = _records(metrics_dir)
+    assert record['stages']['read_excel']['rows'] == 7
+    assert record['peak_rss_children_bytes'] == 300
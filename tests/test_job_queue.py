@@ -0,0 +1,60 @@
+"""Debounce file (SettleTracker) và hàng đợi job của hr_daemon (MergeJobQueue)."""
+import asyncio
+import time
+
+from logic.job_queue import EVENT, FULL, MergeJobQueue, SettleTracker
+
+SETTLE = 0.1
+
+
+def _write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_settle_tracker_waits_for_stat_to_settle(tmp_path):
+    tracker = SettleTracker(settle_seconds=SETTLE, max_batch_delay=30.0)
+    path = _write(tmp_path / "HR_a.xlsx", "a")
+    tracker.add(path, time.monotonic() - 10)
+    # Lần kiểm tra đầu chỉ ghi lại size/mtime
+    assert tracker.take() == ([], [])
+    assert 0 < tracker.wait_time() <= SETTLE
+
+    time.sleep(SETTLE * 1.5)
+    _write(tmp_path / "HR_a.xlsx", "ab")  # vẫn đang được ghi -> tính lại từ đầu
+    assert tracker.take() == ([], [])
+
+    time.sleep(SETTLE * 1.5)
+    batch, first_events = tracker.take()
+    assert batch == [path] and len(first_events) == 1
+    assert len(tracker) == 0 and tracker.wait_time() is None
+
+
+def test_settle_tracker_batches_and_drops_deleted_files(tmp_path):
+    tracker = SettleTracker(settle_seconds=SETTLE, max_batch_delay=30.0)
+    a, b, gone = (_write(tmp_path / name, name) for name in ("HR_b.xlsx", "HR_a.xlsx", "HR_gone.xlsx"))
+    for path in (a, b, gone):
+        tracker.add(path)
+    tracker.take()
+    (tmp_path / "HR_gone.xlsx").unlink()
+    time.sleep(SETTLE * 1.5)
+    batch, _ = tracker.take()
+    assert batch == sorted([a, b])
+
+
+def test_merge_job_queue_full_absorbs_pending_events(tmp_path):
+    async def scenario():
+        jobs = MergeJobQueue(settle_seconds=SETTLE, max_batch_delay=30.0)
+        path = _write(tmp_path / "HR_a.xlsx", "a")
+        jobs.add_event(path)
+        kind, paths, _ = await jobs.get(timeout=2.0)
+        assert (kind, paths) == (EVENT, [path])
+
+        jobs.add_event(path)
+        jobs.add_full("nightly")
+        jobs.add_full("manual")
+        assert await jobs.get(timeout=2.0) == (FULL, ["nightly", "manual"], [path])
+        assert len(jobs) == 0 and jobs.absorbed == 1
+        assert await jobs.get(timeout=0.05) is None
+
+    asyncio.run(scenario())
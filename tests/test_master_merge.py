@@ -0,0 +1,37 @@
+"""Quy tắc merge master dùng chung cho nhánh DataFrame và nhánh stream (logic.master_stream)."""
+import numpy as np
+import pandas as pd
+
+from logic.master_stream import merge_master_frame
+
+
+def test_merge_master_frame_replaces_in_place_and_keeps_blank_and_duplicate_rows():
+    # Dòng updates EID rỗng bị bỏ: nối vào thì mỗi lần merge lại nhân bản thêm 1 dòng
+    origin = pd.DataFrame({
+        'EID': ['A', np.nan, 'B', 'C', 'A', 'D', np.nan, 'D', 'E'],
+        'Name': ['a0', 'blank1', 'b0', 'c0', 'a-dup', 'd0', 'blank2', 'd-dup', 'e0'],
+        'Note': ['x'] * 9,
+    }, index=range(10, 19))
+    updates = pd.DataFrame({
+        'EID': ['C', 'A', 'F', np.nan, 'C'],
+        'Name': ['c-old', 'a1', 'f1', 'blank-new', 'c1'],
+    })
+    final, counts = merge_master_frame(origin, updates, deleted_keys={'E', 'F'})
+
+    assert final['EID'].fillna('<NA>').tolist() == ['A', '<NA>', 'B', 'C', 'D', '<NA>', 'D', 'F']
+    assert final['Name'].tolist() == ['a1', 'blank1', 'b0', 'c1', 'd0', 'blank2', 'd-dup', 'f1']
+    # Dòng thay lấy nguyên dòng updates: cột updates không có -> rỗng
+    assert final['Note'].isna().tolist() == [True, False, False, True, False, False, False, True]
+    assert list(final.index) == list(range(8))
+    assert counts == {'rows': 8, 'replaced': 2, 'appended': 1, 'deleted': 1, 'skipped': 1}
+
+    # Merge lại cùng updates lên kết quả -> không đổi
+    again, _ = merge_master_frame(final, updates, deleted_keys={'E', 'F'})
+    pd.testing.assert_frame_equal(again, final)
+
+
+def test_merge_master_frame_without_updates_keeps_master():
+    origin = pd.DataFrame({'EID': ['A', 'A', np.nan], 'Name': ['a', 'b', 'c']})
+    final, counts = merge_master_frame(origin, origin.iloc[:0], deleted_keys=set())
+    pd.testing.assert_frame_equal(final, origin)
+    assert counts == {'rows': 3, 'replaced': 0, 'appended': 0, 'deleted': 0, 'skipped': 0}
@@ -0,0 +1,137 @@
+"""MasterStore (SQLite) theo cùng quy tắc với merge_master_frame, và nhánh HR_MASTER_STORE ra cùng master xlsx."""
+import datetime
+import os
+import shutil
+import sys
+from decimal import Decimal
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import merge_hr_scheduled as scheduled
+from logic import write_preserving_formulas_and_styles
+from logic.master_store import MasterStore
+from logic.master_stream import merge_master_frame
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import generate_data  # noqa: E402
+
+
+def _eids(df):
+    return df['EID'].astype(object).where(df['EID'].notna(), None).tolist()
+
+
+def test_replace_keeps_blank_and_duplicate_eids(tmp_path):
+    origin = pd.DataFrame({'EID': ['A', None, 'B', None, 'A'], 'Name': ['a', 'blank1', 'b', 'blank2', 'a-dup']})
+    with MasterStore(str(tmp_path / "master.sqlite")) as store:
+        store.replace(origin)
+        assert len(store) == 5
+        assert store.frame()['Name'].tolist() == ['a', 'blank1', 'b', 'blank2', 'a-dup']
+        version = store.version
+        # Nạp lại cùng dữ liệu -> không dòng nào đổi
+        assert store.replace(origin) == 0
+        assert store.version == version
+
+
+def test_upsert_follows_merge_master_frame(tmp_path):
+    origin = pd.DataFrame({
+        'EID': ['A', np.nan, 'B', 'C', 'A', 'D', np.nan, 'D', 'E'],
+        'Name': ['a0', 'blank1', 'b0', 'c0', 'a-dup', 'd0', 'blank2', 'd-dup', 'e0'],
+    })
+    updates = pd.DataFrame({'EID': ['C', 'A', 'F', np.nan, 'C'], 'Name': ['c-old', 'a1', 'f1', 'blank-new', 'c1']})
+    expected, _ = merge_master_frame(origin, updates, deleted_keys={'E'})
+    with MasterStore(str(tmp_path / "master.sqlite")) as store:
+        store.replace(origin)
+        store.upsert(updates)
+        store.delete({'E'})
+        result = store.frame()
+    assert _eids(result) == _eids(expected)
+    assert result['Name'].tolist() == expected['Name'].tolist()
+
+
+def test_json_keeps_cell_types(tmp_path):
+    values = {
+        'EID': 'A',
+        'Time': datetime.time(8, 30, 15),
+        'Duration': datetime.timedelta(days=1, hours=2, microseconds=5),
+        'Amount': Decimal('12345678901234567890.125'),
+        'Day': datetime.date(2024, 2, 29),
+        'Stamp': pd.Timestamp('2024-02-29 13:45:00'),
+    }
+    with MasterStore(str(tmp_path / "master.sqlite")) as store:
+        store.upsert(pd.DataFrame([values], dtype=object))
+        row = store.frame().iloc[0]
+    for name, value in values.items():
+        # timedelta đọc lại thành cột timedelta64 -> pd.Timedelta (lớp con của timedelta)
+        assert row[name] == value
+        assert isinstance(row[name], type(value))
+
+
+def test_json_rejects_unknown_types(tmp_path):
+    with MasterStore(str(tmp_path / "master.sqlite")) as store:
+        with pytest.raises(TypeError):
+            store.upsert(pd.DataFrame({'EID': ['A'], 'Data': [object()]}))
+
+
+# ===================== nhánh xlsx vs nhánh store =====================
+
+def _add_blank_and_duplicate_rows(master_path):
+    # master_data.xlsx có EID trùng và dòng không có EID (giống file sửa tay)
+    wb = openpyxl.load_workbook(master_path)
+    ws = wb.active
+    header_row = generate_data.SKIP_MASTER + 1
+    eid_col = [c.value for c in ws[header_row]].index('EID') + 1
+    first = ws.cell(row=header_row + 1, column=eid_col).value
+    ws.cell(row=header_row + 10, column=eid_col, value=first)
+    # ws.cell(..., value=None) không ghi đè ô -> gán .value
+    ws.cell(row=header_row + 20, column=eid_col).value = None
+    ws.cell(row=header_row + 21, column=eid_col).value = None
+    wb.save(master_path)
+
+
+def _run_merge(monkeypatch, run_dir, store_file):
+    monkeypatch.chdir(run_dir)
+    monkeypatch.setattr(scheduled, "MASTER_STORE_FILE", store_file)
+    assert scheduled.merge_hr_files(max_workers=1)
+
+
+def _master(run_dir):
+    df = pd.read_excel(os.path.join(run_dir, "master_data.xlsx"), skiprows=generate_data.SKIP_MASTER)
+    return df.astype(object).where(df.notna(), None)
+
+
+def test_store_and_xlsx_paths_write_same_master(tmp_path, monkeypatch):
+    base = tmp_path / "base"
+    generate_data.generate(str(base), "tiny", 7)
+    _add_blank_and_duplicate_rows(str(base / "master_data.xlsx"))
+    dirs = {'xlsx': tmp_path / "xlsx", 'store': tmp_path / "store"}
+    for run_dir in dirs.values():
+        shutil.copytree(base, run_dir)
+    store_files = {'xlsx': None, 'store': os.path.join("update", "master.sqlite")}
+    hr_files = sorted(os.listdir(base / "hr_files"))
+
+    def run_and_compare():
+        for name, run_dir in dirs.items():
+            _run_merge(monkeypatch, run_dir, store_files[name])
+        xlsx, store = _master(dirs['xlsx']), _master(dirs['store'])
+        pd.testing.assert_frame_equal(store, xlsx)
+        return xlsx
+
+    first = run_and_compare()
+    assert sum(e is None for e in first['EID']) == 2
+    # Sửa 1 file HR (đổi 1 ô, bỏ 1 dòng) rồi xóa 1 file HR khác
+    edited = pd.read_excel(base / "hr_files" / hr_files[0], skiprows=generate_data.SKIP_MASTER)
+    edited.loc[0, 'PROJECT'] = 'Changed'
+    edited = edited.iloc[:-1].astype(object)
+    for run_dir in dirs.values():
+        write_preserving_formulas_and_styles(str(run_dir / "master_data.xlsx"),
+                                             str(run_dir / "hr_files" / hr_files[0]), edited,
+                                             generate_data.SHEET_MASTER, generate_data.SKIP_MASTER,
+                                             generate_data.keep_format_columns)
+    run_and_compare()
+    for run_dir in dirs.values():
+        os.remove(run_dir / "hr_files" / hr_files[1])
+    last = run_and_compare()
+    assert len(last) < len(first)
@@ -0,0 +1,99 @@
+"""commit_output: render ngoài lock, kiểm tra generation và os.replace trong lock, không để lại file tạm."""
+import os
+
+import pytest
+
+from logic import output_commit
+from logic.output_commit import UNCHECKED, StaleOutputError, commit_output, generation, lock_path
+
+
+def _leftovers(directory, target):
+    # File tạm .<stem>.<pid>-<uuid>.tmp<ext> cùng thư mục với đích
+    stem = os.path.splitext(os.path.basename(target))[0]
+    return [name for name in os.listdir(directory) if name.startswith(f".{stem}.") and ".tmp" in name]
+
+
+def _render(text):
+    def render(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return render
+
+
+def test_commit_replaces_target_when_generation_matches(tmp_path):
+    target = str(tmp_path / "master.xlsx")
+    assert commit_output(target, _render("v1"), expected=None) == generation(target)
+    base = generation(target)
+    new = commit_output(target, _render("version 2"), expected=base)
+    assert new == generation(target) and new != base
+    assert open(target, encoding='utf-8').read() == "version 2"
+    assert _leftovers(tmp_path, target) == []
+
+
+def test_stale_target_is_not_overwritten(tmp_path):
+    target = str(tmp_path / "master.xlsx")
+    commit_output(target, _render("v1"))
+    base = generation(target)
+
+    def render(tmp_path_):
+        _render("mine")(tmp_path_)
+        # Process khác ghi đích trong lúc đang render
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write("theirs, longer")
+
+    with pytest.raises(StaleOutputError) as exc:
+        commit_output(target, render, expected=base)
+    assert exc.value.path == target
+    assert tuple(exc.value.expected) == base
+    assert exc.value.actual == generation(target)
+    assert open(target, encoding='utf-8').read() == "theirs, longer"
+    assert _leftovers(tmp_path, target) == []
+
+
+def test_expected_missing_target_but_created_meanwhile(tmp_path):
+    target = str(tmp_path / "new.xlsx")
+
+    def render(tmp_path_):
+        _render("mine")(tmp_path_)
+        _render("theirs")(target)
+
+    with pytest.raises(StaleOutputError):
+        commit_output(target, render, expected=None)
+    assert open(target, encoding='utf-8').read() == "theirs"
+    assert _leftovers(tmp_path, target) == []
+
+
+def test_render_error_cleans_temp_file(tmp_path):
+    target = str(tmp_path / "master.xlsx")
+    commit_output(target, _render("v1"))
+
+    def render(tmp_path_):
+        _render("partial")(tmp_path_)
+        raise RuntimeError("render failed")
+
+    with pytest.raises(RuntimeError):
+        commit_output(target, render, expected=UNCHECKED)
+    assert open(target, encoding='utf-8').read() == "v1"
+    assert _leftovers(tmp_path, target) == []
+
+
+def test_replace_failure_cleans_temp_file(tmp_path, monkeypatch):
+    target = str(tmp_path / "master.xlsx")
+    commit_output(target, _render("v1"))
+    monkeypatch.setattr(output_commit, "REPLACE_RETRIES", 2)
+    monkeypatch.setattr(output_commit.time, "sleep", lambda _: None)
+    calls = []
+
+    def locked_replace(src, dst):
+        # Windows: đích đang mở trong Excel
+        calls.append(src)
+        raise PermissionError(dst)
+
+    monkeypatch.setattr(output_commit.os, "replace", locked_replace)
+    with pytest.raises(PermissionError):
+        commit_output(target, _render("v2"))
+    assert len(calls) == 2
+    monkeypatch.undo()
+    assert open(target, encoding='utf-8').read() == "v1"
+    assert _leftovers(tmp_path, target) == []
+    assert os.path.exists(lock_path(target))
@@ -0,0 +1,154 @@
+"""engine="xml" ghi ra cùng workbook với engine="openpyxl": giá trị, công thức, number format và style."""
+import datetime
+from decimal import Decimal
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.xml.functions import tostring
+
+from logic import parse_template, write_preserving_formulas_and_styles
+from logic.xml_writer import StyleTable
+
+SHEET = "Masterdata"
+SKIP_ROWS = 2
+HEADERS = ["EID", "Amount", "Count", "Rate", "Stamp", "Day", "Clock", "Duration", "Note", "Active", "Total", "Label"]
+FORMULAS = {"Total": "=B4*C4", "Label": '=IF(A4="","",A4&"-"&C4)'}
+
+
+def _make_template(path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = SHEET
+    thin = Side(style="thin", color="FF000000")
+    ws.cell(row=1, column=1, value="Báo cáo nhân sự").font = Font(bold=True, size=14, color="FF1F4E78")
+    ws.cell(row=1, column=2).fill = PatternFill("solid", fgColor="FFFFFF00")
+    # Ô ngày có style sẵn ở pre-header -> numFmt ngày phải giữ font/border của ô
+    stamp = ws.cell(row=2, column=1, value=datetime.datetime(2024, 2, 29, 8, 30))
+    stamp.font = Font(italic=True)
+    stamp.border = Border(bottom=thin)
+    day = ws.cell(row=2, column=2, value=datetime.date(2024, 3, 1))
+    day.fill = PatternFill("solid", fgColor="FFDDEBF7")
+    ws.cell(row=2, column=3, value=datetime.time(17, 45))
+    for col, header in enumerate(HEADERS, 1):
+        cell = ws.cell(row=SKIP_ROWS + 1, column=col, value=header)
+        cell.font = Font(bold=True, color="FFFFFFFF")
+        cell.fill = PatternFill("solid", fgColor="FF4472C4")
+        cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        cell.alignment = Alignment(horizontal="center", wrap_text=True)
+    for header, formula in FORMULAS.items():
+        ws.cell(row=SKIP_ROWS + 2, column=HEADERS.index(header) + 1, value=formula)
+    wb.save(path)
+
+
+def _frame():
+    return pd.DataFrame({
+        "EID": ["E001", "E002", None, " E004 "],
+        "Amount": [Decimal("1234.5"), Decimal("0.125"), None, Decimal("-7")],
+        "Count": [1, 2, 3, 4],
+        "Rate": [0.1 + 0.2, np.nan, 1e-7, 3.0],
+        "Stamp": [datetime.datetime(2024, 1, 2, 3, 4, 5), pd.NaT, datetime.datetime(1999, 12, 31), pd.NaT],
+        "Day": [datetime.date(2024, 2, 29), None, datetime.date(1970, 1, 1), None],
+        "Clock": [datetime.time(8, 30, 15), None, datetime.time(23, 59, 59), datetime.time(0, 0)],
+        "Duration": [datetime.timedelta(days=1, hours=2), None, datetime.timedelta(minutes=90), None],
+        "Note": ["a & b <c>", "", None, "=not a formula?"],
+        "Active": [True, False, None, True],
+    }, dtype=object)
+
+
+@pytest.fixture
+def written(tmp_path):
+    template = str(tmp_path / "template.xlsx")
+    _make_template(template)
+    df = _frame()
+    books = {}
+    for engine in ("openpyxl", "xml"):
+        out = str(tmp_path / f"{engine}.xlsx")
+        write_preserving_formulas_and_styles(template, out, df, SHEET, SKIP_ROWS, tuple(FORMULAS), engine=engine)
+        books[engine] = openpyxl.load_workbook(out)
+    yield books
+    for wb in books.values():
+        wb.close()
+
+
+def _style(obj):
+    # StyleProxy không so sánh == được với nhau -> so XML
+    tree = obj.to_tree()
+    return tostring(tree) if tree is not None else b""
+
+
+def test_xml_engine_matches_openpyxl(written):
+    expected, actual = written["openpyxl"][SHEET], written["xml"][SHEET]
+    assert (actual.max_row, actual.max_column) == (expected.max_row, expected.max_column)
+    for row in range(1, expected.max_row + 1):
+        for col in range(1, expected.max_column + 1):
+            want, got = expected.cell(row=row, column=col), actual.cell(row=row, column=col)
+            where = want.coordinate
+            assert got.value == want.value, where
+            assert type(got.value) is type(want.value), where
+            assert got.number_format == want.number_format, where
+            for attr in ("font", "fill", "border", "alignment"):
+                assert _style(getattr(got, attr)) == _style(getattr(want, attr)), (where, attr)
+
+
+def test_shared_formulas_expand_to_translated_formulas(written):
+    ws = written["xml"][SHEET]
+    first = SKIP_ROWS + 2
+    total = HEADERS.index("Total") + 1
+    label = HEADERS.index("Label") + 1
+    for offset in range(len(_frame())):
+        row = first + offset
+        assert ws.cell(row=row, column=total).value == f"=B{row}*C{row}"
+        assert ws.cell(row=row, column=label).value == f'=IF(A{row}="","",A{row}&"-"&C{row})'
+
+
+def test_styled_date_cells_keep_style_and_number_format(written):
+    ws = written["xml"][SHEET]
+    stamp, day, clock = ws["A2"], ws["B2"], ws["C2"]
+    assert stamp.value == datetime.datetime(2024, 2, 29, 8, 30)
+    assert stamp.number_format == "yyyy-mm-dd h:mm:ss"
+    assert stamp.font.i and stamp.border.bottom.style == "thin"
+    # openpyxl lưu ô date của template thành datetime -> đọc lại cũng là datetime
+    assert day.value == datetime.datetime(2024, 3, 1)
+    assert day.number_format == "yyyy-mm-dd h:mm:ss"
+    assert day.fill.fgColor.rgb == "FFDDEBF7"
+    assert clock.value == datetime.time(17, 45)
+    assert clock.number_format == "h:mm:ss"
+
+
+def test_style_table_dedupes_styles(tmp_path):
+    template = str(tmp_path / "template.xlsx")
+    _make_template(template)
+    tpl = parse_template(template, SHEET, SKIP_ROWS, tuple(FORMULAS))
+    styles = StyleTable()
+    ids = [styles.add(s['font'], s['fill'], s['border'], s['alignment']) for s in tpl['header_styles']]
+    # Mọi ô header cùng style -> 1 xf, không phải mỗi ô 1 xf
+    assert len(set(ids)) == 1 and ids[0] != 0
+    assert len(styles.xfs) == 2
+    dated = styles.with_number_format(ids[0], 165)
+    assert styles.with_number_format(ids[0], 165) == dated
+    assert styles.xfs[dated][1:] == styles.xfs[ids[0]][1:]
+
+
+def test_empty_string_and_nat_are_blank_cells(written):
+    ws = written["xml"][SHEET]
+    row = SKIP_ROWS + 3
+    note, stamp = ws.cell(row=row, column=HEADERS.index("Note") + 1), ws.cell(row=row, column=HEADERS.index("Stamp") + 1)
+    assert note.value is None
+    assert stamp.value is None and stamp.number_format == "yyyy-mm-dd h:mm:ss"
+
+
+def test_numpy_bool_is_written_as_bool(tmp_path):
+    # Khác biệt có chủ đích: openpyxl ghi np.bool_ thành số 1/0, engine="xml" ghi TRUE/FALSE như bool
+    template = str(tmp_path / "template.xlsx")
+    _make_template(template)
+    out = str(tmp_path / "xml.xlsx")
+    df = pd.DataFrame({"EID": ["E001", "E002"], "Active": np.array([True, False])})
+    write_preserving_formulas_and_styles(template, out, df, SHEET, SKIP_ROWS, tuple(FORMULAS), engine="xml")
+    wb = openpyxl.load_workbook(out)
+    ws = wb[SHEET]
+    column = HEADERS.index("Active") + 1
+    assert [ws.cell(row=SKIP_ROWS + 2 + i, column=column).value for i in range(2)] == [True, False]
+    wb.close()